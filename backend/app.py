@@ -3,21 +3,35 @@ from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from flask_mail import Mail, Message
 from werkzeug.security import generate_password_hash, check_password_hash
-import pandas as pd
 import numpy as np
-import joblib
 import os
 import secrets
 from datetime import datetime, timedelta, timezone
 import re
-from pymongo import MongoClient, errors
+from pymongo import MongoClient, UpdateOne, errors
 from bson import ObjectId
 import certifi
 from dotenv import load_dotenv
 import threading
 import time
 from collections import defaultdict
+from functools import wraps
+from backtest import DEFAULT_HISTORY_PATH, BacktestInputError, backtest_cache
+from baseline import BaselineEngine
+from drift_monitor import DriftMonitor
 from email_service import email_service
+from forecast_cache import explanation_cache, forecast_cache, input_fingerprint
+from forecast_dispatcher import forecast_dispatcher
+from forecast_rollup import ROLLUP_LEVELS, forecast_rollup
+from inference_pool import InferenceUnavailable, inference_pool
+from feature_schema import FeatureValidationError
+from model_registry import ModelRegistry
+from preload import PRELOAD_SHARED, freeze_for_fork, load_columnar_dataset, process_memory
+from readiness import requires_ready, startup_state
+from simulation import (DEFAULT_DRAWS, DEFAULT_QUANTILES, FORECAST_SIMULATION_MAX_DRAWS,
+                        FORECAST_SIMULATION_MAX_SCENARIOS, SimulationInputError, parse_uncertainty, simulate)
+from reforecast import FORECAST_REFORECAST_ON_SWAP, PortfolioReforecastJob
+from training.refresh import ModelRefreshJob
 
 load_dotenv()  # load environment variables from .env if present
 app = Flask(__name__)
@@ -123,23 +137,30 @@ def init_db():
     mongo_uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017/PLANGRID_DATA')
     db_name = os.getenv('MONGO_DB', 'material_forecast')
 
+    def connect(**options):
+        client = MongoClient(mongo_uri, **options)
+        # Test connection
+        client.admin.command('ping')
+        if PRELOAD_SHARED:
+            # A preloading gunicorn master must not fork with open sockets or monitor
+            # threads; each worker connects on first use with the options that worked
+            client.close()
+            client = MongoClient(mongo_uri, connect=False, **options)
+        return client
+
     # MongoDB connection with multiple fallback options
     try:
         # Try with TLS and CA bundle first
         ca = certifi.where()
-        client = MongoClient(mongo_uri, tls=True, tlsCAFile=ca, tlsAllowInvalidCertificates=True)
-        # Test connection
-        client.admin.command('ping')
+        client = connect(tls=True, tlsCAFile=ca, tlsAllowInvalidCertificates=True)
     except Exception as e1:
         try:
             # Fallback: TLS without CA verification
-            client = MongoClient(mongo_uri, tls=True, tlsAllowInvalidCertificates=True)
-            client.admin.command('ping')
+            client = connect(tls=True, tlsAllowInvalidCertificates=True)
         except Exception as e2:
             try:
                 # Last resort: no TLS (for local development)
-                client = MongoClient(mongo_uri)
-                client.admin.command('ping')
+                client = connect()
             except Exception as e3:
                 print(f"MongoDB connection failed. Errors: {e1}, {e2}, {e3}")
                 raise e3
@@ -158,6 +179,10 @@ def init_db():
     notifications_collection = db['notifications']
     # password reset collection removed
 
+    return client, db, users_collection, projects_collection, forecasts_collection, inventory_collection, orders_collection, material_actuals_collection, project_forecasts_collection, password_reset_tokens_collection, teams_collection, team_invitations_collection, notifications_collection
+
+# Index creation is ~20 round trips, so it runs as a background startup component
+def create_indexes():
     # Ensure unique indexes for username and email
     try:
         users_collection.create_index('username', unique=True)
@@ -184,28 +209,42 @@ def init_db():
         team_invitations_collection.create_index('created_at', expireAfterSeconds=604800)  # Auto-expire after 7 days
         notifications_collection.create_index('user_id')
         notifications_collection.create_index('created_at')
-        pass
     except errors.PyMongoError as e:
         print(f"Error creating indexes: {e}")
-
-    return client, db, users_collection, projects_collection, forecasts_collection, inventory_collection, orders_collection, material_actuals_collection, project_forecasts_collection, password_reset_tokens_collection, teams_collection, team_invitations_collection, notifications_collection
+        raise
 
 # Load models and encoders
+model_registry = ModelRegistry(reference_csv='../powergrid_realistic_material_dataset1.csv')
+
+# Predictions cached for a previous model version are no longer valid
+model_registry.on_swap(lambda new_bundle, old_bundle: (forecast_cache.clear(), explanation_cache.clear()))
+
+# Live input histograms compared against the training CSV, rebuilt for every model version
+drift_monitor = DriftMonitor(model_registry.reference_csv)
+model_registry.on_swap(lambda new_bundle, old_bundle: drift_monitor.load_reference(new_bundle))
+
+# Rollup groups are keyed by class label, looked up in the active model's encoding tables
+model_registry.on_swap(lambda new_bundle, old_bundle: forecast_rollup.set_schema(new_bundle.schema))
+
+# A version activated by hand after a failed startup load brings the model routes back
+model_registry.on_swap(lambda new_bundle, old_bundle: startup_state.recover('model'))
+
 def load_models():
+    """Load the active registry version (or the legacy root artifacts) and swap it in"""
     try:
-        model = joblib.load('../multi_xgb_model.joblib')
-        feature_cols = joblib.load('../feature_cols1.joblib')
-        target_cols = joblib.load('../target_cols1.joblib')
-        label_encoders = joblib.load('../label_encoders.joblib')
-        return model, feature_cols, target_cols, label_encoders
+        return model_registry.load_active()
     except Exception as e:
         print(f"Error loading models: {e}")
-        return None, None, None, None
+        return None
 
-# Load data
+def active_target_cols():
+    bundle = model_registry.active
+    return bundle.target_cols if bundle else None
+
+# Load data (columnar and read-only after load, so preloaded workers share it copy-on-write)
 def load_data():
     try:
-        df = pd.read_csv('../powergrid_realistic_material_dataset1.csv')
+        df = load_columnar_dataset('../powergrid_realistic_material_dataset1.csv')
         return df
     except Exception as e:
         print(f"Error loading data: {e}")
@@ -213,8 +252,96 @@ def load_data():
 
 # Initialize
 client, db, users_collection, projects_collection, forecasts_collection, inventory_collection, orders_collection, material_actuals_collection, project_forecasts_collection, password_reset_tokens_collection, teams_collection, team_invitations_collection, notifications_collection = init_db()
-model, feature_cols, target_cols, label_encoders = load_models()
-df = load_data()
+reforecast_jobs_collection = db['reforecast_jobs']
+df = None
+
+# Continues boosting from recorded actuals and publishes a new version (MODEL_REFRESH_INTERVAL_SECONDS)
+model_refresh_job = ModelRefreshJob(model_registry, project_forecasts_collection, material_actuals_collection)
+
+# Seasonal baseline over recorded actuals, refitted for all projects at once when actuals change
+baseline_engine = BaselineEngine(project_forecasts_collection, material_actuals_collection)
+
+def baseline_target_cols():
+    """Targets of the active model, or of the dataset while no model is loaded (baseline as fallback)"""
+    target_cols = active_target_cols()
+    if not target_cols and df is not None:
+        target_cols = [col for col in df.columns if col.startswith('quantity_')]
+    return target_cols
+
+def baseline_for_months(project_id, months):
+    """{forecast_month: baseline predictions or None}; empty if the baseline cannot be fitted"""
+    target_cols = baseline_target_cols()
+    if not target_cols:
+        return {}
+    try:
+        fit = baseline_engine.current(target_cols)
+    except Exception as e:
+        print(f"Baseline fit failed: {e}")
+        return {}
+    return {month: fit.predictions(project_id, month) if month else None for month in months}
+
+# Re-predicts every stored forecast month with the new model after a swap (progress in reforecast_jobs)
+reforecast_job = PortfolioReforecastJob(
+    model_registry, project_forecasts_collection, reforecast_jobs_collection,
+    on_write=lambda rows: [forecast_rollup.record(project_id, month, features=features, predictions=predictions,
+                                                  keep_actuals=True)
+                           for project_id, month, features, predictions in rows]
+)
+if FORECAST_REFORECAST_ON_SWAP:
+    model_registry.on_swap(lambda new_bundle, old_bundle: old_bundle is not None and reforecast_job.trigger(new_bundle, queue=True))
+
+def start_model_serving():
+    # Already loaded when the gunicorn master preloaded it (PRELOAD_SHARED)
+    if model_registry.active is None and load_models() is None:
+        raise RuntimeError('Model artifacts could not be loaded')
+    model_registry.start_watcher()
+    model_refresh_job.start()
+    # Pick up a re-forecast a previous process left unfinished
+    reforecast_job.resume()
+
+def start_forecast_rollup():
+    # Group labels are canonicalised through the model's encoding tables
+    startup_state.wait('model')
+    if model_registry.active is not None:
+        forecast_rollup.set_schema(model_registry.active.schema)
+    count = forecast_rollup.rebuild(project_forecasts_collection, material_actuals_collection)
+    print(f"Forecast rollup built from {count} month entries")
+    forecast_rollup.start_resync(project_forecasts_collection, material_actuals_collection)
+
+def load_dataset():
+    global df
+    if df is None:
+        df = load_data()
+    if df is None:
+        raise RuntimeError('Dataset could not be loaded')
+
+def preload_shared_state():
+    """Load the model and dataset in the gunicorn master so forked workers share them"""
+    global df
+    start = time.perf_counter()
+    if load_models() is None:
+        print("Preload: model artifacts could not be loaded; workers will retry")
+    df = load_data()
+    freeze_for_fork()
+    print(f"Preloaded model and dataset in {time.perf_counter() - start:.2f}s before fork")
+
+def start_worker_services():
+    """Per-process startup: Mongo indexes, background threads and readiness components.
+
+    Heavy resources load in the background (BACKGROUND_STARTUP=false loads them inline);
+    model/dataset routes answer 503 + Retry-After until their component is ready.
+    With PRELOAD_SHARED the model and dataset are already in memory and this runs
+    from gunicorn's post_fork hook instead of at import.
+    """
+    startup_state.start('db_indexes', create_indexes)
+    startup_state.start('model', start_model_serving)
+    startup_state.start('dataset', load_dataset)
+    startup_state.start('rollup', start_forecast_rollup)
+
+if PRELOAD_SHARED:
+    preload_shared_state()
+else:
+    start_worker_services()
 
 # Helpers
 def sum_numeric_values(obj):
@@ -229,6 +356,19 @@ def sum_numeric_values(obj):
                 continue
         return total
 
+def admin_required(fn):
+    """403 unless the JWT user's role is 'admin'; goes below @jwt_required()"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            user = users_collection.find_one({'username': get_jwt_identity()}, {'_id': 0, 'role': 1})
+        except errors.PyMongoError as e:
+            return jsonify({'error': f'Database error: {str(e)}'}), 500
+        if not user or user.get('role') != 'admin':
+            return jsonify({'error': 'Permission denied: admin role required'}), 403
+        return fn(*args, **kwargs)
+    return wrapper
+
 
 # Authentication routes
 @app.route('/api/me', methods=['GET'])
@@ -585,6 +725,7 @@ def analytics_overview():
         
         # Material totals (placeholder - would need actual material data)
         material_totals = {}
+        target_cols = active_target_cols()
         if target_cols:
             for col in target_cols:
                 material_totals[col] = 0.0  # Would need actual material consumption data
@@ -602,12 +743,13 @@ def analytics_overview():
 
 @app.route('/api/analytics/materials', methods=['GET'])
 @jwt_required()
+@requires_ready('dataset', 'model')
 def materials_analytics():
-    if df is None:
+    target_cols = active_target_cols()
+    if df is None or not target_cols:
         return jsonify({'error': 'Data not available'}), 500
     
-    # Material consumption trends
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    # Material consumption trends (timestamp is parsed once at load; df is never modified)
     monthly_materials = df.groupby(df['timestamp'].dt.to_period('M'))[target_cols].sum()
     
     # Convert to JSON serializable format
@@ -620,14 +762,55 @@ def materials_analytics():
     
     return jsonify(trends)
 
+@app.route('/api/analytics/rollup', methods=['GET'])
+@jwt_required()
+@requires_ready('rollup')
+def forecast_rollup_analytics():
+    """Forecast and actual totals per month and target for one level of the
+    national -> project_location -> tower_type x substation_type hierarchy.
+
+    Query params: level (national | project_location | tower_type | substation_type | cell),
+    group (one label; 'location,tower,substation' for cell), months (comma-separated)
+    or month_from / month_to (YYYY-MM, inclusive), targets (comma-separated).
+    """
+    level = request.args.get('level', 'national')
+    if level not in ROLLUP_LEVELS:
+        return jsonify({'error': f'level must be one of {list(ROLLUP_LEVELS)}'}), 400
+    group = request.args.get('group')
+    if group is not None and level == 'cell':
+        group = [part.strip() for part in group.split(',')]
+    elif group is not None and level == 'national':
+        return jsonify({'error': 'national level has no groups'}), 400
+
+    def csv_arg(name):
+        value = request.args.get(name)
+        return [part.strip() for part in value.split(',') if part.strip()] if value else None
+
+    months = csv_arg('months')
+    month_from, month_to = request.args.get('month_from'), request.args.get('month_to')
+    for value in (month_from, month_to):
+        if value and not FORECAST_MONTH_RE.match(value):
+            return jsonify({'error': 'month_from / month_to must be YYYY-MM'}), 400
+    rollup = forecast_rollup.query(level, group, months, csv_arg('targets'))
+    if month_from or month_to:
+        keep = [i for i, m in enumerate(rollup['months'])
+                if (not month_from or m >= month_from) and (not month_to or m <= month_to)]
+        rollup['months'] = [rollup['months'][i] for i in keep]
+        for g in rollup['groups']:
+            for measure in ('forecast', 'actual', 'entries'):
+                g[measure] = [g[measure][i] for i in keep]
+    return jsonify({**rollup, 'stats': forecast_rollup.stats()})
+
 @app.route('/api/analytics/projects', methods=['GET'])
 @jwt_required()
+@requires_ready('dataset', 'model')
 def projects_analytics():
-    if df is None:
+    target_cols = active_target_cols()
+    if df is None or not target_cols:
         return jsonify({'error': 'Data not available'}), 500
     
     # Project details
-    project_details = df.groupby('project_id').agg({
+    project_details = df.groupby('project_id', observed=True).agg({
         'budget': 'first',
         'project_location': 'first',
         'tower_type': 'first',
@@ -637,7 +820,7 @@ def projects_analytics():
     }).reset_index()
     
     # Add material totals per project
-    material_totals = df.groupby('project_id')[target_cols].sum().reset_index()
+    material_totals = df.groupby('project_id', observed=True)[target_cols].sum().reset_index()
     project_details = project_details.merge(material_totals, on='project_id')
     
     return jsonify(project_details.to_dict('records'))
@@ -666,151 +849,924 @@ def dispatch_data():
     except Exception as e:
         return jsonify({'error': f'Failed to build dispatch data: {str(e)}'}), 500
 
+# Forecast helpers shared by the single and batch forecast routes
+FORECAST_MONTH_RE = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+FORECAST_BATCH_MAX_ROWS = int(os.getenv('FORECAST_BATCH_MAX_ROWS', '1000'))
+FORECAST_MAX_HORIZON = int(os.getenv('FORECAST_MAX_HORIZON', '36'))
+FORECAST_SWEEP_MAX_FEATURES = 2
+FORECAST_SWEEP_MAX_POINTS = int(os.getenv('FORECAST_SWEEP_MAX_POINTS', '2500'))
+
+def add_months(month, count):
+    """Shift a YYYY-MM string by count months"""
+    year, mon = int(month[:4]), int(month[5:7])
+    index = year * 12 + (mon - 1) + count
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+def project_id_error(project_id):
+    """Error message for a project_id that cannot key stored forecasts, else None"""
+    if not project_id:
+        return 'project_id is required'
+    if not isinstance(project_id, (str, int)) or isinstance(project_id, bool):
+        # Ids key the stored-forecast lookup and the per-project write, so they must be hashable scalars
+        return 'project_id must be a string or an integer'
+    return None
+
+def resolve_forecast_months(data, default_month):
+    """Months requested by a forecast payload.
+
+    Accepts an explicit forecast_months list, or forecast_month plus either
+    horizon (number of months) or forecast_month_end (inclusive). Without
+    any of those it is the single forecast_month, as before.
+    Returns (months, error_message).
+    """
+    start = data.get('forecast_month', default_month)
+    if 'forecast_months' in data:
+        months = data['forecast_months']
+        if not isinstance(months, list) or not months:
+            return None, 'forecast_months must be a non-empty array'
+    elif 'horizon' in data or 'forecast_month_end' in data:
+        if not isinstance(start, str) or not FORECAST_MONTH_RE.match(start):
+            return None, 'forecast_month must be YYYY-MM'
+        if 'horizon' in data:
+            try:
+                horizon = int(data['horizon'])
+            except (ValueError, TypeError):
+                return None, 'horizon must be an integer'
+        else:
+            end = data['forecast_month_end']
+            if not isinstance(end, str) or not FORECAST_MONTH_RE.match(end):
+                return None, 'forecast_month_end must be YYYY-MM'
+            horizon = (int(end[:4]) * 12 + int(end[5:7])) - (int(start[:4]) * 12 + int(start[5:7])) + 1
+        if horizon < 1:
+            return None, 'forecast horizon must cover at least one month'
+        months = [add_months(start, i) for i in range(horizon)]
+    else:
+        return [start], None
+    
+    if len(months) > FORECAST_MAX_HORIZON:
+        return None, f'Too many months: {len(months)} (max {FORECAST_MAX_HORIZON})'
+    for month in months:
+        if not isinstance(month, str) or not FORECAST_MONTH_RE.match(month):
+            return None, f'Invalid forecast month: {month!r} (expected YYYY-MM)'
+    return list(dict.fromkeys(months)), None
+
+def invalid_input_response(error, message='Invalid forecast input'):
+    """400 listing every field that failed schema validation"""
+    return jsonify({'error': message, 'details': error.errors}), 400
+
+def predict_forecast_rows(bundle, X):
+    """Predict an encoded float32 matrix, serving repeated rows from the forecast cache.
+
+    Only cache misses reach the inference engine, and they go as one matrix
+    through the micro-batching dispatcher (shared with concurrent requests).
+    Returns one {target_col: value} dict per row.
+    """
+    keys = [forecast_cache.make_key(bundle.version, row) for row in X]
+    results = [None] * len(keys)
+    misses = {}  # key -> row indices sharing that key, so duplicates are predicted once
+    for i, key in enumerate(keys):
+        if key in misses:
+            misses[key].append(i)
+            continue
+        results[i] = forecast_cache.get(key)
+        if results[i] is None:
+            misses[key] = [i]
+    
+    if misses:
+        predictions = forecast_dispatcher.predict(bundle.inference_engine, X[[rows[0] for rows in misses.values()]])
+        for row_pos, (key, rows) in enumerate(misses.items()):
+            row_results = {col: float(predictions[row_pos][j]) for j, col in enumerate(bundle.target_cols)}
+            forecast_cache.put(key, row_results)
+            for i in rows:
+                results[i] = dict(row_results)
+    
+    return results
+
+EXPLAIN_METHODS = ('exact', 'approx')
+
+def explain_forecast_rows(bundle, X, method='exact'):
+    """Per-target feature contributions for an encoded matrix, one dict per row.
+
+    Cached like predictions (model version + method + encoded row); all misses
+    are explained together in one contribution pass.
+    """
+    keys = [explanation_cache.make_key(f'{bundle.version}:{method}', row) for row in X]
+    results = [None] * len(keys)
+    misses = {}
+    for i, key in enumerate(keys):
+        if key in misses:
+            misses[key].append(i)
+            continue
+        results[i] = explanation_cache.get(key)
+        if results[i] is None:
+            misses[key] = [i]
+    
+    if misses:
+        explanations = bundle.explainer.explain_rows(X[[rows[0] for rows in misses.values()]], bundle.target_cols,
+                                                     approximate=(method == 'approx'))
+        for (key, rows), explanation in zip(misses.items(), explanations):
+            explanation_cache.put(key, explanation)
+            for i in rows:
+                results[i] = explanation
+    
+    return results
+
+def resolve_sweep_values(bundle, feature, spec):
+    """Grid values for one swept feature: a list, or {"start", "stop", "steps"} for numeric features.
+
+    Returns (display_values, encoded_values); raises ValueError or FeatureValidationError.
+    """
+    schema = bundle.schema
+    if feature not in schema:
+        raise ValueError(f'Unknown feature: {feature}')
+    if isinstance(spec, dict):
+        if schema.spec(feature).categorical:
+            raise ValueError(f'{feature} is categorical; give its values as a list')
+        try:
+            start, stop, steps = float(spec['start']), float(spec['stop']), int(spec.get('steps', 10))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'{feature} range needs numeric start, stop and steps')
+        if not 1 <= steps <= FORECAST_SWEEP_MAX_POINTS:
+            raise ValueError(f'{feature} steps must be between 1 and {FORECAST_SWEEP_MAX_POINTS}')
+        values = np.linspace(start, stop, steps).tolist()
+    elif isinstance(spec, list) and spec:
+        values = spec
+    else:
+        raise ValueError(f'{feature} values must be a non-empty list or a range object')
+    
+    values = schema.validate_values(feature, values)
+    return values, schema.encode_values(feature, values)
+
+def build_sweep_matrix(bundle, base_row, encoded_axes):
+    """Every grid point as one matrix row: the base row tiled, swept columns overwritten.
+
+    Rows are in C order over the axes, so predictions reshape straight into the grid.
+    """
+    grids = np.meshgrid(*[codes for _, codes in encoded_axes], indexing='ij')
+    X = np.repeat(base_row.reshape(1, -1), grids[0].size, axis=0)
+    for (feature, _), grid in zip(encoded_axes, grids):
+        X[:, bundle.schema.spec(feature).index] = grid.ravel()
+    return X
+
+def inference_busy_response(error):
+    """error.status_code (429 pool saturated, 504 predict timed out) with Retry-After"""
+    response = jsonify({'error': f'Forecast service is busy, please retry: {str(error)}'})
+    response.status_code = error.status_code
+    response.headers['Retry-After'] = '1'
+    return response
+
+def stored_month_fingerprints(project_ids):
+    """{(project_id, forecast_month): (input_fingerprint, predictions)} for entries that carry one"""
+    stored = {}
+    cursor = project_forecasts_collection.find(
+        {'project_id': {'$in': list(project_ids)}},
+        {'_id': 0, 'project_id': 1, 'forecasts.forecast_month': 1,
+         'forecasts.input_fingerprint': 1, 'forecasts.predictions': 1}
+    )
+    for doc in cursor:
+        for entry in doc.get('forecasts', []):
+            if entry.get('input_fingerprint') and entry.get('predictions'):
+                stored[(doc['project_id'], entry.get('forecast_month'))] = (entry['input_fingerprint'], entry['predictions'])
+    return stored
+
+def forecast_month_update_ops(project_id, forecast_month, results, model_version, ensure_project_doc=True,
+                              features=None, fingerprint=None):
+    """Bulk write operations that upsert one month entry in project_forecasts.
+
+    Ordered execution matters: the project doc is created first, then either
+    the existing month entry is overwritten or (if none matched) a new one is
+    pushed. The $ne guard keeps the push a no-op when the $set already applied.
+    Pass ensure_project_doc=False when an earlier op in the same ordered
+    bulk_write already upserted this project's document.
+    `features` is the raw (unencoded) input row; it is stored with the entry so
+    recorded actuals can later be used to refresh the model. `fingerprint`
+    (see input_fingerprint) lets a repeat request skip inference and writes.
+    """
+    now = datetime.now(timezone.utc)
+    month_fields = {
+        'predictions': results,
+        'model_version': model_version,
+        'actual_values': {},
+        'updated_at': now
+    }
+    if features is not None:
+        month_fields['features'] = features
+    if fingerprint is not None:
+        month_fields['input_fingerprint'] = fingerprint
+    ops = []
+    if ensure_project_doc:
+        ops.append(UpdateOne(
+            {'project_id': project_id},
+            {'$setOnInsert': {'project_id': project_id, 'forecasts': []}},
+            upsert=True
+        ))
+    return ops + [
+        UpdateOne(
+            {'project_id': project_id, 'forecasts.forecast_month': forecast_month},
+            {'$set': {f'forecasts.$.{field}': value for field, value in month_fields.items()}}
+        ),
+        UpdateOne(
+            {'project_id': project_id, 'forecasts.forecast_month': {'$ne': forecast_month}},
+            {
+                '$push': {
+                    'forecasts': {'forecast_month': forecast_month, **month_fields, 'created_at': now}
+                }
+            }
+        )
+    ]
+
 """
 Legacy forecasting route (still computes predictions). After computing, store
 month-wise under project_forecasts with upsert on (project_id, forecast_month).
 """
 @app.route('/api/forecast', methods=['POST'])
 @jwt_required()
+@requires_ready('model')
 def forecast():
-    if model is None or feature_cols is None or target_cols is None or label_encoders is None:
-        return jsonify({'error': 'Model not available'}), 500
+    # Snapshot the active model so a concurrent hot swap cannot mix versions
+    bundle = model_registry.active
+    if bundle is None:
+        return jsonify({'error': 'Model not available'}), 503
     
     data = request.get_json()
     username = get_jwt_identity()
     
     # Get current month and year
     current_date = datetime.now(timezone.utc)
-    forecast_month = data.get('forecast_month', current_date.strftime('%Y-%m'))
     project_id = data.get('project_id', 'unknown')
+    project_error = project_id_error(project_id)
+    if project_error:
+        return jsonify({'error': project_error}), 400
     
-    # Prepare input data
-    input_data = {}
-    for col in feature_cols:
-        if col in data:
-            input_data[col] = data[col]
-        else:
-            # Use default values for missing fields
-            if col == 'budget':
-                input_data[col] = 30000000.0
-            elif col == 'tax_rate':
-                input_data[col] = 18.0
-            elif col == 'project_size_km':
-                input_data[col] = 100.0
-            elif col == 'project_start_month':
-                input_data[col] = 1.0
-            elif col == 'project_end_month':
-                input_data[col] = 12.0
-            elif col == 'lead_time_days':
-                input_data[col] = 45.0
-            elif col == 'commodity_price_index':
-                input_data[col] = 105.0
-            else:
-                input_data[col] = 0.0
+    # One month by default; horizon / forecast_month_end / forecast_months ask for several
+    months, month_error = resolve_forecast_months(data, current_date.strftime('%Y-%m'))
+    if month_error:
+        return jsonify({'error': month_error}), 400
+    
+    # Optional per-month feature overrides, e.g. {"2025-03": {"commodity_price_index": 110}}
+    monthly_features = data.get('monthly_features') or {}
+    if not isinstance(monthly_features, dict):
+        return jsonify({'error': 'monthly_features must be an object keyed by YYYY-MM'}), 400
     
-    # Convert numeric fields to proper types
-    numeric_fields = ['budget', 'tax_rate', 'project_size_km', 'project_start_month', 
-                     'project_end_month', 'lead_time_days', 'commodity_price_index']
+    # Validate through the model's feature schema (one row per month, shared when nothing
+    # is overridden); raw rows are stored with each month, the encoded matrix goes to the model
+    schema = bundle.schema
+    try:
+        raw_input = schema.validate(data)
+        raw_inputs = []
+        for month in months:
+            overrides = monthly_features.get(month)
+            raw_inputs.append(schema.validate({**data, **overrides}) if isinstance(overrides, dict) else raw_input)
+    except FeatureValidationError as e:
+        return invalid_input_response(e)
+    X = schema.encode(raw_inputs)
+    input_data = schema.row_dict(schema.encode([raw_input])[0])
+    # One request input per distinct row: a multi-month horizon repeats the same row
+    drift_monitor.observe(bundle.version, np.unique(X, axis=0))
     
-    for field in numeric_fields:
-        if field in input_data:
+    # Months whose stored entry has the same fingerprint (same inputs, same model version)
+    # are returned as stored: no inference, no write, recorded actual values untouched
+    fingerprints = [input_fingerprint(bundle.version, row) for row in X]
+    try:
+        stored = stored_month_fingerprints([project_id])
+    except errors.PyMongoError as e:
+        print(f"Could not read stored forecasts for {project_id}: {e}")
+        stored = {}
+    month_results = [None] * len(months)
+    changed = []
+    for i, (month, fingerprint) in enumerate(zip(months, fingerprints)):
+        stored_fingerprint, stored_predictions = stored.get((project_id, month), (None, None))
+        if stored_fingerprint == fingerprint:
+            month_results[i] = stored_predictions
+        else:
+            changed.append(i)
+    
+    # Make prediction for every changed month in one pass (cached per encoded input and model version)
+    try:
+        if changed:
+            for i, results in zip(changed, predict_forecast_rows(bundle, X[changed])):
+                month_results[i] = results
+        
+            # Save the changed months under the single project document with one bulk_write
             try:
-                input_data[field] = float(input_data[field])
-            except (ValueError, TypeError):
-                # Use default values if conversion fails
-                if field == 'budget':
-                    input_data[field] = 30000000.0
-                elif field == 'tax_rate':
-                    input_data[field] = 18.0
-                elif field == 'project_size_km':
-                    input_data[field] = 100.0
-                elif field == 'project_start_month':
-                    input_data[field] = 1.0
-                elif field == 'project_end_month':
-                    input_data[field] = 12.0
-                elif field == 'lead_time_days':
-                    input_data[field] = 45.0
-                elif field == 'commodity_price_index':
-                    input_data[field] = 105.0
-                else:
-                    input_data[field] = 0.0
+                ops = []
+                for i in changed:
+                    ops.extend(forecast_month_update_ops(project_id, months[i], month_results[i], bundle.version,
+                                                         ensure_project_doc=(i == changed[0]), features=raw_inputs[i],
+                                                         fingerprint=fingerprints[i]))
+                project_forecasts_collection.bulk_write(ops, ordered=True)
+                print(f"Upserted forecast for project {project_id}, {len(changed)} of {len(months)} months changed")
+                for i in changed:
+                    forecast_rollup.record(project_id, months[i], features=raw_inputs[i],
+                                           predictions=month_results[i], actual_values={})
+                
+            except Exception as e:
+                print(f"Failed to save forecast: {e}")
+                return jsonify({'error': f'Failed to save forecast: {str(e)}'}), 500
+        
+        response = {
+            'predictions': month_results[0],
+            'input_used': input_data,
+            'model_version': bundle.version,
+            'unchanged_months': [months[i] for i in range(len(months)) if i not in changed]
+        }
+        if len(months) > 1:
+            response['forecasts'] = [
+                {'forecast_month': month, 'predictions': results}
+                for month, results in zip(months, month_results)
+            ]
+        return jsonify(response)
+    except InferenceUnavailable as e:
+        return inference_busy_response(e)
+    except Exception as e:
+        return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
+
+@app.route('/api/forecast/batch', methods=['POST'])
+@jwt_required()
+@requires_ready('model')
+def forecast_batch():
+    """Forecast many (project_id, forecast_month, features) rows with one predict call"""
+    bundle = model_registry.active
+    if bundle is None:
+        return jsonify({'error': 'Model not available'}), 503
+    
+    data = request.get_json(silent=True) or {}
+    rows = data.get('rows')
     
-    # Encode categorical variables
-    for col in ['project_location', 'tower_type', 'substation_type', 'region_risk_flag']:
-        if col in input_data and col in label_encoders:
+    if not isinstance(rows, list) or not rows:
+        return jsonify({'error': 'rows must be a non-empty array'}), 400
+    if len(rows) > FORECAST_BATCH_MAX_ROWS:
+        return jsonify({'error': f'Batch too large: {len(rows)} rows (max {FORECAST_BATCH_MAX_ROWS})'}), 400
+    
+    default_month = datetime.now(timezone.utc).strftime('%Y-%m')
+    results = [None] * len(rows)
+    valid_indices = []
+    valid_inputs = []
+    
+    # Validate and encode every row; bad rows are reported, not fatal
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            results[i] = {'row_index': i, 'error': 'Row must be an object'}
+            continue
+        
+        project_id = row.get('project_id')
+        forecast_month = row.get('forecast_month', default_month)
+        features = row.get('features', {})
+        
+        project_error = project_id_error(project_id)
+        if project_error:
+            results[i] = {'row_index': i, 'error': project_error}
+        elif not isinstance(forecast_month, str) or not FORECAST_MONTH_RE.match(forecast_month):
+            results[i] = {'row_index': i, 'project_id': project_id, 'error': 'forecast_month must be YYYY-MM'}
+        elif not isinstance(features, dict):
+            results[i] = {'row_index': i, 'project_id': project_id, 'error': 'features must be an object'}
+        else:
             try:
-                input_data[col] = label_encoders[col].transform([input_data[col]])[0]
-            except:
-                input_data[col] = 0
+                valid_inputs.append(bundle.schema.validate(features))
+                valid_indices.append(i)
+                results[i] = {'row_index': i, 'project_id': project_id, 'forecast_month': forecast_month}
+            except FeatureValidationError as e:
+                results[i] = {'row_index': i, 'project_id': project_id, 'error': 'Invalid features', 'details': e.errors}
     
-    # Create DataFrame
-    input_df = pd.DataFrame([input_data])
+    changed = []  # positions in valid_indices that need inference and a write
+    if valid_inputs:
+        X = bundle.schema.encode(valid_inputs)
+        drift_monitor.observe(bundle.version, X)
+        fingerprints = [input_fingerprint(bundle.version, row) for row in X]
+        try:
+            stored = stored_month_fingerprints({results[i]['project_id'] for i in valid_indices})
+        except errors.PyMongoError as e:
+            print(f"Could not read stored forecasts for batch: {e}")
+            stored = {}
+        for row_pos, i in enumerate(valid_indices):
+            stored_fingerprint, stored_predictions = stored.get((results[i]['project_id'], results[i]['forecast_month']), (None, None))
+            if stored_fingerprint == fingerprints[row_pos]:
+                results[i]['predictions'] = stored_predictions
+                results[i]['unchanged'] = True
+            else:
+                changed.append(row_pos)
     
-    # Debug: Print input data and data types
-    print("Input data for forecast:")
-    print(input_data)
-    print("Input data types:")
-    for col in input_df.columns:
-        print(f"{col}: {input_df[col].dtype}")
+    if changed:
+        try:
+            predictions = predict_forecast_rows(bundle, X[changed])
+        except InferenceUnavailable as e:
+            return inference_busy_response(e)
+        except Exception as e:
+            return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
+        
+        ops = []
+        seen_projects = set()
+        for row_pos, row_results in zip(changed, predictions):
+            i = valid_indices[row_pos]
+            results[i]['predictions'] = row_results
+            project_id = results[i]['project_id']
+            ops.extend(forecast_month_update_ops(project_id, results[i]['forecast_month'], row_results, bundle.version,
+                                                 ensure_project_doc=project_id not in seen_projects,
+                                                 features=valid_inputs[row_pos], fingerprint=fingerprints[row_pos]))
+            seen_projects.add(project_id)
+        
+        try:
+            project_forecasts_collection.bulk_write(ops, ordered=True)
+        except Exception as e:
+            print(f"Failed to save batch forecast: {e}")
+            return jsonify({'error': f'Failed to save forecasts: {str(e)}'}), 500
+        for row_pos in changed:
+            i = valid_indices[row_pos]
+            forecast_rollup.record(results[i]['project_id'], results[i]['forecast_month'], features=valid_inputs[row_pos],
+                                   predictions=results[i]['predictions'], actual_values={})
+    
+    successful = len(valid_indices)
+    print(f"Batch forecast: {successful}/{len(rows)} rows valid, {len(changed)} predicted and saved")
+    return jsonify({
+        'success': True,
+        'model_version': bundle.version,
+        'results': results,
+        'total_rows': len(rows),
+        'successful_rows': successful,
+        'failed_rows': len(rows) - successful,
+        'unchanged_rows': successful - len(changed)
+    })
+
+@app.route('/api/forecast/sweep', methods=['POST'])
+@jwt_required()
+@requires_ready('model')
+def forecast_sweep():
+    """What-if response surface: predict a base input over a grid of one or two features.
+
+    Body: {"base": {...features}, "sweep": {"budget": {"start": 2e7, "stop": 8e7, "steps": 13},
+    "commodity_price_index": [95, 105, 115]}, "targets": [...optional subset]}.
+    Nothing is stored; the whole grid is predicted in one call.
+    """
+    bundle = model_registry.active
+    if bundle is None:
+        return jsonify({'error': 'Model not available'}), 503
+    
+    data = request.get_json(silent=True) or {}
+    base = data.get('base', {})
+    sweep = data.get('sweep')
+    if not isinstance(base, dict):
+        return jsonify({'error': 'base must be an object'}), 400
+    if not isinstance(sweep, dict) or not 1 <= len(sweep) <= FORECAST_SWEEP_MAX_FEATURES:
+        return jsonify({'error': f'sweep must map 1 to {FORECAST_SWEEP_MAX_FEATURES} features to their values'}), 400
+    
+    targets = data.get('targets') or bundle.target_cols
+    if not isinstance(targets, list) or any(target not in bundle.target_cols for target in targets):
+        return jsonify({'error': f'targets must be a list drawn from {bundle.target_cols}'}), 400
     
-    # Make prediction
     try:
-        predictions = model.predict(input_df[feature_cols])
-        
-        # Format results
-        results = {}
-        for i, col in enumerate(target_cols):
-            results[col] = float(predictions[0][i])
-        
-        # Save forecast month-wise under a single project document
+        base_input = bundle.schema.validate(base)
+        axes = []
+        for feature, spec in sweep.items():
+            values, codes = resolve_sweep_values(bundle, feature, spec)
+            axes.append((feature, values, codes))
+    except FeatureValidationError as e:
+        return invalid_input_response(e)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    shape = [len(values) for _, values, _ in axes]
+    n_points = int(np.prod(shape))
+    if n_points > FORECAST_SWEEP_MAX_POINTS:
+        return jsonify({'error': f'Sweep grid too large: {n_points} points (max {FORECAST_SWEEP_MAX_POINTS})'}), 400
+    
+    base_row = bundle.schema.encode([base_input])[0]
+    X = build_sweep_matrix(bundle, base_row, [(feature, codes) for feature, _, codes in axes])
+    try:
+        predictions = forecast_dispatcher.predict(bundle.inference_engine, X)
+    except InferenceUnavailable as e:
+        return inference_busy_response(e)
+    except Exception as e:
+        return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
+    
+    predictions = np.asarray(predictions).reshape(*shape, len(bundle.target_cols))
+    surfaces = {}
+    for target in targets:
+        surface = predictions[..., bundle.target_cols.index(target)]
+        surfaces[target] = {
+            'values': surface.round(4).tolist(),
+            'min': float(surface.min()),
+            'max': float(surface.max())
+        }
+    
+    return jsonify({
+        'model_version': bundle.version,
+        'base_input': bundle.schema.row_dict(base_row),
+        'features': [feature for feature, _, _ in axes],
+        'grid': {feature: values for feature, values, _ in axes},
+        'shape': shape,
+        'points': n_points,
+        'surfaces': surfaces
+    })
+
+def resolve_forecast_inputs(bundle, rows):
+    """Validate [{"features": {...}} | {"project_id", "forecast_month"}] rows through the schema.
+
+    Project rows reuse the inputs stored with that month's forecast (latest
+    month if omitted). Returns (results, valid_indices, valid_inputs): one
+    result dict per row (with 'error' for rejected rows) and the raw rows of the
+    accepted ones. Raises PyMongoError if stored inputs cannot be read.
+    """
+    # Stored inputs for rows that name a project instead of giving features
+    project_ids = {row.get('project_id') for row in rows
+                   if isinstance(row, dict) and row.get('project_id') and 'features' not in row}
+    stored = {}
+    if project_ids:
+        for doc in project_forecasts_collection.find({'project_id': {'$in': list(project_ids)}},
+                                                     {'_id': 0, 'project_id': 1, 'forecasts.forecast_month': 1,
+                                                      'forecasts.features': 1}):
+            months = {f['forecast_month']: f['features'] for f in doc.get('forecasts', [])
+                      if f.get('features') and f.get('forecast_month')}
+            stored[doc['project_id']] = months
+
+    results = [None] * len(rows)
+    valid_indices = []
+    valid_inputs = []
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            results[i] = {'row_index': i, 'error': 'Row must be an object'}
+            continue
+        result = {'row_index': i}
+        if row.get('project_id'):
+            result['project_id'] = row['project_id']
+        features = row.get('features')
+        if features is None and row.get('project_id'):
+            months = stored.get(row['project_id'], {})
+            month = row.get('forecast_month') or (max(months) if months else None)
+            features = months.get(month)
+            if features is None:
+                result['error'] = f"No stored forecast inputs for {row['project_id']} {month or ''}".strip()
+                results[i] = result
+                continue
+            result['forecast_month'] = month
+        if not isinstance(features, dict):
+            result['error'] = 'features must be an object (or give a project_id with a stored forecast)'
+            results[i] = result
+            continue
         try:
-            # Ensure project doc exists
-            project_forecasts_collection.update_one(
-                {'project_id': project_id},
-                {'$setOnInsert': {'project_id': project_id, 'forecasts': []}},
-                upsert=True
-            )
+            valid_inputs.append(bundle.schema.validate(features))
+            valid_indices.append(i)
+        except FeatureValidationError as e:
+            result.update({'error': 'Invalid features', 'details': e.errors})
+        results[i] = result
+    return results, valid_indices, valid_inputs
 
-            # Try to update existing month entry
-            res = project_forecasts_collection.update_one(
-                {'project_id': project_id, 'forecasts.forecast_month': forecast_month},
-                {
-                    '$set': {
-                        'forecasts.$.predictions': results,
-                        'forecasts.$.actual_values': {},
-                        'forecasts.$.updated_at': datetime.now(timezone.utc)
-                    }
-                }
-            )
+@app.route('/api/forecast/explain', methods=['POST'])
+@jwt_required()
+@requires_ready('model')
+def forecast_explain():
+    """Why a forecast came out as it did: per-feature contributions for every target.
 
-            if res.matched_count == 0:
-                # Push new month entry
-                project_forecasts_collection.update_one(
-                    {'project_id': project_id},
-                    {
-                        '$push': {
-                            'forecasts': {
-                                'forecast_month': forecast_month,
-                                'predictions': results,
-                                'actual_values': {},
-                                'created_at': datetime.now(timezone.utc),
-                                'updated_at': datetime.now(timezone.utc)
-                            }
-                        }
-                    }
-                )
-            print(f"Upserted forecast for project {project_id}, month {forecast_month}")
-            
+    Body: a single forecast payload (features at the top level, like /api/forecast),
+    or {"rows": [{"features": {...}} | {"project_id": ..., "forecast_month": ...}]}
+    where project rows reuse the inputs stored with that month's forecast (latest
+    month if omitted). Optional "targets" subset, "top" (drivers per target) and
+    "method": "exact" (TreeSHAP, default) or "approx" (per-path, far cheaper).
+    """
+    bundle = model_registry.active
+    if bundle is None:
+        return jsonify({'error': 'Model not available'}), 503
+    if bundle.explainer is None:
+        return jsonify({'error': 'The active model does not support explanations'}), 501
+    
+    data = request.get_json(silent=True) or {}
+    rows = data['rows'] if 'rows' in data else [{'features': data}]
+    if not isinstance(rows, list) or not rows:
+        return jsonify({'error': 'rows must be a non-empty array'}), 400
+    if len(rows) > FORECAST_BATCH_MAX_ROWS:
+        return jsonify({'error': f'Batch too large: {len(rows)} rows (max {FORECAST_BATCH_MAX_ROWS})'}), 400
+    targets = data.get('targets') or bundle.target_cols
+    if not isinstance(targets, list) or any(target not in bundle.target_cols for target in targets):
+        return jsonify({'error': f'targets must be a list drawn from {bundle.target_cols}'}), 400
+    top = data.get('top')
+    if top is not None and (not isinstance(top, int) or top < 1):
+        return jsonify({'error': 'top must be a positive integer'}), 400
+    method = data.get('method', 'exact')
+    if method not in EXPLAIN_METHODS:
+        return jsonify({'error': f'method must be one of {list(EXPLAIN_METHODS)}'}), 400
+    
+    try:
+        results, valid_indices, valid_inputs = resolve_forecast_inputs(bundle, rows)
+    except errors.PyMongoError as e:
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+    
+    if valid_inputs:
+        X = bundle.schema.encode(valid_inputs)
+        try:
+            explanations = explain_forecast_rows(bundle, X, method)
         except Exception as e:
-            print(f"Failed to save forecast: {e}")
-            return jsonify({'error': f'Failed to save forecast: {str(e)}'}), 500
-        
-        return jsonify({
-            'predictions': results,
-            'input_used': input_data
-        })
+            return jsonify({'error': f'Explanation failed: {str(e)}'}), 500
+        for row_pos, i in enumerate(valid_indices):
+            row_explanations = {}
+            for target in targets:
+                explanation = dict(explanations[row_pos][target])
+                if top:
+                    ranked = sorted(explanation['contributions'].items(), key=lambda item: abs(item[1]), reverse=True)
+                    explanation['top_drivers'] = [{'feature': f, 'contribution': v} for f, v in ranked[:top]]
+                row_explanations[target] = explanation
+            results[i]['input_used'] = bundle.schema.row_dict(X[row_pos])
+            results[i]['explanations'] = row_explanations
+    
+    return jsonify({
+        'model_version': bundle.version,
+        'method': method,
+        'results': results,
+        'total_rows': len(rows),
+        'successful_rows': len(valid_indices),
+        'failed_rows': len(rows) - len(valid_indices)
+    })
+
+@app.route('/api/forecast/baseline', methods=['GET'])
+@jwt_required()
+def forecast_baseline():
+    """Seasonal baseline (SES or seasonal-naive per series) fitted on recorded actuals.
+
+    With ?project_id= returns that project's chosen method per target and
+    forecasts for ?horizon= months (default 12) after its last actual month;
+    without it, fit statistics. Does not need the model to be loaded.
+    """
+    target_cols = baseline_target_cols()
+    if not target_cols:
+        return jsonify({'error': 'Target columns unavailable until the model or dataset has loaded'}), 503
+    try:
+        fit = baseline_engine.current(target_cols)
+    except errors.PyMongoError as e:
+        return jsonify({'error': f'Failed to read actuals: {str(e)}'}), 500
+    
+    project_id = request.args.get('project_id')
+    if not project_id:
+        return jsonify(baseline_engine.stats())
+    if project_id not in fit:
+        return jsonify({'error': f'No actual values recorded for project {project_id}'}), 404
+    try:
+        horizon = int(request.args.get('horizon', 12))
+    except ValueError:
+        return jsonify({'error': 'horizon must be an integer'}), 400
+    if not 1 <= horizon <= baseline_engine.horizon:
+        return jsonify({'error': f'horizon must be between 1 and {baseline_engine.horizon}'}), 400
+    return jsonify({**fit.project_summary(project_id, horizon), 'fitted_at': fit.fitted_at.isoformat()})
+
+@app.route('/api/forecast/simulate', methods=['POST'])
+@jwt_required()
+@requires_ready('model')
+def forecast_simulate():
+    """Monte Carlo P10/P50/P90 of material quantities and cost under input uncertainty.
+
+    Body: a single forecast payload, or {"rows": [...]} as for /api/forecast/explain.
+    Optional "uncertainty" {feature: {"dist": normal|lognormal|uniform|triangular,
+    "sd" | "sd_pct" | "low"/"mode"/"high", "shared": bool}} (default: lead_time_days
+    and commodity_price_index), "draws" (default 5000), "quantiles" (percent),
+    "unit_prices" {target: price} overriding MATERIAL_PRICES, and "seed". Targets
+    without a catalog price or override are left out of cost and listed as unpriced_targets.
+    """
+    bundle = model_registry.active
+    if bundle is None:
+        return jsonify({'error': 'Model not available'}), 503
+    data = request.get_json(silent=True) or {}
+    rows = data['rows'] if 'rows' in data else [{'features': {k: v for k, v in data.items() if k not in (
+        'uncertainty', 'draws', 'quantiles', 'unit_prices', 'seed')}}]
+    if not isinstance(rows, list) or not rows:
+        return jsonify({'error': 'rows must be a non-empty array'}), 400
+    if len(rows) > FORECAST_BATCH_MAX_ROWS:
+        return jsonify({'error': f'Batch too large: {len(rows)} rows (max {FORECAST_BATCH_MAX_ROWS})'}), 400
+    draws = data.get('draws', DEFAULT_DRAWS)
+    if not isinstance(draws, int) or isinstance(draws, bool) or not 1 <= draws <= FORECAST_SIMULATION_MAX_DRAWS:
+        return jsonify({'error': f'draws must be an integer between 1 and {FORECAST_SIMULATION_MAX_DRAWS}'}), 400
+    if len(rows) * draws > FORECAST_SIMULATION_MAX_SCENARIOS:
+        return jsonify({'error': f'Too many scenarios: {len(rows)} rows x {draws} draws '
+                                 f'(max {FORECAST_SIMULATION_MAX_SCENARIOS})'}), 400
+    quantiles = data.get('quantiles', list(DEFAULT_QUANTILES))
+    if not isinstance(quantiles, list) or not quantiles or any(
+            isinstance(q, bool) or not isinstance(q, (int, float)) or not 0 <= q <= 100 for q in quantiles):
+        return jsonify({'error': 'quantiles must be a list of percentages between 0 and 100'}), 400
+    unit_prices = data.get('unit_prices') or {}
+    if not isinstance(unit_prices, dict) or any(
+            col not in bundle.target_cols or isinstance(price, bool) or not isinstance(price, (int, float)) or price < 0
+            for col, price in unit_prices.items()):
+        return jsonify({'error': f'unit_prices must map targets from {bundle.target_cols} to non-negative numbers'}), 400
+    seed = data.get('seed')
+    if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool) or seed < 0):
+        return jsonify({'error': 'seed must be a non-negative integer'}), 400
+    try:
+        uncertainty = parse_uncertainty(data.get('uncertainty'), bundle.schema)
+    except SimulationInputError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        results, valid_indices, valid_inputs = resolve_forecast_inputs(bundle, rows)
+    except errors.PyMongoError as e:
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+    
+    prices, unpriced = target_unit_prices(bundle.target_cols, unit_prices)
+    portfolio = None
+    if valid_inputs:
+        start = time.perf_counter()
+        try:
+            outcome = simulate(bundle, valid_inputs, uncertainty, prices,
+                               lambda X: forecast_dispatcher.predict(bundle.inference_engine, X),
+                               draws=draws, quantiles=quantiles, seed=seed)
+        except InferenceUnavailable as e:
+            return inference_busy_response(e)
+        except Exception as e:
+            return jsonify({'error': f'Simulation failed: {str(e)}'}), 500
+        
+        def per_target(summary, row_pos=None):
+            return {col: {name: round(float(values[j] if row_pos is None else values[row_pos][j]), 4)
+                          for name, values in summary.items()}
+                    for j, col in enumerate(bundle.target_cols)}
+        
+        for row_pos, i in enumerate(valid_indices):
+            results[i].update({
+                'input_used': valid_inputs[row_pos],
+                'point_forecast': {col: float(outcome['point'][row_pos][j]) for j, col in enumerate(bundle.target_cols)},
+                'point_cost': round(float(outcome['point_cost'][row_pos]), 2),
+                'quantities': per_target(outcome['quantities'], row_pos),
+                'cost': {name: round(float(values[row_pos]), 2) for name, values in outcome['cost'].items()},
+            })
+        portfolio = {
+            'quantities': per_target(outcome['portfolio_quantities']),
+            'cost': {name: round(float(values), 2) for name, values in outcome['portfolio_cost'].items()},
+        }
+        print(f"Simulated {outcome['scenarios']} scenarios with {outcome['model_rows']} model rows "
+              f"in {time.perf_counter() - start:.3f}s")
+    
+    return jsonify({
+        'model_version': bundle.version,
+        'draws': draws,
+        'uncertainty': uncertainty,
+        'unit_prices': {col: price for col, price in zip(bundle.target_cols, prices.tolist()) if col not in unpriced},
+        'unpriced_targets': unpriced,
+        'results': results,
+        'portfolio': portfolio,
+        'total_rows': len(rows),
+        'successful_rows': len(valid_indices),
+        'failed_rows': len(rows) - len(valid_indices)
+    })
+
+@app.route('/api/forecast/schema', methods=['GET'])
+@jwt_required()
+@requires_ready('model')
+def forecast_schema():
+    """Feature defaults, ranges and categorical values accepted by the active model"""
+    bundle = model_registry.active
+    if bundle is None:
+        return jsonify({'error': 'Model not available'}), 503
+    return jsonify({'model_version': bundle.version, 'features': bundle.schema.describe()})
+
+@app.route('/api/forecast/cache', methods=['GET'])
+@jwt_required()
+def forecast_cache_stats():
+    """Hit/miss counters for the forecast prediction cache"""
+    bundle = model_registry.active
+    return jsonify({'model_version': bundle.version if bundle else None, **forecast_cache.stats(),
+                    'explanations': explanation_cache.stats()})
+
+@app.route('/api/forecast/dispatcher', methods=['GET'])
+@jwt_required()
+def forecast_dispatcher_stats():
+    """Queue depth and batch-size metrics for tuning the micro-batching window"""
+    return jsonify({**forecast_dispatcher.stats(), 'inference_pool': inference_pool.stats()})
+
+@app.route('/api/forecast/drift', methods=['GET'])
+@jwt_required()
+def forecast_drift():
+    """Per-feature PSI of recent /api/forecast inputs against the training data (?detail=true adds histograms)"""
+    detail = request.args.get('detail', 'false').lower() == 'true'
+    return jsonify(drift_monitor.report(detail=detail))
+
+@app.route('/api/model', methods=['GET'])
+@jwt_required()
+def get_model_info():
+    """Active model version and the versions available in the registry"""
+    bundle = model_registry.active
+    return jsonify({
+        'active': bundle.describe() if bundle else None,
+        'current_pointer': model_registry.current_version(),
+        'versions': model_registry.list_versions(),
+        'last_error': model_registry.last_error
+    })
+
+@app.route('/api/model/activate', methods=['POST'])
+@jwt_required()
+@admin_required
+@requires_ready('model', allow_failed=True)
+def activate_model_version():
+    """Validate a registry version and hot-swap it in (other workers follow via CURRENT)"""
+    data = request.get_json(silent=True) or {}
+    version = data.get('version')
+    if not version:
+        return jsonify({'error': 'version is required'}), 400
+    try:
+        bundle = model_registry.activate(version)
     except Exception as e:
-        return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
+        return jsonify({'error': f'Failed to activate model {version}: {str(e)}'}), 400
+    print(f"Model version {version} activated by {get_jwt_identity()}")
+    return jsonify({'message': f'Model version {version} is now active', 'active': bundle.describe()})
+
+@app.route('/api/model/refresh', methods=['GET'])
+@jwt_required()
+def model_refresh_status():
+    """State and last result of the incremental refresh-from-actuals job"""
+    return jsonify(model_refresh_job.status())
+
+@app.route('/api/model/refresh', methods=['POST'])
+@jwt_required()
+@admin_required
+@requires_ready('model')
+def trigger_model_refresh():
+    """Start a refresh from new actuals now; poll GET /api/model/refresh for the outcome.
+
+    The refreshed version is only activated with {"activate": true} (or MODEL_REFRESH_ACTIVATE).
+    """
+    data = request.get_json(silent=True) or {}
+    min_rows = data.get('min_rows')
+    if min_rows is not None and (not isinstance(min_rows, int) or min_rows < 1):
+        return jsonify({'error': 'min_rows must be a positive integer'}), 400
+    activate = data.get('activate')
+    if activate is not None and not isinstance(activate, bool):
+        return jsonify({'error': 'activate must be a boolean'}), 400
+    if not model_refresh_job.trigger(min_rows, activate):
+        return jsonify({'error': 'A model refresh is already running', **model_refresh_job.status()}), 409
+    print(f"Model refresh triggered by {get_jwt_identity()}")
+    return jsonify({'message': 'Model refresh started', **model_refresh_job.status()}), 202
+
+def filter_backtest_report(report, segments=None, targets=None):
+    """Copy of a cached report restricted to the requested segments / targets"""
+    def pick(metrics):
+        return {t: m for t, m in metrics.items() if targets is None or t in targets}
+    return {
+        **report,
+        'overall': pick(report['overall']),
+        'segments': {
+            segment: [{**group, 'targets': pick(group['targets'])} for group in groups]
+            for segment, groups in report['segments'].items() if segments is None or segment in segments
+        },
+    }
+
+@app.route('/api/model/backtest', methods=['GET', 'POST'])
+@jwt_required()
+@requires_ready('model')
+def model_backtest():
+    """Per-target, per-segment error metrics of the active model over historical data.
+
+    GET replays the powergrid dataset; POST replays an uploaded CSV (multipart
+    field 'file') with the same columns. Reports are cached per model version
+    and file content. ?segments= and ?targets= (comma-separated) trim the response.
+    """
+    bundle = model_registry.active
+    if bundle is None:
+        return jsonify({'error': 'Model not available'}), 503
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if upload is None:
+            return jsonify({'error': "Upload a history CSV as multipart field 'file'"}), 400
+        content, source_name = upload.read(), upload.filename or 'upload.csv'
+    else:
+        try:
+            with open(DEFAULT_HISTORY_PATH, 'rb') as f:
+                content = f.read()
+        except OSError as e:
+            return jsonify({'error': f'History dataset unavailable: {str(e)}'}), 500
+        source_name = os.path.basename(DEFAULT_HISTORY_PATH)
+    
+    try:
+        report, cached = backtest_cache.get_or_compute(bundle, content, source_name)
+    except BacktestInputError as e:
+        return jsonify({'error': str(e)}), 400
+    except InferenceUnavailable as e:
+        return inference_busy_response(e)
+    except Exception as e:
+        return jsonify({'error': f'Backtest failed: {str(e)}'}), 500
+    
+    segments = request.args.get('segments')
+    targets = request.args.get('targets')
+    report = filter_backtest_report(report, segments.split(',') if segments else None,
+                                    targets.split(',') if targets else None)
+    return jsonify({**report, 'cached': cached})
+
+@app.route('/api/forecast/reforecast', methods=['GET'])
+@jwt_required()
+def reforecast_status():
+    """Progress, counters and throughput of the portfolio re-forecast for a model version (default: active)"""
+    try:
+        return jsonify(reforecast_job.status(request.args.get('version')))
+    except errors.PyMongoError as e:
+        return jsonify({'error': f'Failed to read re-forecast status: {str(e)}'}), 500
+
+@app.route('/api/forecast/reforecast', methods=['POST'])
+@jwt_required()
+@admin_required
+@requires_ready('model')
+def trigger_reforecast():
+    """Start (or resume) re-forecasting stored months with the active model; {"stop": true} pauses it,
+    {"restart": true} runs a completed job again from the first project"""
+    data = request.get_json(silent=True) or {}
+    if data.get('stop'):
+        reforecast_job.stop()
+        return jsonify({'message': 'Re-forecast will pause after the current chunk', **reforecast_job.status()})
+    if not reforecast_job.trigger(restart=bool(data.get('restart'))):
+        return jsonify({'error': 'A re-forecast is already running', **reforecast_job.status()}), 409
+    print(f"Portfolio re-forecast requested by {get_jwt_identity()}")
+    return jsonify({'message': 'Re-forecast started', **reforecast_job.status()}), 202
 
 # Projects API
 @app.route('/api/projects', methods=['GET'])
@@ -1664,6 +2620,10 @@ def get_project_forecasts(project_id):
                 }
                 if entry['forecast_month'] and entry['predictions']:
                     forecasts.append(entry)
+        # Seasonal baseline next to each model forecast (None before the project has actuals)
+        baselines = baseline_for_months(project_id, [f.get('forecast_month') for f in forecasts])
+        for f in forecasts:
+            f['baseline'] = baselines.get(f.get('forecast_month'))
         # Sort newest first
         forecasts.sort(key=lambda x: x.get('forecast_month', ''), reverse=True)
         return jsonify(forecasts)
@@ -1747,6 +2707,9 @@ def save_material_actuals():
             {'$set': actual_data},
             upsert=True
         )
+        forecast_rollup.record_material_actuals(actual_data['project_id'], actual_data['month'],
+                                                actual_data['material_values'])
+        baseline_engine.invalidate()
         
         return jsonify({
             'message': 'Material actuals saved successfully',
@@ -1804,6 +2767,35 @@ MATERIAL_PRICES = {
     'Surge Arrester': 12000,
     'Busbar': 2800
 }
+DEFAULT_MATERIAL_PRICE = 1000
+
+# Catalog item priced for each forecast target; targets without one are left unpriced
+FORECAST_TARGET_MATERIALS = {
+    'quantity_steel_tons': 'Steel Tower',
+    'quantity_conductors_tons': 'Conductor Cable',
+    'quantity_insulators_count': 'Insulator',
+    'quantity_transformers_count': 'Power Transformer',
+    'quantity_switchgears_count': 'Switchgear',
+    'quantity_protective_relays_count': 'Circuit Breaker',
+}
+
+def target_unit_prices(target_cols, overrides=None):
+    """(unit price per forecast target, unpriced targets) from MATERIAL_PRICES and per-target overrides.
+
+    A target with neither a catalog item nor an override is priced at 0, so it
+    stays out of costs, and is listed as unpriced.
+    """
+    overrides = overrides or {}
+    prices, unpriced = [], []
+    for col in target_cols:
+        if col in overrides:
+            prices.append(float(overrides[col]))
+        elif FORECAST_TARGET_MATERIALS.get(col) in MATERIAL_PRICES:
+            prices.append(float(MATERIAL_PRICES[FORECAST_TARGET_MATERIALS[col]]))
+        else:
+            prices.append(0.0)
+            unpriced.append(col)
+    return np.array(prices), unpriced
 
 # Orders API
 @app.route('/api/orders', methods=['GET'])
@@ -1858,7 +2850,7 @@ def create_order():
         quantity = float(data.get('quantity', 0))
         
         # Calculate unit price based on material type
-        unit_price = MATERIAL_PRICES.get(material, 1000)  # Default price if material not found
+        unit_price = MATERIAL_PRICES.get(material, DEFAULT_MATERIAL_PRICE)  # Default price if material not found
         
         # Add some variation based on dealer (simulate market conditions)
         dealer = data.get('dealer', '')
@@ -2048,6 +3040,8 @@ def save_actual_values(project_id):
 
         if result.matched_count == 0:
             return jsonify({'error': f'No forecast found for month {target_month}'}), 404
+        forecast_rollup.record_actuals(project_id, target_month, actual_values)
+        baseline_engine.invalidate()
 
         return jsonify({
             'message': 'Actual values saved successfully',
@@ -2191,10 +3185,19 @@ def poll_updates():
     updates = update_manager.get_updates_for_user(username)
     return jsonify({'updates': updates}), 200
 
-# Health check
+# Health check (always 200 so the platform sees a live worker; readiness is per component)
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
+    bundle = model_registry.active
+    return jsonify({
+        'status': 'healthy',
+        'ready': startup_state.all_ready(),
+        'components': startup_state.snapshot(),
+        'model_version': bundle.version if bundle else None,
+        'preload_shared': PRELOAD_SHARED,
+        'memory': process_memory(),
+        'timestamp': datetime.now().isoformat()
+    })
 
 # Inventory Management Endpoints
 @app.route('/api/inventory', methods=['GET'])
@@ -2477,11 +3480,12 @@ def initialize_inventory():
 
 @app.route('/api/materials', methods=['GET'])
 @jwt_required()
+@requires_ready('model')
 def get_materials():
     try:
         # Get materials from target_cols (predicted materials)
         materials = []
-        for col in target_cols:
+        for col in active_target_cols() or []:
             # Convert column names to readable material names and remove "Quantity" prefix
             material_name = col.replace('_', ' ').title()
             # Remove "Quantity" prefix if it exists
@@ -4094,4 +5098,7 @@ if __name__ == '__main__':
     debug_flag = os.getenv('FLASK_DEBUG', 'true').lower() == 'true'
     host = os.getenv('HOST', '0.0.0.0')
     port = int(os.getenv('PORT', '5000'))
+    if PRELOAD_SHARED:
+        # No gunicorn master to fork from: this process is the only worker
+        start_worker_services()
     app.run(debug=debug_flag, host=host, port=port)
@@ -0,0 +1,204 @@
+# Backtesting the active model against historical material consumption
+#
+# A history CSV (the powergrid dataset, or an uploaded file with the same
+# columns) is encoded column-wise through the model's FeatureSchema and
+# predicted in one batch. Errors are then aggregated per target and per
+# segment (region, tower type, substation type, month) with flat bincounts
+# over a (group, target) index, so the cost is a handful of array passes no
+# matter how many segments there are. Reports are cached per model version
+# and history content.
+
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_HISTORY_PATH = '../powergrid_realistic_material_dataset1.csv'
+BACKTEST_SEGMENTS = ('project_location', 'tower_type', 'substation_type', 'month')
+BACKTEST_METRICS = ('count', 'mae', 'rmse', 'bias', 'wape', 'r2')
+BACKTEST_CACHE_SIZE = int(os.getenv('BACKTEST_CACHE_SIZE', '8'))
+BACKTEST_MAX_ROWS = int(os.getenv('BACKTEST_MAX_ROWS', '200000'))
+UNKNOWN_SEGMENT = 'Unknown'
+
+
+class BacktestInputError(ValueError):
+    pass
+
+
+def read_history(content, target_cols):
+    """CSV bytes -> DataFrame holding at least one of the model's target columns"""
+    try:
+        history = pd.read_csv(io.BytesIO(content))
+    except (ValueError, pd.errors.ParserError) as e:
+        raise BacktestInputError(f'Could not parse history CSV: {e}')
+    if len(history) > BACKTEST_MAX_ROWS:
+        raise BacktestInputError(f'History has {len(history)} rows (max {BACKTEST_MAX_ROWS})')
+    if not any(col in history.columns for col in target_cols):
+        raise BacktestInputError(f'History has none of the target columns {target_cols}')
+    return history
+
+
+def history_months(history):
+    """YYYY-MM per row from the timestamp column (DD-MM-YYYY in the powergrid dataset)"""
+    if 'timestamp' not in history.columns:
+        return None
+    stamps = pd.to_datetime(history['timestamp'], dayfirst=True, errors='coerce')
+    return stamps.dt.strftime('%Y-%m').fillna(UNKNOWN_SEGMENT).to_numpy()
+
+
+def encode_history(schema, history):
+    """(X, keep) where keep masks rows whose supplied numeric features all parse"""
+    columns, keep = {}, np.ones(len(history), dtype=bool)
+    for spec in schema.specs:
+        if spec.name not in history.columns:
+            columns[spec.name] = np.full(len(history), spec.default)
+            continue
+        values = history[spec.name]
+        if spec.categorical:
+            columns[spec.name] = values.where(values.notna(), spec.default).tolist()
+        else:
+            numbers = pd.to_numeric(values, errors='coerce')
+            keep &= ~(values.notna() & numbers.isna()).to_numpy()
+            columns[spec.name] = numbers.fillna(spec.default).to_numpy()
+    X = np.empty((len(history), len(schema.specs)), dtype=np.float32)
+    for spec in schema.specs:
+        X[:, spec.index] = schema.encode_values(spec.name, columns[spec.name])
+    return X[keep], keep
+
+
+def grouped_metrics(codes, n_groups, Y, P):
+    """Per (group, target) metrics; NaN in Y marks a missing actual.
+
+    Every sum is one np.bincount over the flattened (group * n_targets + target)
+    index, so all groups and targets are reduced together.
+    """
+    n_targets = Y.shape[1]
+    mask = ~np.isnan(Y)
+    err = np.where(mask, P - Y, 0.0)
+    actual = np.where(mask, Y, 0.0)
+    flat = (codes[:, None] * n_targets + np.arange(n_targets)).ravel()
+
+    def sums(values):
+        return np.bincount(flat, weights=values.ravel(), minlength=n_groups * n_targets).reshape(n_groups, n_targets)
+
+    count = sums(mask.astype(np.float64))
+    sq_err, abs_err, sum_err = sums(err ** 2), sums(np.abs(err)), sums(err)
+    sum_y, sum_y2, abs_y = sums(actual), sums(actual ** 2), sums(np.abs(actual))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total_ss = sum_y2 - sum_y ** 2 / count
+        return {
+            'count': count,
+            'mae': abs_err / count,
+            'rmse': np.sqrt(sq_err / count),
+            'bias': sum_err / count,
+            'wape': abs_err / abs_y,
+            'r2': np.where(total_ss > 0, 1.0 - sq_err / total_ss, np.nan),
+        }
+
+
+def _metric_dicts(metrics, group, target_cols):
+    """Row `group` of every metric array -> {target: {metric: value}} with NaN as None"""
+    out = {}
+    for j, target in enumerate(target_cols):
+        values = {}
+        for name in BACKTEST_METRICS:
+            value = float(metrics[name][group, j])
+            values[name] = int(value) if name == 'count' else (round(value, 6) if np.isfinite(value) else None)
+        out[target] = values
+    return out
+
+
+def run_backtest(bundle, content, source_name, segments=BACKTEST_SEGMENTS):
+    """Replay a history CSV through bundle and return the error report"""
+    timings = {}
+    start = time.perf_counter()
+    history = read_history(content, bundle.target_cols)
+    X, keep = encode_history(bundle.schema, history)
+    history = history[keep].reset_index(drop=True)
+    if not len(history):
+        raise BacktestInputError('No usable rows in history')
+    Y = np.column_stack([
+        pd.to_numeric(history[col], errors='coerce').to_numpy(dtype=np.float64) if col in history.columns
+        else np.full(len(history), np.nan)
+        for col in bundle.target_cols
+    ])
+    timings['encode_seconds'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    P = np.asarray(bundle.inference_engine.predict(X), dtype=np.float64)
+    timings['predict_seconds'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    overall = grouped_metrics(np.zeros(len(history), dtype=np.int64), 1, Y, P)
+    report_segments = {}
+    months = history_months(history)
+    for segment in segments:
+        if segment == 'month':
+            labels = months
+        elif segment in history.columns:
+            labels = history[segment].astype(object).where(history[segment].notna(), UNKNOWN_SEGMENT).astype(str).to_numpy()
+        else:
+            labels = None
+        if labels is None:
+            continue
+        codes, groups = pd.factorize(labels, sort=True)
+        metrics = grouped_metrics(codes, len(groups), Y, P)
+        rows = np.bincount(codes, minlength=len(groups))
+        report_segments[segment] = [
+            {'group': str(label), 'rows': int(rows[g]), 'targets': _metric_dicts(metrics, g, bundle.target_cols)}
+            for g, label in enumerate(groups)
+        ]
+    timings['metrics_seconds'] = time.perf_counter() - start
+
+    return {
+        'model_version': bundle.version,
+        'source': {'name': source_name, 'sha256': hashlib.sha256(content).hexdigest(),
+                   'rows': int(len(history)), 'rows_dropped': int((~keep).sum())},
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'timings': {key: round(value, 4) for key, value in timings.items()},
+        'overall': _metric_dicts(overall, 0, bundle.target_cols),
+        'segments': report_segments,
+    }
+
+
+class BacktestCache:
+    """Reports keyed by (model version, history sha256); oldest dropped first"""
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize if maxsize is not None else BACKTEST_CACHE_SIZE
+        self._reports = OrderedDict()
+        self._lock = threading.Lock()
+        # Serialises computation so concurrent requests for one report predict once
+        self._compute_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, bundle, content, source_name):
+        """(report, cached) for this model version and history content"""
+        key = (bundle.version, hashlib.sha256(content).hexdigest())
+        with self._compute_lock:
+            with self._lock:
+                if key in self._reports:
+                    self._reports.move_to_end(key)
+                    self.hits += 1
+                    return self._reports[key], True
+                self.misses += 1
+            report = run_backtest(bundle, content, source_name)
+            with self._lock:
+                self._reports[key] = report
+                while len(self._reports) > max(1, self.maxsize):
+                    self._reports.popitem(last=False)
+        return report, False
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._reports), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+backtest_cache = BacktestCache()
@@ -0,0 +1,325 @@
+# Seasonal time-series baseline fitted over every project's monthly actuals at once
+#
+# Each (project, target) monthly series becomes one row of a NaN-padded 2-D
+# array (rows = projects x targets, columns = months since the project's first
+# actual). Two cheap models are fitted to all rows together:
+#   ses             simple exponential smoothing, alpha picked per row from a grid
+#                   by one-step-ahead squared error
+#   seasonal_naive  the value 12 months earlier
+# and each row keeps whichever had the lower one-step-ahead MAE. Every pass is a
+# loop over the month columns with all rows vectorized, so the cost grows with
+# the longest history, not the number of projects.
+#
+# The baseline is a benchmark for the XGBoost forecasts and a fallback that does
+# not need the model loaded.
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from training.refresh import coerce_actuals
+
+BASELINE_SEASON = 12
+BASELINE_ALPHAS = np.round(np.linspace(0.1, 0.9, 9), 2)
+BASELINE_METHODS = ('ses', 'seasonal_naive')
+FORECAST_BASELINE_HORIZON = int(os.getenv('FORECAST_BASELINE_HORIZON', '36'))
+# Refit at most this often; writes of actual values mark the fit stale immediately
+FORECAST_BASELINE_TTL_SECONDS = float(os.getenv('FORECAST_BASELINE_TTL_SECONDS', '600'))
+
+
+def month_index(month):
+    return int(month[:4]) * 12 + int(month[5:7]) - 1
+
+
+def month_label(index):
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def collect_monthly_actuals(project_forecasts, material_actuals, target_cols):
+    """{project_id: {month_index: {target: value}}} from both places actuals are recorded"""
+    series = {}
+
+    def add(project_id, month, values, override):
+        if not project_id or not isinstance(month, str) or len(month) < 7:
+            return
+        try:
+            index = month_index(month)
+        except ValueError:
+            return
+        actuals = coerce_actuals(values or {}, target_cols)
+        if actuals:
+            slot = series.setdefault(project_id, {}).setdefault(index, {})
+            slot.update(actuals if override else {k: v for k, v in actuals.items() if k not in slot})
+
+    for record in material_actuals.find({}, {'_id': 0, 'project_id': 1, 'month': 1, 'material_values': 1}):
+        add(record.get('project_id'), record.get('month'), record.get('material_values'), override=False)
+    # Project-level actual values (edited in the UI) win over material actuals
+    pipeline = [
+        {'$match': {'forecasts.actual_values': {'$exists': True}}},
+        {'$unwind': '$forecasts'},
+        {'$project': {'_id': 0, 'project_id': 1, 'month': '$forecasts.forecast_month',
+                      'actual_values': '$forecasts.actual_values'}},
+    ]
+    for entry in project_forecasts.aggregate(pipeline):
+        add(entry.get('project_id'), entry.get('month'), entry.get('actual_values'), override=True)
+    return series
+
+
+def pack_series(series, target_cols):
+    """-> (project_ids, starts, lengths, Y) with Y of shape (projects * targets, max_length), NaN padded"""
+    project_ids = sorted(series)
+    starts = np.array([min(series[p]) for p in project_ids], dtype=np.int64)
+    lengths = np.array([max(series[p]) - min(series[p]) + 1 for p in project_ids], dtype=np.int64)
+    n_targets = len(target_cols)
+    Y = np.full((len(project_ids) * n_targets, int(lengths.max()) if len(lengths) else 0), np.nan)
+    target_pos = {col: j for j, col in enumerate(target_cols)}
+    # One entry per (project, month) plus flat target positions / values, expanded with np.repeat
+    base_rows, cols, counts, targets, values = [], [], [], [], []
+    for p, project_id in enumerate(project_ids):
+        for index, actuals in series[project_id].items():
+            base_rows.append(p * n_targets)
+            cols.append(index - starts[p])
+            counts.append(len(actuals))
+            targets.extend(map(target_pos.__getitem__, actuals))
+            values.extend(actuals.values())
+    if values:
+        Y[np.repeat(base_rows, counts) + np.asarray(targets), np.repeat(cols, counts)] = values
+    return project_ids, starts, lengths, Y
+
+
+def fit_ses(Y, alphas=BASELINE_ALPHAS):
+    """(level, alpha, fitted) per row; fitted[:, t] is the one-step-ahead forecast for column t"""
+    n_rows, n_cols = Y.shape
+    observed = ~np.isnan(Y)
+    # The level starts at each row's first observation; later observations update it
+    if n_cols:
+        first = np.where(observed.any(axis=1), observed.argmax(axis=1), n_cols)
+        initial = np.where(first < n_cols, Y[np.arange(n_rows), np.minimum(first, n_cols - 1)], np.nan)
+    else:
+        first, initial = np.zeros(n_rows, dtype=np.int64), np.full(n_rows, np.nan)
+    updates = observed & (np.arange(n_cols)[None, :] > first[:, None])
+    errors = updates.sum(axis=1)
+
+    # Month-major copies so each step reads contiguous columns; skipped cells contribute 0
+    values = np.ascontiguousarray(np.where(updates, Y, 0.0).T)
+    weights = np.ascontiguousarray(updates.T, dtype=np.float64)
+
+    # Pass 1: one-step squared error of every alpha for every row
+    A = alphas[:, None]
+    level = np.broadcast_to(initial, (len(alphas), n_rows)).copy()
+    sse = np.zeros((len(alphas), n_rows))
+    diff = np.empty_like(level)
+    for t in range(n_cols):
+        np.subtract(values[t], level, out=diff)
+        diff *= weights[t]
+        level += A * diff
+        diff *= diff
+        sse += diff
+    # Rows with no one-step errors to score keep a middle-of-the-grid alpha
+    best = np.where(errors > 0, np.argmin(sse, axis=0), len(alphas) // 2)
+    alpha = alphas[best]
+
+    # Pass 2: the chosen alpha only, keeping the fitted values
+    fitted = np.empty((n_cols, n_rows))
+    level = initial.copy()
+    for t in range(n_cols):
+        fitted[t] = level
+        level += alpha * (values[t] - level) * weights[t]
+    fitted = fitted.T
+    fitted[np.arange(n_cols)[None, :] <= first[:, None]] = np.nan
+    return level, alpha, fitted
+
+
+def seasonal_naive_fitted(Y, season=BASELINE_SEASON):
+    fitted = np.full(Y.shape, np.nan)
+    if Y.shape[1] > season:
+        fitted[:, season:] = Y[:, :-season]
+    return fitted
+
+
+def one_step_mae(Y, fitted, mask):
+    err = np.where(mask, np.abs(Y - fitted), 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return err.sum(axis=1) / mask.sum(axis=1)
+
+
+class BaselineFit:
+    """Fitted + forecast values for every project, target and month in one (projects, targets, months) array"""
+
+    def __init__(self, project_ids, starts, lengths, target_cols, values, methods, alphas, mae, fitted_seconds):
+        self.index = {project_id: p for p, project_id in enumerate(project_ids)}
+        self.starts = starts
+        self.lengths = lengths
+        self.target_cols = list(target_cols)
+        self.values = values
+        self.methods = methods
+        self.alphas = alphas
+        self.mae = mae
+        self.fitted_at = datetime.now(timezone.utc)
+        self.fitted_seconds = fitted_seconds
+
+    def __contains__(self, project_id):
+        return project_id in self.index
+
+    def predictions(self, project_id, month):
+        """{target: value} for one project month (in-sample one-step fit or forecast), or None"""
+        p = self.index.get(project_id)
+        if p is None:
+            return None
+        column = month_index(month) - int(self.starts[p])
+        if column < 0 or column >= self.values.shape[2]:
+            return None
+        out = {}
+        for j, target in enumerate(self.target_cols):
+            value = self.values[p, j, column]
+            if np.isfinite(value):
+                out[target] = round(float(value), 4)
+        return out or None
+
+    def project_summary(self, project_id, horizon):
+        p = self.index[project_id]
+        first = int(self.starts[p])
+        last = first + int(self.lengths[p]) - 1
+        return {
+            'project_id': project_id,
+            'history': {'first_month': month_label(first), 'last_month': month_label(last)},
+            'methods': {
+                target: {'method': BASELINE_METHODS[self.methods[p, j]],
+                         'alpha': float(self.alphas[p, j]) if self.methods[p, j] == 0 else None,
+                         'one_step_mae': round(float(self.mae[p, j]), 4) if np.isfinite(self.mae[p, j]) else None}
+                for j, target in enumerate(self.target_cols)
+            },
+            'forecasts': [
+                {'forecast_month': month_label(last + h), 'baseline': self.predictions(project_id, month_label(last + h))}
+                for h in range(1, horizon + 1)
+            ],
+        }
+
+
+def fit_baseline(series, target_cols, horizon=FORECAST_BASELINE_HORIZON, season=BASELINE_SEASON):
+    """Fit every project's series in one vectorized pass and forecast `horizon` months past each one's last actual"""
+    start = time.perf_counter()
+    project_ids, starts, lengths, Y = pack_series(series, target_cols)
+    n_targets = len(target_cols)
+    n_rows, n_cols = Y.shape
+
+    level, alpha, ses_fit = fit_ses(Y)
+    sn_fit = seasonal_naive_fitted(Y, season)
+    observed = ~np.isnan(Y)
+    # Compare the two on the months both can forecast
+    both = observed & ~np.isnan(ses_fit) & ~np.isnan(sn_fit)
+    ses_mae, sn_mae = one_step_mae(Y, ses_fit, both), one_step_mae(Y, sn_fit, both)
+    use_seasonal = both.any(axis=1) & (sn_mae < ses_mae)
+    fitted = np.where(use_seasonal[:, None] & ~np.isnan(sn_fit), sn_fit, ses_fit)
+    mae = np.where(use_seasonal, sn_mae, one_step_mae(Y, ses_fit, observed & ~np.isnan(ses_fit)))
+
+    # Forecast h = 1..horizon past each row's last column; seasonal rows repeat last year's
+    # value for that month, falling back to the SES level where it is missing
+    last = np.repeat(lengths - 1, n_targets)
+    steps = np.arange(horizon)
+    source = last[:, None] - (season - 1) + steps[None, :] % season
+    seasonal = np.take_along_axis(Y, np.clip(source, 0, max(n_cols - 1, 0)), axis=1) if n_cols else \
+        np.full((n_rows, horizon), np.nan)
+    seasonal = np.where((source >= 0) & ~np.isnan(seasonal), seasonal, level[:, None])
+    forecast = np.where(use_seasonal[:, None], seasonal, level[:, None])
+
+    values = np.full((n_rows, n_cols + horizon), np.nan)
+    values[:, :n_cols] = fitted
+    np.put_along_axis(values, last[:, None] + 1 + steps[None, :], forecast, axis=1)
+    # Rows shorter than the longest series are padded, and the SES pass carries their
+    # level through the padding; nothing past a row's own last month + horizon is a forecast
+    values[np.arange(n_cols + horizon)[None, :] > (last + horizon)[:, None]] = np.nan
+    values = np.maximum(values, 0.0)  # quantities cannot go negative
+
+    shape = (len(project_ids), n_targets)
+    return BaselineFit(project_ids, starts, lengths, target_cols, values.reshape(shape + (n_cols + horizon,)),
+                       use_seasonal.astype(np.int8).reshape(shape), alpha.reshape(shape), mae.reshape(shape),
+                       round(time.perf_counter() - start, 4))
+
+
+class BaselineEngine:
+    """Lazily (re)fitted baseline shared by the forecast routes.
+
+    Only the first read (or one after the model's targets changed) fits inline;
+    a stale or expired fit keeps being served while a background thread refits.
+    """
+
+    def __init__(self, project_forecasts, material_actuals, ttl_seconds=None, horizon=None):
+        self.project_forecasts = project_forecasts
+        self.material_actuals = material_actuals
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else FORECAST_BASELINE_TTL_SECONDS
+        self.horizon = horizon if horizon is not None else FORECAST_BASELINE_HORIZON
+        self._fit = None
+        self._fit_key = None
+        self._stale = True
+        self._lock = threading.Lock()
+        self._refit_lock = threading.Lock()  # one fit at a time
+        self._refitting = False
+        self.fits = 0
+
+    def invalidate(self):
+        """Actual values changed; the next read starts a refit"""
+        self._stale = True
+
+    def _expired(self, fit):
+        return self._stale or (datetime.now(timezone.utc) - fit.fitted_at).total_seconds() > self.ttl_seconds
+
+    def _refit(self, key):
+        with self._refit_lock:
+            fit = self._fit
+            if fit is not None and self._fit_key == key and not self._expired(fit):
+                return fit  # another thread just finished it
+            # Cleared first, so actuals written during the fit mark the new fit stale again
+            self._stale = False
+            series = collect_monthly_actuals(self.project_forecasts, self.material_actuals, list(key))
+            fit = fit_baseline(series, list(key), self.horizon)
+            with self._lock:
+                self._fit, self._fit_key = fit, key
+                self.fits += 1
+            return fit
+
+    def _refit_in_background(self, key):
+        def run():
+            try:
+                self._refit(key)
+            except Exception as e:
+                print(f"Baseline refit failed: {e}")
+            finally:
+                with self._lock:
+                    self._refitting = False
+
+        with self._lock:
+            if self._refitting:
+                return
+            self._refitting = True
+        threading.Thread(target=run, name='baseline-refit', daemon=True).start()
+
+    def current(self, target_cols):
+        """The fit for these target columns; a stale or expired one is served while it refits"""
+        key = tuple(target_cols)
+        with self._lock:
+            fit, fit_key = self._fit, self._fit_key
+        if fit is not None and fit_key == key:
+            if self._expired(fit):
+                self._refit_in_background(key)
+            return fit
+        # Nothing usable to serve yet (first read, or the model's targets changed)
+        return self._refit(key)
+
+    def stats(self):
+        fit = self._fit
+        return {
+            'fits': self.fits,
+            'stale': self._stale,
+            'refitting': self._refitting,
+            'ttl_seconds': self.ttl_seconds,
+            'horizon': self.horizon,
+            'projects': len(fit.index) if fit else 0,
+            'series_months': int(fit.values.shape[2] - self.horizon) if fit else 0,
+            'fitted_at': fit.fitted_at.isoformat() if fit else None,
+            'fit_seconds': fit.fitted_seconds if fit else None,
+            'seasonal_share': round(float(fit.methods.mean()), 4) if fit and fit.methods.size else None,
+        }
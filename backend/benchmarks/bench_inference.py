@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Per-request forecast latency: DataFrame + model.predict vs the inference engines
+(sklearn wrapper, XGBoost boosters, pure-NumPy tree arrays).
+Run from the backend directory:  python benchmarks/bench_inference.py
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from compact_model import load_model_artifact  # noqa: E402
+from inference import ENGINES, SklearnInferenceEngine  # noqa: E402
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000.0)
+
+
+def time_calls(fn, rows, repeat):
+    samples = []
+    for i in range(repeat):
+        row = rows[i % len(rows)]
+        start = time.perf_counter()
+        fn(row)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--model-dir', default='..', help='Directory holding the joblib artifacts')
+    parser.add_argument('--model-file', default='multi_xgb_model.joblib', help='Joblib model or compact model_compact.json')
+    parser.add_argument('--repeat', type=int, default=500)
+    parser.add_argument('--batch-sizes', default='1,8,64,512', help='Comma-separated batch sizes for the throughput sweep')
+    args = parser.parse_args()
+
+    model = load_model_artifact(os.path.join(args.model_dir, args.model_file))
+    # Root artifacts use feature_cols1.joblib, registry versions feature_cols.joblib
+    feature_cols_path = os.path.join(args.model_dir, 'feature_cols1.joblib')
+    if not os.path.exists(feature_cols_path):
+        feature_cols_path = os.path.join(args.model_dir, 'feature_cols.joblib')
+    feature_cols = joblib.load(feature_cols_path)
+
+    batch_sizes = [int(b) for b in args.batch_sizes.split(',') if b.strip()]
+    rng = np.random.default_rng(42)
+    X = rng.uniform(0, 10, size=(max(batch_sizes + [64]), len(feature_cols))).astype(np.float32)
+    X[:, feature_cols.index('budget')] = rng.uniform(1e7, 6e7, size=X.shape[0]) if 'budget' in feature_cols else X[:, 0]
+    dict_rows = [dict(zip(feature_cols, map(float, row))) for row in X]
+
+    # Baseline: what /api/forecast did before - one-row DataFrame, column reindex, sklearn wrapper
+    def legacy(row_dict):
+        input_df = pd.DataFrame([row_dict])
+        return model.predict(input_df[feature_cols])
+
+    results = {'legacy (DataFrame + model.predict)': time_calls(legacy, dict_rows, args.repeat)}
+    reference = SklearnInferenceEngine(model, feature_cols).predict(X)
+    engines = {}
+    for name, engine_cls in ENGINES.items():
+        start = time.perf_counter()
+        engine = engines[name] = engine_cls(model, feature_cols)
+        build_ms = (time.perf_counter() - start) * 1000
+        max_diff = float(np.max(np.abs(engine.predict(X) - reference)))
+        print(f"{name} engine built in {build_ms:.1f} ms" + (f", {engine.nbytes() / 1024:.0f} KiB of tree arrays" if hasattr(engine, 'nbytes') else ''))
+        results[f'{name} engine (max |diff| {max_diff:.2e})'] = time_calls(
+            lambda row: engine.predict(row.reshape(1, -1)), list(X), args.repeat
+        )
+
+    print(f"Single-row latency over {args.repeat} calls ({len(feature_cols)} features)")
+    print(f"{'path':55s} {'mean ms':>9s} {'p50 ms':>9s} {'p95 ms':>9s}")
+    for name, samples in results.items():
+        print(f"{name:55s} {np.mean(samples) * 1000:9.3f} {percentile_ms(samples, 50):9.3f} {percentile_ms(samples, 95):9.3f}")
+
+    print("\nMean ms per predict call by batch size")
+    print(f"{'engine':12s}" + ''.join(f"{b:>10d}" for b in batch_sizes))
+    for name, engine in engines.items():
+        cells = []
+        for b in batch_sizes:
+            samples = time_calls(lambda _: engine.predict(X[:b]), [None], 20)
+            cells.append(f"{np.mean(samples) * 1000:10.3f}")
+        print(f"{name:12s}" + ''.join(cells))
+
+
+if __name__ == '__main__':
+    main()
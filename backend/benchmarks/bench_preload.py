@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Per-worker resident memory with and without PRELOAD_SHARED.
+
+Forks N worker processes the way gunicorn does and measures each one's RSS,
+PSS and shared/private pages (/proc/<pid>/smaps_rollup) after it has served
+some forecast predicts and dataset analytics:
+  per-worker  every worker loads the model and dataset itself (gunicorn without --preload)
+  preload     the master loads both once and forks; workers share them copy-on-write
+Summed PSS is the real combined footprint. Each mode runs in a fresh interpreter.
+Run from the backend directory:  python benchmarks/bench_preload.py [--workers 4]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# numpy / pandas / xgboost are imported inside the functions: in per-worker mode
+# each worker imports them itself, as a gunicorn worker without --preload does
+MODES = ('per-worker', 'preload')
+
+
+def load_state(args):
+    import pandas as pd
+    from model_registry import ModelRegistry
+    from preload import load_columnar_dataset
+
+    registry = ModelRegistry(args.registry_dir, legacy_dir=args.legacy_dir, reference_csv=args.data)
+    bundle = registry.load_active()
+    if args.raw_dataset:
+        df = pd.read_csv(args.data)
+    else:
+        df = load_columnar_dataset(args.data)
+    return bundle, df
+
+
+def serve(bundle, df, requests):
+    """What a worker does between requests: predicts plus the dataset analytics routes"""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(os.getpid())
+    target_cols = [col for col in bundle.target_cols if col in df.columns]
+    for _ in range(requests):
+        X = rng.uniform(0, 10, size=(64, len(bundle.feature_cols))).astype(np.float32)
+        bundle.inference_engine.predict(X)
+    if 'project_id' in df.columns and target_cols:
+        df.groupby('project_id', observed=True)[target_cols].sum()
+    if 'timestamp' in df.columns and target_cols:
+        timestamps = df['timestamp']
+        if not pd.api.types.is_datetime64_any_dtype(timestamps):
+            # A raw read_csv frame still holds strings, parsed per request as the old route did
+            timestamps = pd.to_datetime(timestamps, dayfirst=True)
+        df.groupby(timestamps.dt.to_period('M'))[target_cols].sum()
+
+
+def _worker(args, shared, results, done):
+    from preload import process_memory
+
+    bundle, df = shared if shared is not None else load_state(args)
+    serve(bundle, df, args.requests)
+    results.put(process_memory())
+    # Stay alive until every worker is measured, so shared pages are counted as shared
+    done.wait()
+
+
+def run_mode(args):
+    ctx = multiprocessing.get_context('fork')
+    shared = None
+    if args.run_mode == 'preload':
+        from preload import freeze_for_fork
+        shared = load_state(args)
+        freeze_for_fork()
+    results, done = ctx.Queue(), ctx.Event()
+    workers = [ctx.Process(target=_worker, args=(args, shared, results, done)) for _ in range(args.workers)]
+    for w in workers:
+        w.start()
+    memory = [results.get(timeout=args.timeout) for _ in workers]
+    from preload import process_memory
+    master = process_memory()
+    done.set()
+    for w in workers:
+        w.join()
+    print(json.dumps({'mode': args.run_mode, 'master': master, 'workers': memory}))
+
+
+def mb(value):
+    return f'{value / 1e6:9.1f}' if value is not None else f"{'-':>9s}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=50, help='Predict calls per worker before measuring')
+    parser.add_argument('--registry-dir', help='Model registry directory (default: MODEL_REGISTRY_DIR or ../models)')
+    parser.add_argument('--legacy-dir', default='..', help='Directory holding the legacy root artifacts')
+    parser.add_argument('--data', default='../powergrid_realistic_material_dataset1.csv')
+    parser.add_argument('--raw-dataset', action='store_true', help='Load the dataset with plain read_csv (no columnar layout)')
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--run-mode', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        run_mode(args)
+        return
+
+    reports = []
+    for mode in MODES:
+        command = [sys.executable, os.path.abspath(__file__), '--run-mode', mode] + sys.argv[1:]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        reports.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{args.workers} workers, {args.requests} predicts each"
+          f"{' (raw read_csv dataset)' if args.raw_dataset else ''}; MB per process\n")
+    print(f"{'mode':12s} {'process':>10s} {'RSS':>9s} {'PSS':>9s} {'shared':>9s} {'private':>9s}")
+    for report in reports:
+        rows = [('master', report['master'])] + [(str(m['pid']), m) for m in report['workers']]
+        for name, m in rows:
+            print(f"{report['mode']:12s} {name:>10s} {mb(m.get('rss_bytes'))} {mb(m.get('pss_bytes'))} "
+                  f"{mb(m.get('shared_bytes'))} {mb(m.get('private_bytes'))}")
+        pss = [m.get('pss_bytes') for _, m in rows]
+        if all(value is not None for value in pss):
+            print(f"{report['mode']:12s} {'total PSS':>10s} {'':9s} {mb(sum(pss))}")
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+# Compact model artifact: native XGBoost boosters instead of a pickled sklearn wrapper
+#
+# Layout inside a registry version directory:
+#   model_compact.json        <- index: format, feature names, per-target booster file + params
+#   boosters/00.ubj ...       <- Booster.save_raw('ubj'), one per target
+#
+# Loading it builds bare xgb.Booster objects (no MultiOutputRegressor, no
+# XGBRegressor state), which is what the inference engines use anyway.
+# Optional pruning drops the lowest-gain trees while the prediction shift on a
+# reference matrix stays within a stated budget.
+
+import json
+import os
+
+import joblib
+import numpy as np
+import xgboost as xgb
+
+from inference import _parse_base_score
+
+COMPACT_INDEX_FILE = 'model_compact.json'
+COMPACT_FORMAT = 'xgboost-ubj'
+BOOSTER_DIR = 'boosters'
+
+
+def _json_params(params):
+    """Constructor params worth keeping: set, JSON-serialisable, not callables"""
+    kept = {}
+    for key, value in params.items():
+        if value is None or callable(value):
+            continue
+        try:
+            json.dumps(value)
+        except TypeError:
+            continue
+        kept[key] = value
+    return kept
+
+
+class CompactEstimator:
+    """Stand-in for a fitted XGBRegressor: the native booster plus its constructor params"""
+
+    def __init__(self, booster, params=None, missing=np.nan):
+        self._booster = booster
+        self.params = dict(params or {})
+        self.missing = missing
+        self.n_features_in_ = booster.num_features()
+
+    def get_booster(self):
+        return self._booster
+
+    def get_params(self, deep=True):
+        return dict(self.params)
+
+    def predict(self, X):
+        return self._booster.inplace_predict(np.asarray(X, dtype=np.float32), missing=self.missing,
+                                             validate_features=False)
+
+
+class CompactMultiOutputModel:
+    """The MultiOutputRegressor surface the API relies on (estimators_, predict)"""
+
+    def __init__(self, estimators, feature_names):
+        self.estimators_ = list(estimators)
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        self.n_features_in_ = len(feature_names)
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        return np.column_stack([est.predict(X) for est in self.estimators_])
+
+
+def serving_booster(estimator):
+    """The booster an estimator predicts with, cut at best_iteration when early stopping set one"""
+    booster = estimator.get_booster()
+    try:
+        return booster[:estimator.best_iteration + 1]
+    except AttributeError:
+        return booster
+
+
+def tree_gains(booster):
+    """Total split gain (loss reduction) of every tree, in booster order"""
+    trees = json.loads(booster.save_raw('json'))['learner']['gradient_booster']['model']['trees']
+    gains = np.empty(len(trees))
+    for i, tree in enumerate(trees):
+        internal = np.asarray(tree['left_children']) != -1
+        gains[i] = np.asarray(tree['loss_changes'], dtype=np.float64)[internal].sum()
+    return gains
+
+
+def drop_trees(booster, remove):
+    """New booster without the trees whose indices are in `remove` (gbtree, one tree per round)"""
+    config = json.loads(booster.save_raw('json'))
+    model = config['learner']['gradient_booster']['model']
+    remove = set(int(i) for i in remove)
+    kept = [tree for i, tree in enumerate(model['trees']) if i not in remove]
+    for new_id, tree in enumerate(kept):
+        tree['id'] = new_id
+    model['trees'] = kept
+    model['tree_info'] = [0] * len(kept)
+    model['iteration_indptr'] = list(range(len(kept) + 1))
+    model['gbtree_model_param']['num_trees'] = str(len(kept))
+    pruned = xgb.Booster()
+    pruned.load_model(bytearray(json.dumps(config).encode()))
+    return pruned
+
+
+def prune_booster(booster, X, tolerance):
+    """Drop the lowest-gain trees while RMSE(pruned - original) <= tolerance * std(original).
+
+    Each tree's contribution on X is computed once, so the number of trees to
+    drop is chosen from a cumulative sum rather than by re-predicting.
+    Returns (booster, report).
+    """
+    n_trees = booster.num_boosted_rounds()
+    config = json.loads(booster.save_raw('json'))
+    if config['learner']['gradient_booster']['name'] != 'gbtree' or \
+            int(config['learner']['gradient_booster']['model']['gbtree_model_param']['num_parallel_tree']) != 1:
+        return booster, {'trees_before': n_trees, 'trees_after': n_trees, 'skipped': 'unsupported booster'}
+    X = np.asarray(X, dtype=np.float32)
+    base_score = _parse_base_score(config['learner']['learner_model_param']['base_score'])
+    original = booster.inplace_predict(X, validate_features=False)
+    budget = tolerance * max(float(np.std(original)), 1e-12)
+
+    order = np.argsort(tree_gains(booster), kind='stable')
+    contributions = np.column_stack([
+        booster.inplace_predict(X, iteration_range=(t, t + 1), validate_features=False) - base_score
+        for t in order
+    ])
+    shift_rmse = np.sqrt(np.mean(np.cumsum(contributions, axis=1) ** 2, axis=0))
+    # Keep at least one tree; shift_rmse[k - 1] is the error after dropping the k lowest-gain trees
+    within = np.nonzero(shift_rmse[:n_trees - 1] <= budget)[0]
+    n_drop = int(within[-1]) + 1 if within.size else 0
+    report = {'trees_before': n_trees, 'trees_after': n_trees - n_drop,
+              'shift_rmse': float(shift_rmse[n_drop - 1]) if n_drop else 0.0, 'budget_rmse': budget}
+    if n_drop == 0:
+        return booster, report
+    return drop_trees(booster, order[:n_drop]), report
+
+
+def compact_model(model, X_reference=None, prune_tolerance=0.0):
+    """Convert a fitted multi-output XGBoost model into a CompactMultiOutputModel.
+
+    With prune_tolerance > 0 (and a reference matrix), low-gain trees are
+    dropped per target within that relative prediction-shift budget.
+    Returns (model, report).
+    """
+    feature_names = list(getattr(model, 'feature_names_in_', []))
+    estimators, targets = [], []
+    for est in model.estimators_:
+        booster = serving_booster(est)
+        if not feature_names and booster.feature_names:
+            feature_names = list(booster.feature_names)
+        target_report = {'trees_before': booster.num_boosted_rounds()}
+        if prune_tolerance > 0 and X_reference is not None:
+            booster, target_report = prune_booster(booster, X_reference, prune_tolerance)
+        estimators.append(CompactEstimator(booster, _json_params(est.get_params()), getattr(est, 'missing', np.nan)))
+        target_report.setdefault('trees_after', booster.num_boosted_rounds())
+        targets.append(target_report)
+    report = {
+        'format': COMPACT_FORMAT,
+        'prune_tolerance': prune_tolerance,
+        'trees_before': sum(t['trees_before'] for t in targets),
+        'trees_after': sum(t['trees_after'] for t in targets),
+        'targets': targets,
+    }
+    return CompactMultiOutputModel(estimators, feature_names), report
+
+
+def save_compact_model(model, directory):
+    """Write boosters and index into directory; returns the relative paths written"""
+    os.makedirs(os.path.join(directory, BOOSTER_DIR), exist_ok=True)
+    entries, files = [], []
+    for i, est in enumerate(model.estimators_):
+        filename = f'{BOOSTER_DIR}/{i:02d}.ubj'
+        with open(os.path.join(directory, filename), 'wb') as f:
+            f.write(serving_booster(est).save_raw('ubj'))
+        entries.append({'file': filename, 'params': _json_params(est.get_params()),
+                        'missing': None if np.isnan(getattr(est, 'missing', np.nan)) else float(est.missing)})
+        files.append(filename)
+    index = {
+        'format': COMPACT_FORMAT,
+        'xgboost_version': xgb.__version__,
+        'feature_names': [str(name) for name in model.feature_names_in_],
+        'boosters': entries,
+    }
+    with open(os.path.join(directory, COMPACT_INDEX_FILE), 'w') as f:
+        json.dump(index, f, indent=2)
+    return files + [COMPACT_INDEX_FILE]
+
+
+def load_compact_model(index_path):
+    with open(index_path) as f:
+        index = json.load(f)
+    if index.get('format') != COMPACT_FORMAT:
+        raise ValueError(f"{index_path} is not a {COMPACT_FORMAT} model index")
+    directory = os.path.dirname(index_path)
+    estimators = []
+    for entry in index['boosters']:
+        booster = xgb.Booster()
+        booster.load_model(os.path.join(directory, entry['file']))
+        missing = np.nan if entry.get('missing') is None else entry['missing']
+        estimators.append(CompactEstimator(booster, entry.get('params'), missing))
+    return CompactMultiOutputModel(estimators, index['feature_names'])
+
+
+def load_model_artifact(path):
+    """Load either artifact format: a compact index (.json) or a joblib pickle"""
+    if path.endswith('.json'):
+        return load_compact_model(path)
+    return joblib.load(path)
@@ -0,0 +1,239 @@
+# Streaming input-drift monitor for forecast requests
+#
+# Reference histograms are built once per model version from the training CSV,
+# encoded through the model's FeatureSchema exactly like live requests:
+#   numeric features      decile bins of the reference values, plus one bin
+#                         below the reference minimum and one above the maximum
+#   categorical features  one bin per reference code, plus one for anything else
+# Live requests only bump fixed-size (features x bins) counters: one bin lookup
+# and one counter increment per feature and row. Counts are kept for the current
+# and the previous window (FORECAST_DRIFT_WINDOW_SECONDS) and since start, so
+# memory is constant however much traffic arrives.
+#
+# Drift is scored per feature with the population stability index (PSI) of the
+# recent windows against the reference.
+
+import bisect
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from backtest import encode_history
+
+FORECAST_DRIFT_ENABLED = os.getenv('FORECAST_DRIFT_ENABLED', 'true').lower() == 'true'
+FORECAST_DRIFT_WINDOW_SECONDS = float(os.getenv('FORECAST_DRIFT_WINDOW_SECONDS', '3600'))
+FORECAST_DRIFT_BINS = int(os.getenv('FORECAST_DRIFT_BINS', '10'))
+# Usual PSI reading: below 0.1 stable, up to 0.25 moderate shift, above that drift
+PSI_THRESHOLDS = (0.1, 0.25)
+PSI_EPSILON = 1e-4
+# Requests up to this many rows are binned with bisect on plain lists, which is
+# far cheaper than a round of numpy calls per feature for one or two rows
+SMALL_BATCH_ROWS = 16
+
+
+class ReferenceHistograms:
+    """Bin layout and reference distribution of every feature for one model version"""
+
+    def __init__(self, version, schema, X_ref, n_bins=FORECAST_DRIFT_BINS, source=None):
+        self.version = version
+        self.source = source
+        self.rows = int(X_ref.shape[0])
+        self.features = [spec.name for spec in schema.specs]
+        self.categorical = [spec.categorical for spec in schema.specs]
+        self.cuts = []
+        sizes = []
+        for spec in schema.specs:
+            column = X_ref[:, spec.index]
+            if spec.categorical:
+                cuts = np.unique(column)
+                sizes.append(cuts.size + 1)
+            else:
+                inner = np.quantile(column, np.linspace(0, 1, n_bins + 1)[1:-1]) if column.size else np.empty(0)
+                low, high = (column.min(), column.max()) if column.size else (0.0, 0.0)
+                # Bin 0 is below the reference minimum, the last bin above its maximum
+                cuts = np.unique(np.concatenate([[low], inner, [np.nextafter(np.float32(high), np.float32(np.inf))]]))
+                sizes.append(cuts.size + 1)
+            self.cuts.append(cuts.astype(np.float32))
+        self._cut_lists = [cuts.tolist() for cuts in self.cuts]
+        self.n_bins = np.asarray(sizes)
+        self.width = int(self.n_bins.max()) if len(sizes) else 1
+        self.valid = np.arange(self.width)[None, :] < self.n_bins[:, None]
+        self.counts = self.bin_counts(X_ref)
+
+    def bin_index(self, X):
+        """(rows, features) bin of every value"""
+        X = np.asarray(X, dtype=np.float32)
+        bins = np.empty(X.shape, dtype=np.int64)
+        for f, cuts in enumerate(self.cuts):
+            column = X[:, f]
+            if self.categorical[f]:
+                if not cuts.size:
+                    bins[:, f] = 0
+                    continue
+                # Exact code match, anything else lands in the trailing 'other' bin
+                position = np.minimum(np.searchsorted(cuts, column), cuts.size - 1)
+                bins[:, f] = np.where(cuts[position] == column, position, cuts.size)
+            else:
+                bins[:, f] = np.searchsorted(cuts, column, side='right')
+        return bins
+
+    def flat_bins(self, X):
+        """feature * width + bin for every value of X, in row-major order"""
+        if len(X) > SMALL_BATCH_ROWS:
+            return (np.arange(len(self.features))[None, :] * self.width + self.bin_index(X)).ravel()
+        flat = []
+        for row in np.asarray(X, dtype=np.float32).tolist():
+            for f, (value, cuts) in enumerate(zip(row, self._cut_lists)):
+                if self.categorical[f]:
+                    position = bisect.bisect_left(cuts, value)
+                    b = position if position < len(cuts) and cuts[position] == value else len(cuts)
+                else:
+                    b = bisect.bisect_right(cuts, value)
+                flat.append(f * self.width + b)
+        return flat
+
+    def bin_counts(self, X):
+        """(features, width) histogram of X in this layout"""
+        flat = self.flat_bins(X)
+        return np.bincount(flat, minlength=len(self.features) * self.width).reshape(len(self.features), self.width)
+
+    def bin_labels(self, f):
+        cuts = self.cuts[f]
+        if self.categorical[f]:
+            return [str(int(c)) for c in cuts] + ['other']
+        labels = [f'< {cuts[0]:g}'] if cuts.size else []
+        labels += [f'[{cuts[i]:g}, {cuts[i + 1]:g})' for i in range(cuts.size - 1)]
+        return labels + [f'>= {cuts[-1]:g}' if cuts.size else 'all']
+
+
+def population_stability(live, reference, valid):
+    """PSI per feature (row) between two (features, width) count matrices"""
+    def shares(counts):
+        counts = np.where(valid, counts, 0).astype(np.float64)
+        totals = counts.sum(axis=1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            p = np.where(totals > 0, counts / totals, 0.0)
+        return np.where(valid, np.maximum(p, PSI_EPSILON), 1.0)
+    p, q = shares(live), shares(reference)
+    return np.where(valid, (p - q) * np.log(p / q), 0.0).sum(axis=1)
+
+
+def drift_status(psi):
+    if psi is None:
+        return 'no_data'
+    return 'stable' if psi < PSI_THRESHOLDS[0] else ('moderate' if psi < PSI_THRESHOLDS[1] else 'drift')
+
+
+class DriftMonitor:
+    def __init__(self, reference_csv, window_seconds=None, n_bins=None, enabled=None):
+        self.reference_csv = reference_csv
+        self.window_seconds = window_seconds if window_seconds is not None else FORECAST_DRIFT_WINDOW_SECONDS
+        self.n_bins = n_bins if n_bins is not None else FORECAST_DRIFT_BINS
+        self.enabled = enabled if enabled is not None else FORECAST_DRIFT_ENABLED
+        self.reference = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, reference):
+        shape = (len(reference.features), reference.width) if reference else (0, 1)
+        self.current = np.zeros(shape, dtype=np.int64)
+        self.previous = np.zeros(shape, dtype=np.int64)
+        self.total = np.zeros(shape, dtype=np.int64)
+        self.window_started = time.monotonic()
+        self.rows_observed = 0
+
+    def load_reference(self, bundle):
+        """Build reference histograms for bundle (called on every model swap); resets live counts"""
+        if not self.enabled:
+            return None
+        try:
+            history = pd.read_csv(self.reference_csv, usecols=lambda c: c in bundle.schema)
+            X_ref, _ = encode_history(bundle.schema, history)
+            reference = ReferenceHistograms(bundle.version, bundle.schema, X_ref, self.n_bins,
+                                            source=os.path.basename(self.reference_csv))
+        except Exception as e:
+            self.last_error = f'{bundle.version}: {e}'
+            print(f"Drift reference unavailable for model {bundle.version}: {e}")
+            reference = None
+        with self._lock:
+            self.reference = reference
+            self._reset(reference)
+        return reference
+
+    def observe(self, version, X):
+        """Count encoded request rows against the reference of their model version"""
+        reference = self.reference
+        if reference is None or reference.version != version or not len(X):
+            return
+        flat = reference.flat_bins(X)
+        with self._lock:
+            if reference is not self.reference:
+                return
+            now = time.monotonic()
+            if now - self.window_started >= self.window_seconds:
+                # A window with no traffic at all leaves nothing to compare against
+                stale = now - self.window_started >= 2 * self.window_seconds
+                self.previous = np.zeros_like(self.current) if stale else self.current
+                self.current = np.zeros_like(self.current)
+                self.window_started = now
+            if isinstance(flat, list):
+                current, total = self.current.reshape(-1), self.total.reshape(-1)
+                for index in flat:
+                    current[index] += 1
+                    total[index] += 1
+            else:
+                counts = np.bincount(flat, minlength=self.current.size).reshape(self.current.shape)
+                self.current += counts
+                self.total += counts
+            self.rows_observed += len(X)
+
+    def report(self, detail=False):
+        with self._lock:
+            reference = self.reference
+            if reference is None:
+                return {'enabled': self.enabled, 'model_version': None, 'last_error': self.last_error, 'features': []}
+            recent = self.current + self.previous
+            total = self.total.copy()
+            rows_observed = self.rows_observed
+        live_rows = recent.sum(axis=1)
+        psi = population_stability(recent, reference.counts, reference.valid)
+        features = []
+        for f, name in enumerate(reference.features):
+            score = float(psi[f]) if live_rows[f] else None
+            entry = {
+                'feature': name,
+                'psi': round(score, 4) if score is not None else None,
+                'status': drift_status(score),
+                'recent_rows': int(live_rows[f]),
+            }
+            width = int(reference.n_bins[f])
+            if not reference.categorical[f] and live_rows[f]:
+                # Share of recent inputs outside the range seen in training
+                entry['out_of_range_share'] = round(float((recent[f, 0] + recent[f, width - 1]) / live_rows[f]), 4)
+            elif live_rows[f]:
+                entry['unseen_category_share'] = round(float(recent[f, width - 1] / live_rows[f]), 4)
+            if detail:
+                ref_total = max(int(reference.counts[f].sum()), 1)
+                entry['bins'] = [
+                    {'bin': label, 'reference_share': round(float(reference.counts[f, b] / ref_total), 4),
+                     'recent_share': round(float(recent[f, b] / live_rows[f]), 4) if live_rows[f] else None,
+                     'total_count': int(total[f, b])}
+                    for b, label in enumerate(reference.bin_labels(f))
+                ]
+            features.append(entry)
+        scored = [e for e in features if e['psi'] is not None]
+        return {
+            'enabled': self.enabled,
+            'model_version': reference.version,
+            'reference': {'source': reference.source, 'rows': reference.rows},
+            'window_seconds': self.window_seconds,
+            'rows_observed': rows_observed,
+            'max_psi': max((e['psi'] for e in scored), default=None),
+            'drifted_features': [e['feature'] for e in scored if e['status'] == 'drift'],
+            'thresholds': {'moderate': PSI_THRESHOLDS[0], 'drift': PSI_THRESHOLDS[1]},
+            'features': features,
+        }
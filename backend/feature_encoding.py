@@ -0,0 +1,84 @@
+# Precompiled categorical encoding tables
+# load_models() turns each fitted LabelEncoder into a plain lookup so request
+# handlers never call LabelEncoder.transform (searchsorted + list wrapping).
+
+import numpy as np
+
+CATEGORICAL_FEATURES = ['project_location', 'tower_type', 'substation_type', 'region_risk_flag']
+
+# Code encode_column gives a missing value (None, what FeatureSchema keeps for an
+# omitted categorical) and values absent from the table. Request payloads never
+# carry the latter (FeatureSchema rejects unknown labels); it only covers
+# history rows encoded without validation, e.g. backtest uploads.
+UNKNOWN_CATEGORY_CODE = 0
+
+
+def _canonical(value):
+    """Normalise a raw payload value to the string form used as a table key"""
+    if isinstance(value, (bool, np.bool_)):
+        return str(value)
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        return str(int(value)) if float(value).is_integer() else str(float(value))
+    return str(value).strip()
+
+
+class EncodingTable:
+    def __init__(self, classes, labels=None, unknown_code=UNKNOWN_CATEGORY_CODE):
+        """classes: encoder.classes_ (index == code); labels: optional original
+        string labels aligned with classes, registered as extra keys"""
+        self.unknown_code = int(unknown_code)
+        self.lookup = {}
+        for code, cls in enumerate(classes):
+            self.lookup[_canonical(cls)] = code
+        for code, label in enumerate(labels or []):
+            self.lookup.setdefault(_canonical(label), code)
+        # Sorted key/code arrays for vectorized column encoding
+        keys = sorted(self.lookup)
+        self._keys = np.array(keys, dtype=str)
+        self._codes = np.array([self.lookup[k] for k in keys], dtype=np.int32)
+        # Display label per code: the recovered string label, else the class itself
+        self._labels = [_canonical(label) for label in labels] if labels else [_canonical(cls) for cls in classes]
+
+    def __contains__(self, value):
+        return value is not None and _canonical(value) in self.lookup
+
+    def label(self, value):
+        """Class label of a label, code or code string; None if the table does not know it"""
+        code = self.lookup.get(_canonical(value)) if value is not None else None
+        return self._labels[code] if code is not None else None
+
+    def encode_column(self, values):
+        """Encode a whole column at once; returns an int32 array"""
+        canon = np.array([_canonical(v) if v is not None else '' for v in values], dtype=str)
+        if canon.size == 0 or self._keys.size == 0:
+            return np.full(canon.shape, self.unknown_code, dtype=np.int32)
+        idx = np.searchsorted(self._keys, canon)
+        idx = np.minimum(idx, self._keys.size - 1)
+        found = self._keys[idx] == canon
+        return np.where(found, self._codes[idx], self.unknown_code).astype(np.int32)
+
+
+def compile_label_encoders(label_encoders, reference_df=None):
+    """Build an EncodingTable per fitted LabelEncoder.
+
+    The shipped label_encoders.joblib was fitted on columns that were already
+    integer coded, so its classes_ are 0..n-1 and the string labels the UI
+    sends ('North', '132 kV AIS', ...) were always unknown. When that is the
+    case and reference_df has the raw column, the labels are recovered in
+    LabelEncoder order (sorted unique values) so strings encode correctly.
+    """
+    tables = {}
+    for col, encoder in (label_encoders or {}).items():
+        classes = list(getattr(encoder, 'classes_', []))
+        labels = None
+        integer_coded = len(classes) > 0 and all(
+            isinstance(c, (int, np.integer)) for c in classes
+        ) and [int(c) for c in classes] == list(range(len(classes)))
+        if integer_coded and reference_df is not None and col in reference_df.columns:
+            uniques = sorted(str(v) for v in reference_df[col].dropna().unique())
+            if len(uniques) == len(classes):
+                labels = uniques
+        tables[col] = EncodingTable(classes, labels)
+    return tables
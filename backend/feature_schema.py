@@ -0,0 +1,176 @@
+# Declarative forecast input schema, compiled once per model version
+#
+# Every forecast entry point (single, multi-month, batch, sweep, refresh) turns
+# request payloads into model rows through FeatureSchema: defaults for missing
+# fields, numeric coercion with range checks, and categorical encoding via the
+# precompiled EncodingTables. Problems come back as a list of structured
+# errors instead of silently falling back to defaults.
+
+import math
+
+import numpy as np
+
+from feature_encoding import CATEGORICAL_FEATURES
+
+# Value used when a request omits a feature (or sends null / "")
+FEATURE_DEFAULTS = {
+    'budget': 30000000.0,
+    'tax_rate': 18.0,
+    'project_size_km': 100.0,
+    'project_start_month': 1.0,
+    'project_end_month': 12.0,
+    'lead_time_days': 45.0,
+    'commodity_price_index': 105.0,
+}
+FALLBACK_DEFAULT = 0.0
+
+# Inclusive (min, max) sanity bounds for numeric features; None leaves that side
+# open. These reject impossible inputs, not values outside the training data.
+# Categorical features are checked against their encoder's classes instead.
+FEATURE_RANGES = {
+    'budget': (0.0, None),
+    'tax_rate': (0.0, 100.0),
+    'project_size_km': (0.0, None),
+    'project_start_month': (1.0, 12.0),
+    'project_end_month': (1.0, 12.0),
+    'lead_time_days': (0.0, None),
+    'commodity_price_index': (0.0, None),
+}
+
+
+class FeatureValidationError(ValueError):
+    """Raised with every problem found in one payload: [{'field', 'error', 'value'}],
+    plus 'allowed' (the accepted labels and codes) for categorical fields"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join(f"{e['field']}: {e['error']}" for e in errors))
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+class FeatureSpec:
+    __slots__ = ('name', 'index', 'default', 'minimum', 'maximum', 'table')
+
+    def __init__(self, name, index, table=None):
+        self.name = name
+        self.index = index
+        self.table = table
+        # An omitted categorical stays None (encoded as UNKNOWN_CATEGORY_CODE), so
+        # consumers of validated rows can tell it apart from an explicit class
+        self.default = None if table is not None else FEATURE_DEFAULTS.get(name, FALLBACK_DEFAULT)
+        self.minimum, self.maximum = FEATURE_RANGES.get(name, (None, None))
+
+    @property
+    def categorical(self):
+        return self.table is not None
+
+    def coerce(self, value):
+        """Raw request value -> (clean value, error message or None)"""
+        if _is_missing(value):
+            return self.default, None
+        if self.categorical:
+            if isinstance(value, (dict, list)):
+                return None, 'must be a label or code'
+            if value not in self.table:
+                return None, 'unknown value'
+            return value, None
+        if isinstance(value, bool):
+            return None, 'must be a number'
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return None, 'must be a number'
+        if not math.isfinite(number):
+            return None, 'must be finite'
+        if self.minimum is not None and number < self.minimum:
+            return None, f'must be >= {self.minimum:g}'
+        if self.maximum is not None and number > self.maximum:
+            return None, f'must be <= {self.maximum:g}'
+        return number, None
+
+    def error(self, value, message):
+        entry = {'field': self.name, 'error': message, 'value': value}
+        if self.categorical:
+            entry['allowed'] = sorted(self.table.lookup)
+        return entry
+
+    def describe(self):
+        spec = {'name': self.name, 'type': 'categorical' if self.categorical else 'numeric'}
+        if self.categorical:
+            spec['values'] = sorted(self.table.lookup)
+        else:
+            spec.update({'default': self.default, 'min': self.minimum, 'max': self.maximum})
+        return spec
+
+
+class FeatureSchema:
+    """Feature specs in model column order, bound to one model version's encoders"""
+
+    def __init__(self, feature_cols, encoding_tables=None):
+        encoding_tables = encoding_tables or {}
+        self.feature_cols = list(feature_cols)
+        self.specs = [
+            FeatureSpec(col, i, encoding_tables.get(col) if col in CATEGORICAL_FEATURES else None)
+            for i, col in enumerate(self.feature_cols)
+        ]
+        self._by_name = {spec.name: spec for spec in self.specs}
+
+    def __contains__(self, feature):
+        return feature in self._by_name
+
+    def spec(self, feature):
+        return self._by_name[feature]
+
+    def validate(self, payload):
+        """Payload dict -> raw row {feature: clean value}; raises FeatureValidationError"""
+        row, errors = {}, []
+        for spec in self.specs:
+            value = payload.get(spec.name)
+            clean, error = spec.coerce(value)
+            if error:
+                errors.append(spec.error(value, error))
+            else:
+                row[spec.name] = clean
+        if errors:
+            raise FeatureValidationError(errors)
+        return row
+
+    def validate_values(self, feature, values):
+        """Coerce a list of values for one feature; raises FeatureValidationError"""
+        spec = self._by_name[feature]
+        clean, errors = [], []
+        for value in values:
+            coerced, error = spec.coerce(value)
+            if error:
+                errors.append(spec.error(value, error))
+            clean.append(coerced)
+        if errors:
+            raise FeatureValidationError(errors)
+        return clean
+
+    def encode_values(self, feature, values):
+        """Clean values of one feature -> float32 model column"""
+        spec = self._by_name[feature]
+        if spec.categorical:
+            return spec.table.encode_column(values).astype(np.float32)
+        return np.asarray(values, dtype=np.float32)
+
+    def encode(self, rows):
+        """Raw rows (from validate) -> contiguous float32 matrix, one column pass per feature"""
+        X = np.empty((len(rows), len(self.specs)), dtype=np.float32)
+        for spec in self.specs:
+            X[:, spec.index] = self.encode_values(spec.name, [row.get(spec.name, spec.default) for row in rows])
+        return X
+
+    def row_dict(self, encoded_row):
+        """Encoded matrix row -> {feature: value} with categorical codes as ints"""
+        return {
+            spec.name: int(encoded_row[spec.index]) if spec.categorical else float(encoded_row[spec.index])
+            for spec in self.specs
+        }
+
+    def describe(self):
+        return [spec.describe() for spec in self.specs]
@@ -0,0 +1,84 @@
+# In-process LRU + TTL cache for forecast predictions
+# Keys are built from the encoded feature vector and the loaded model version,
+# so identical inputs against the same model skip model.predict entirely.
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def input_fingerprint(model_version, encoded_row):
+    """Identity of one month's prediction: model version plus the encoded float32 input row"""
+    return hashlib.sha256(model_version.encode() + b'\0' + encoded_row.tobytes()).hexdigest()
+
+
+class ForecastCache:
+    def __init__(self, maxsize=None, ttl_seconds=None):
+        self.maxsize = maxsize if maxsize is not None else int(os.getenv('FORECAST_CACHE_SIZE', '4096'))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv('FORECAST_CACHE_TTL_SECONDS', '3600'))
+        self._entries = OrderedDict()  # key -> (expires_at, predictions)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(model_version, encoded_row):
+        """Canonical key: model version plus the encoded float32 row (model column order)"""
+        return (model_version, encoded_row.tobytes())
+
+    def get(self, key):
+        """Return cached predictions for key, or None on miss/expiry"""
+        if self.maxsize <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, predictions = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(predictions)
+
+    def put(self, key, predictions):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, dict(predictions))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry (called whenever the model is (re)loaded)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+forecast_cache = ForecastCache()
+# Per-feature contributions for /api/forecast/explain, keyed the same way
+explanation_cache = ForecastCache(maxsize=int(os.getenv('FORECAST_EXPLAIN_CACHE_SIZE', '1024')))
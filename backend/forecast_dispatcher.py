@@ -0,0 +1,206 @@
+# Micro-batching dispatcher for concurrent forecast requests
+# Request threads hand their (small) encoded matrices to one dispatcher thread,
+# which gathers everything arriving within a short window (or up to N rows),
+# runs a single predict per model version and hands each caller its own rows.
+# Callers wait at most FORECAST_INFERENCE_POOL_TIMEOUT_SECONDS for their rows.
+
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from inference_pool import INFERENCE_POOL_TIMEOUT_SECONDS, InferenceTimeout
+
+# Upper edges of the batch-size histogram buckets (rows per predict call)
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+
+
+class _Job:
+    __slots__ = ('engine', 'X', 'enqueued_at', 'done', 'result', 'error')
+
+    def __init__(self, engine, X):
+        self.engine = engine
+        self.X = X
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatchDispatcher:
+    def __init__(self, enabled=None, window_ms=None, max_rows=None, timeout=None):
+        self.enabled = enabled if enabled is not None else os.getenv('FORECAST_MICROBATCH_ENABLED', 'true').lower() == 'true'
+        self.window_seconds = (window_ms if window_ms is not None else float(os.getenv('FORECAST_MICROBATCH_WINDOW_MS', '2'))) / 1000.0
+        self.max_rows = max_rows if max_rows is not None else int(os.getenv('FORECAST_MICROBATCH_MAX_ROWS', '64'))
+        self.timeout = timeout if timeout is not None else INFERENCE_POOL_TIMEOUT_SECONDS
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        self.batches = 0
+        self.batched_rows = 0
+        self.batched_requests = 0
+        self.direct_calls = 0
+        self.max_batch_rows = 0
+        self.max_queue_depth = 0
+        self.timeouts = 0
+        self.total_queue_wait = 0.0
+        self.histogram = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='forecast-dispatcher', daemon=True)
+                self._thread.start()
+
+    def predict(self, engine, X):
+        """Predict X with engine, sharing the call with concurrent requests when enabled"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if not self.enabled or X.shape[0] >= self.max_rows:
+            # Already a real batch (or batching off): nothing to gain from waiting
+            with self._metrics_lock:
+                self.direct_calls += 1
+            return engine.predict(X)
+
+        self._ensure_thread()
+        job = _Job(engine, X)
+        self._queue.put(job)
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            with self._metrics_lock:
+                self.max_queue_depth = max(self.max_queue_depth, depth)
+        if not job.done.wait(self.timeout):
+            with self._metrics_lock:
+                self.timeouts += 1
+            raise InferenceTimeout(f'Forecast batch did not complete within {self.timeout:g}s')
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _collect(self):
+        jobs = [self._queue.get()]
+        rows = jobs[0].X.shape[0]
+        deadline = time.perf_counter() + self.window_seconds
+        while rows < self.max_rows:
+            remaining = deadline - time.perf_counter()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            jobs.append(job)
+            rows += job.X.shape[0]
+        return jobs
+
+    def _run(self):
+        jobs = []
+        try:
+            while True:
+                jobs = self._collect()
+                started = time.perf_counter()
+                try:
+                    # Jobs from different model versions cannot share a predict call
+                    groups = {}
+                    for job in jobs:
+                        groups.setdefault(id(job.engine), []).append(job)
+                    for group in groups.values():
+                        self._dispatch(group, started)
+                except Exception as e:
+                    print(f"Forecast dispatcher error: {e}")
+                    self._fail(jobs, e)
+        except BaseException as e:
+            # The thread is going away: nobody would ever answer what is queued
+            while True:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._fail(jobs, RuntimeError(f'Forecast dispatcher stopped: {e!r}'))
+            raise
+
+    def _fail(self, jobs, error):
+        for job in jobs:
+            if not job.done.is_set():
+                job.error = error
+                job.done.set()
+
+    def _dispatch(self, group, started):
+        X = group[0].X if len(group) == 1 else np.vstack([job.X for job in group])
+        engine = group[0].engine
+        self._record_batch(group, X.shape[0], started)
+        if hasattr(engine, 'submit'):
+            # Asynchronous engines (process pool): keep collecting while workers compute
+            try:
+                future = engine.submit(X)
+            except Exception as e:
+                self._complete(group, error=e)
+                return
+            future.add_done_callback(lambda f: self._complete(group, future=f))
+            return
+        try:
+            predictions = engine.predict(X)
+        except Exception as e:
+            self._complete(group, error=e)
+            return
+        self._complete(group, predictions=predictions)
+
+    def _complete(self, group, predictions=None, error=None, future=None):
+        if future is not None:
+            try:
+                predictions = future.result()
+            except Exception as e:
+                error = e
+        offset = 0
+        for job in group:
+            n = job.X.shape[0]
+            if error is not None:
+                job.error = error
+            else:
+                job.result = predictions[offset:offset + n]
+            offset += n
+            job.done.set()
+
+    def _record_batch(self, group, rows, started):
+        bucket = next((i for i, edge in enumerate(BATCH_SIZE_BUCKETS) if rows <= edge), len(BATCH_SIZE_BUCKETS))
+        with self._metrics_lock:
+            self.batches += 1
+            self.batched_rows += rows
+            self.batched_requests += len(group)
+            self.max_batch_rows = max(self.max_batch_rows, rows)
+            self.total_queue_wait += sum(started - job.enqueued_at for job in group)
+            self.histogram[bucket] += 1
+
+    def stats(self):
+        with self._metrics_lock:
+            labels = [str(edge) for edge in BATCH_SIZE_BUCKETS] + [f'>{BATCH_SIZE_BUCKETS[-1]}']
+            return {
+                'enabled': self.enabled,
+                'window_ms': self.window_seconds * 1000.0,
+                'max_rows': self.max_rows,
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'timeout_seconds': self.timeout,
+                'timeouts': self.timeouts,
+                'batches': self.batches,
+                'batched_requests': self.batched_requests,
+                'batched_rows': self.batched_rows,
+                'direct_calls': self.direct_calls,
+                'avg_batch_rows': round(self.batched_rows / self.batches, 3) if self.batches else 0.0,
+                'avg_requests_per_batch': round(self.batched_requests / self.batches, 3) if self.batches else 0.0,
+                'max_batch_rows': self.max_batch_rows,
+                'avg_queue_wait_ms': round(self.total_queue_wait / self.batched_requests * 1000.0, 3) if self.batched_requests else 0.0,
+                'batch_size_histogram': dict(zip(labels, self.histogram)),
+            }
+
+    def reset_stats(self):
+        with self._metrics_lock:
+            self._reset_metrics()
+
+
+forecast_dispatcher = MicroBatchDispatcher()
@@ -0,0 +1,338 @@
+# Hierarchical forecast rollups kept in dense NumPy cubes
+#
+# Every month entry in project_forecasts contributes its predictions and
+# actual values (merged with material_actuals for the same project and month,
+# entry values winning, as the seasonal baseline reads them) to one cell of the hierarchy
+#   national -> project_location -> project_location x tower_type x substation_type
+# (plus tower_type and substation_type on their own). Each level is a cube
+#   (*group axes, month, target, measure)   measure: 0 = forecast, 1 = actual
+# that is updated in place by subtracting an entry's previous contribution and
+# adding the new one, so a read of any level is a slice, not a collection scan.
+# Group labels go through the active model's encoding tables, so a region sent
+# as 'North', as its code or as the code string lands in one group; a missing
+# value is UNKNOWN_GROUP.
+#
+# Each worker process keeps its own cubes; a periodic rebuild
+# (FORECAST_ROLLUP_REBUILD_SECONDS) folds in writes made by other workers.
+
+import os
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+ROLLUP_DIMENSIONS = ('project_location', 'tower_type', 'substation_type')
+ROLLUP_LEVELS = {
+    'national': (),
+    'project_location': ('project_location',),
+    'tower_type': ('tower_type',),
+    'substation_type': ('substation_type',),
+    'cell': ROLLUP_DIMENSIONS,
+}
+MEASURES = ('forecast', 'actual')
+UNKNOWN_GROUP = 'Unknown'
+FORECAST_ROLLUP_REBUILD_SECONDS = float(os.getenv('FORECAST_ROLLUP_REBUILD_SECONDS', '300'))
+
+
+class _Axis:
+    """Label <-> index mapping that only grows"""
+
+    def __init__(self):
+        self.index = {}
+        self.labels = []
+
+    def get(self, label):
+        position = self.index.get(label)
+        if position is None:
+            position = self.index[label] = len(self.labels)
+            self.labels.append(label)
+        return position
+
+    def __len__(self):
+        return len(self.labels)
+
+
+def _merged_actuals(material_values, actual_values, target_axis):
+    """Material actuals overlaid with the entry's own actual values, per target"""
+    merged = dict(_numeric_vector(material_values, target_axis))
+    merged.update(_numeric_vector(actual_values, target_axis))
+    return list(merged.items())
+
+
+def _numeric_vector(values, target_axis):
+    """{target: value} -> [(target index, float)] skipping non-numeric values"""
+    pairs = []
+    for target, value in (values or {}).items():
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            continue
+        if np.isfinite(number):
+            pairs.append((target_axis.get(target), number))
+    return pairs
+
+
+class ForecastRollup:
+    def __init__(self, initial_capacity=(8, 8, 16, 24, 16), schema=None):
+        self._lock = threading.RLock()
+        self.schema = schema
+        self._axes = {dim: _Axis() for dim in ROLLUP_DIMENSIONS}
+        self._months = _Axis()
+        self._targets = _Axis()
+        # Capacities: one per dimension, then months, then targets
+        self._capacity = dict(zip(ROLLUP_DIMENSIONS + ('month', 'target'), initial_capacity))
+        self._cubes = {}
+        self._counts = {}
+        self._allocate()
+        # (project_id, month) -> (cell index, month index, forecast pairs, actual pairs)
+        self._entries = {}
+        # Raw actual sources per (project_id, month), merged into the entry's actual pairs
+        self._entry_actuals = {}
+        self._material_actuals = {}
+        # project_id -> (month, cell) of its latest forecast month; its actual-only months follow that cell
+        self._project_cells = {}
+        self._actual_only = {}  # project_id -> {keys of months that only have material actuals}
+        self.built_at = None
+        self.updates = 0
+        self._replay = None  # (method, args) seen while a rebuild scans, re-applied to the new cubes
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _level_shape(self, level):
+        return tuple(self._capacity[dim] for dim in ROLLUP_LEVELS[level])
+
+    def _allocate(self):
+        for level in ROLLUP_LEVELS:
+            shape = self._level_shape(level)
+            self._cubes[level] = np.zeros(shape + (self._capacity['month'], self._capacity['target'], len(MEASURES)))
+            self._counts[level] = np.zeros(shape + (self._capacity['month'],), dtype=np.int64)
+
+    def _grow(self):
+        """Double any axis whose labels outgrew its capacity (amortised O(1) per label)"""
+        sizes = {dim: len(self._axes[dim]) for dim in ROLLUP_DIMENSIONS}
+        sizes.update({'month': len(self._months), 'target': len(self._targets)})
+        if all(sizes[axis] <= self._capacity[axis] for axis in sizes):
+            return
+        for axis, size in sizes.items():
+            while self._capacity[axis] < size:
+                self._capacity[axis] *= 2
+        for level in ROLLUP_LEVELS:
+            old_cube, old_counts = self._cubes[level], self._counts[level]
+            shape = self._level_shape(level)
+            cube = np.zeros(shape + (self._capacity['month'], self._capacity['target'], len(MEASURES)))
+            cube[tuple(slice(0, n) for n in old_cube.shape)] = old_cube
+            counts = np.zeros(shape + (self._capacity['month'],), dtype=np.int64)
+            counts[tuple(slice(0, n) for n in old_counts.shape)] = old_counts
+            self._cubes[level], self._counts[level] = cube, counts
+
+    def set_schema(self, schema):
+        """Canonicalise group labels through schema's encoding tables from now on"""
+        with self._lock:
+            self.schema = schema
+
+    def group_label(self, dim, value):
+        """Class label of a dimension value (a label, its code or the code as a string)"""
+        if value is None or (isinstance(value, str) and not value.strip()):
+            return UNKNOWN_GROUP
+        table = self.schema.spec(dim).table if self.schema is not None and dim in self.schema else None
+        if table is None:
+            return str(value).strip()
+        label = table.label(value)
+        return UNKNOWN_GROUP if label is None else label
+
+    def _cell(self, features):
+        features = features or {}
+        return tuple(self._axes[dim].get(self.group_label(dim, features.get(dim))) for dim in ROLLUP_DIMENSIONS)
+
+    def _replace(self, key, cell, month, forecast):
+        """Swap the entry at key for (cell, month, forecast) plus its merged actuals"""
+        previous = self._entries.get(key)
+        if previous is not None:
+            self._apply(*previous, count=1, sign=-1)
+        actual = _merged_actuals(self._material_actuals.get(key), self._entry_actuals.get(key), self._targets)
+        self._grow()
+        entry = (cell, month, forecast, actual)
+        self._apply(*entry, count=1, sign=1)
+        self._entries[key] = entry
+        self.updates += 1
+
+    def _project_cell(self, project_id):
+        latest = self._project_cells.get(project_id)
+        return latest[1] if latest is not None else self._cell({})
+
+    def _set_project_cell(self, project_id, forecast_month, cell):
+        """Track the cell of the project's latest forecast month and move its actual-only months there"""
+        latest = self._project_cells.get(project_id)
+        if latest is not None and latest[0] > forecast_month:
+            return
+        self._project_cells[project_id] = (forecast_month, cell)
+        for key in self._actual_only.get(project_id, ()):
+            previous = self._entries[key]
+            if previous[0] != cell:
+                self._replace(key, cell, previous[1], previous[2])
+
+    def _apply(self, cell, month, forecast, actual, count, sign):
+        for level, dims in ROLLUP_LEVELS.items():
+            group = tuple(cell[ROLLUP_DIMENSIONS.index(dim)] for dim in dims)
+            cube = self._cubes[level]
+            for target, value in forecast:
+                cube[group + (month, target, 0)] += sign * value
+            for target, value in actual:
+                cube[group + (month, target, 1)] += sign * value
+            self._counts[level][group + (month,)] += sign * count
+
+    def record(self, project_id, forecast_month, features=None, predictions=None, actual_values=None,
+               keep_actuals=False):
+        """Replace one month entry's contribution (what an upsert of that entry wrote).
+
+        features/predictions of None keep the previous values; keep_actuals keeps
+        the previous actual values instead of using actual_values.
+        """
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append(('record', (project_id, forecast_month, features, predictions, actual_values,
+                                                keep_actuals)))
+            key = (project_id, forecast_month)
+            previous = self._entries.get(key)
+            month = previous[1] if previous else self._months.get(forecast_month)
+            cell = self._cell(features) if features is not None or previous is None else previous[0]
+            forecast = _numeric_vector(predictions, self._targets) if predictions is not None else \
+                (previous[2] if previous else [])
+            if not keep_actuals or previous is None:
+                self._entry_actuals[key] = dict(actual_values or {})
+            self._actual_only.get(project_id, set()).discard(key)
+            self._replace(key, cell, month, forecast)
+            self._set_project_cell(project_id, forecast_month, cell)
+
+    def record_actuals(self, project_id, forecast_month, actual_values):
+        """Actual values saved for an existing month entry"""
+        with self._lock:
+            key = (project_id, forecast_month)
+            if key in self._entries and key not in self._actual_only.get(project_id, ()):
+                self.record(project_id, forecast_month, actual_values=actual_values)
+
+    def record_material_actuals(self, project_id, month, material_values):
+        """Material actuals saved for a project month (material_actuals collection).
+
+        A month without a forecast entry gets an actual-only entry in the
+        group of the project's latest forecast month (UNKNOWN_GROUP until it
+        has one); it moves whenever that group changes.
+        """
+        if not isinstance(month, str) or not month:
+            return
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append(('record_material_actuals', (project_id, month, material_values)))
+            key = (project_id, month)
+            self._material_actuals[key] = dict(material_values or {})
+            previous = self._entries.get(key)
+            if previous is not None:
+                self._replace(key, previous[0], previous[1], previous[2])
+            else:
+                self._actual_only.setdefault(project_id, set()).add(key)
+                self._replace(key, self._project_cell(project_id), self._months.get(month), [])
+
+    def rebuild(self, collection, material_actuals=None):
+        """Recompute every cube from project_forecasts and material_actuals (startup and periodic resync)"""
+        with self._lock:
+            self._replay = []
+            schema = self.schema
+        fresh = ForecastRollup(schema=schema)
+        cursor = collection.find({}, {'_id': 0, 'project_id': 1, 'forecasts.forecast_month': 1,
+                                      'forecasts.features': 1, 'forecasts.predictions': 1,
+                                      'forecasts.actual_values': 1})
+        for doc in cursor:
+            for entry in doc.get('forecasts', []):
+                if entry.get('forecast_month') and entry.get('predictions'):
+                    fresh.record(doc.get('project_id'), entry['forecast_month'], entry.get('features') or {},
+                                 entry.get('predictions'), entry.get('actual_values'))
+        if material_actuals is not None:
+            # After the forecasts, so actual-only months land in their project's group
+            for record in material_actuals.find({}, {'_id': 0, 'project_id': 1, 'month': 1, 'material_values': 1}):
+                if record.get('project_id'):
+                    fresh.record_material_actuals(record['project_id'], record.get('month'), record.get('material_values'))
+        with self._lock:
+            for method, args in self._replay:
+                getattr(fresh, method)(*args)
+            self._replay = None
+            self._axes, self._months, self._targets = fresh._axes, fresh._months, fresh._targets
+            self._capacity, self._cubes, self._counts = fresh._capacity, fresh._cubes, fresh._counts
+            self._entries, self._project_cells = fresh._entries, fresh._project_cells
+            self._actual_only = fresh._actual_only
+            self._entry_actuals, self._material_actuals = fresh._entry_actuals, fresh._material_actuals
+            self.built_at = datetime.now(timezone.utc)
+        return len(self._entries)
+
+    def start_resync(self, collection, material_actuals=None, interval=None):
+        interval = interval if interval is not None else FORECAST_ROLLUP_REBUILD_SECONDS
+        if interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.rebuild(collection, material_actuals)
+                except Exception as e:
+                    print(f"Forecast rollup rebuild failed: {e}")
+
+        self._thread = threading.Thread(target=loop, name='forecast-rollup-resync', daemon=True)
+        self._thread.start()
+
+    def query(self, level='national', group=None, months=None, targets=None):
+        """Totals for one level: {'months', 'targets', 'groups': [{'group', 'forecast', 'actual', 'entries'}]}.
+
+        group filters to one group of the level (a label, or a list of labels for
+        'cell'); months / targets restrict the returned columns.
+        """
+        if level not in ROLLUP_LEVELS:
+            raise ValueError(f'level must be one of {list(ROLLUP_LEVELS)}')
+        dims = ROLLUP_LEVELS[level]
+        with self._lock:
+            month_labels = sorted(self._months.labels) if months is None else [m for m in months if m in self._months.index]
+            target_labels = list(self._targets.labels) if targets is None else [t for t in targets if t in self._targets.index]
+            month_idx = [self._months.index[m] for m in month_labels]
+            target_idx = [self._targets.index[t] for t in target_labels]
+            cube, counts = self._cubes[level], self._counts[level]
+
+            if not dims:
+                groups = [()]
+            elif group is not None:
+                labels = [group] if len(dims) == 1 else list(group)
+                if len(labels) != len(dims) or any(str(l) not in self._axes[d].index for l, d in zip(labels, dims)):
+                    groups = []
+                else:
+                    groups = [tuple(self._axes[d].index[str(l)] for l, d in zip(labels, dims))]
+            else:
+                # Only groups that ever received an entry
+                nonzero = np.argwhere(counts[tuple(slice(0, len(self._axes[d])) for d in dims)].any(axis=-1))
+                groups = [tuple(int(i) for i in g) for g in nonzero]
+
+            result = []
+            for g in groups:
+                block = cube[g][np.ix_(month_idx, target_idx)] if month_idx and target_idx else \
+                    np.zeros((len(month_idx), len(target_idx), len(MEASURES)))
+                label = [self._axes[d].labels[i] for d, i in zip(dims, g)]
+                result.append({
+                    'group': label[0] if len(label) == 1 else (label or 'national'),
+                    'forecast': block[..., 0].round(4).tolist(),
+                    'actual': block[..., 1].round(4).tolist(),
+                    'entries': counts[g][month_idx].tolist(),
+                })
+        return {'level': level, 'dimensions': list(dims), 'months': month_labels,
+                'targets': target_labels, 'groups': result}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'months': len(self._months),
+                'targets': len(self._targets),
+                'groups': {dim: len(self._axes[dim]) for dim in ROLLUP_DIMENSIONS},
+                'cube_bytes': int(sum(c.nbytes for c in self._cubes.values()) + sum(c.nbytes for c in self._counts.values())),
+                'updates': self.updates,
+                'built_at': self.built_at.isoformat() if self.built_at else None,
+            }
+
+
+forecast_rollup = ForecastRollup()
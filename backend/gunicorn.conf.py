@@ -0,0 +1,14 @@
+# gunicorn settings, read automatically when gunicorn starts from the backend directory
+#
+# PRELOAD_SHARED=true loads the model and dataset once in the master and forks
+# workers that share those pages copy-on-write (see preload.py); each worker then
+# starts its own Mongo connection pool, background threads and readiness state.
+import os
+
+preload_app = os.getenv('PRELOAD_SHARED', 'false').lower() == 'true'
+
+
+def post_fork(server, worker):
+    if preload_app:
+        import app
+        app.start_worker_services()
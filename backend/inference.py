@@ -0,0 +1,240 @@
+# Forecast inference engines
+# Every engine takes an (n_rows, n_features) matrix in feature_cols order and
+# returns an (n_rows, n_targets) array, so routes never build DataFrames.
+
+import json
+import os
+import numpy as np
+import pandas as pd
+
+INFERENCE_BACKEND = os.getenv('FORECAST_INFERENCE_BACKEND', 'booster')
+
+
+class SklearnInferenceEngine:
+    """Reference path: the sklearn wrapper fed a DataFrame, as /api/forecast used to do"""
+    name = 'sklearn'
+
+    def __init__(self, model, feature_cols):
+        self.model = model
+        self.feature_cols = list(feature_cols)
+
+    def predict(self, X):
+        input_df = pd.DataFrame(np.asarray(X), columns=self.feature_cols)
+        return np.asarray(self.model.predict(input_df), dtype=np.float64).reshape(len(input_df), -1)
+
+
+class BoosterInferenceEngine:
+    """Calls each target's XGBoost booster directly with inplace_predict"""
+    name = 'booster'
+
+    def __init__(self, model, feature_cols):
+        estimators = getattr(model, 'estimators_', None)
+        if not estimators:
+            raise ValueError('Model has no fitted estimators_')
+        self.feature_cols = list(feature_cols)
+        self.boosters = []
+        self.iteration_ranges = []
+        self.missing = []
+        for est in estimators:
+            # Raises AttributeError for anything that is not an XGBoost sklearn model
+            booster = est.get_booster()
+            self.boosters.append(booster)
+            # Same iteration range XGBRegressor.predict would use
+            try:
+                self.iteration_ranges.append((0, est.best_iteration + 1))
+            except AttributeError:
+                self.iteration_ranges.append((0, 0))
+            self.missing.append(est.missing)
+        # Reorder columns if a booster was trained with a different feature order
+        names = self.boosters[0].feature_names
+        if names and list(names) != self.feature_cols:
+            self.column_order = [self.feature_cols.index(n) for n in names]
+        else:
+            self.column_order = None
+
+    def predict(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if self.column_order is not None:
+            X = np.ascontiguousarray(X[:, self.column_order])
+        out = np.empty((X.shape[0], len(self.boosters)), dtype=np.float64)
+        for j, booster in enumerate(self.boosters):
+            out[:, j] = booster.inplace_predict(
+                X,
+                iteration_range=self.iteration_ranges[j],
+                missing=self.missing[j],
+                validate_features=False
+            )
+        return out
+
+
+# Objectives whose prediction is the raw margin (identity link)
+IDENTITY_LINK_OBJECTIVES = {'reg:squarederror', 'reg:squaredlogerror', 'reg:absoluteerror',
+                            'reg:pseudohubererror', 'reg:quantileerror'}
+
+
+def _parse_base_score(value):
+    # Stored as '3.69E1' or, for vector-leaf aware versions, '[3.69E1]'
+    return float(str(value).strip('[]').split(',')[0])
+
+
+def flatten_booster(booster, iteration_range=(0, 0)):
+    """Read a gbtree booster's JSON dump into flat per-node arrays.
+
+    Returns (trees, base_score) where trees is a list of dicts holding the
+    left/right child, split feature, threshold (leaf value on leaves) and
+    default-left arrays of each tree within iteration_range.
+    """
+    config = json.loads(booster.save_raw('json'))
+    learner = config['learner']
+    objective = learner['objective']['name']
+    if objective not in IDENTITY_LINK_OBJECTIVES:
+        raise ValueError(f'objective {objective} is not supported by the tree evaluator')
+    gbm = learner['gradient_booster']
+    if gbm['name'] != 'gbtree':
+        raise ValueError(f"booster {gbm['name']} is not supported by the tree evaluator")
+    model = gbm['model']
+    trees = model['trees']
+    begin, end = iteration_range
+    if end > 0:
+        indptr = model.get('iteration_indptr')
+        trees = trees[indptr[begin]:indptr[end]] if indptr else trees[begin:end]
+    flat = []
+    for tree in trees:
+        if tree.get('categories_nodes'):
+            raise ValueError('categorical splits are not supported by the tree evaluator')
+        flat.append({
+            'left': np.asarray(tree['left_children'], dtype=np.int32),
+            'right': np.asarray(tree['right_children'], dtype=np.int32),
+            'feature': np.asarray(tree['split_indices'], dtype=np.int32),
+            'threshold': np.asarray(tree['split_conditions'], dtype=np.float32),
+            'default_left': np.asarray(tree['default_left'], dtype=bool),
+        })
+    return flat, _parse_base_score(learner['learner_model_param']['base_score'])
+
+
+class TreeArrayInferenceEngine:
+    """Pure-NumPy evaluator over every target's trees flattened into compact arrays.
+
+    All trees of all targets live in one set of node arrays (child indices are
+    rebased to global offsets). A batch is evaluated by advancing an
+    (n_rows, n_trees) matrix of node pointers one level per step for max_depth
+    steps, then summing leaf values per target.
+    """
+    name = 'numpy'
+
+    def __init__(self, model, feature_cols):
+        estimators = getattr(model, 'estimators_', None)
+        if not estimators:
+            raise ValueError('Model has no fitted estimators_')
+        self.feature_cols = list(feature_cols)
+        lefts, rights, features, thresholds, default_lefts = [], [], [], [], []
+        roots, tree_targets, base_scores = [], [], []
+        offset = 0
+        column_order = None
+        for target, est in enumerate(estimators):
+            booster = est.get_booster()
+            if booster.feature_names and list(booster.feature_names) != self.feature_cols:
+                column_order = [self.feature_cols.index(n) for n in booster.feature_names]
+            try:
+                iteration_range = (0, est.best_iteration + 1)
+            except AttributeError:
+                iteration_range = (0, 0)
+            trees, base_score = flatten_booster(booster, iteration_range)
+            base_scores.append(base_score)
+            for tree in trees:
+                is_leaf = tree['left'] == -1
+                # Leaves point at themselves so extra traversal steps are no-ops
+                own = np.arange(offset, offset + tree['left'].size, dtype=np.int32)
+                lefts.append(np.where(is_leaf, own, tree['left'] + offset))
+                rights.append(np.where(is_leaf, own, tree['right'] + offset))
+                features.append(np.where(is_leaf, 0, tree['feature']))
+                thresholds.append(tree['threshold'])
+                default_lefts.append(tree['default_left'])
+                roots.append(offset)
+                tree_targets.append(target)
+                offset += tree['left'].size
+        self.left = np.concatenate(lefts)
+        self.right = np.concatenate(rights)
+        self.feature = np.concatenate(features)
+        self.threshold = np.concatenate(thresholds)
+        self.default_left = np.concatenate(default_lefts)
+        self.is_leaf = self.left == np.arange(self.left.size)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.tree_targets = np.asarray(tree_targets, dtype=np.int32)
+        # Trees are contiguous per target; target_starts marks each target's first tree
+        self.target_starts = np.searchsorted(self.tree_targets, np.arange(len(estimators)))
+        self.base_scores = np.asarray(base_scores, dtype=np.float64)
+        self.column_order = column_order
+        self.max_depth = self._max_depth()
+
+    def _max_depth(self):
+        depth = 0
+        # Walk every path at once: follow both children level by level
+        frontier = self.roots
+        while True:
+            internal = frontier[~self.is_leaf[frontier]]
+            if internal.size == 0:
+                return depth
+            frontier = np.concatenate([self.left[internal], self.right[internal]])
+            depth += 1
+
+    @property
+    def n_nodes(self):
+        return int(self.left.size)
+
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.left, self.right, self.feature, self.threshold,
+                                      self.default_left, self.is_leaf, self.roots, self.tree_targets))
+
+    def predict(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if self.column_order is not None:
+            X = np.ascontiguousarray(X[:, self.column_order])
+        n_rows = X.shape[0]
+        nodes = np.broadcast_to(self.roots, (n_rows, self.roots.size)).copy()
+        row_index = np.arange(n_rows)[:, None]
+        for _ in range(self.max_depth):
+            values = X[row_index, self.feature[nodes]]
+            go_left = np.where(np.isnan(values), self.default_left[nodes], values < self.threshold[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        leaf_values = self.threshold[nodes]
+        # XGBoost accumulates in float32 starting from base_score, tree by tree;
+        # a sequential float32 accumulate reproduces its rounding exactly
+        out = np.empty((n_rows, self.base_scores.size), dtype=np.float64)
+        bounds = list(self.target_starts) + [self.roots.size]
+        for target in range(self.base_scores.size):
+            start, end = bounds[target], bounds[target + 1]
+            terms = np.empty((n_rows, end - start + 1), dtype=np.float32)
+            terms[:, 0] = self.base_scores[target]
+            terms[:, 1:] = leaf_values[:, start:end]
+            out[:, target] = np.add.accumulate(terms, axis=1)[:, -1]
+        return out
+
+
+ENGINES = {
+    'sklearn': SklearnInferenceEngine,
+    'booster': BoosterInferenceEngine,
+    'numpy': TreeArrayInferenceEngine,
+}
+
+
+def build_inference_engine(model, feature_cols, backend=None, atol=1e-4):
+    """Build the configured engine, falling back to the sklearn path if it
+    cannot be built or does not reproduce model.predict on a probe batch"""
+    backend = backend or INFERENCE_BACKEND
+    reference = SklearnInferenceEngine(model, feature_cols)
+    if backend == 'sklearn':
+        return reference
+    try:
+        engine = ENGINES[backend](model, feature_cols)
+        probe = np.vstack([
+            np.zeros(len(feature_cols)),
+            np.ones(len(feature_cols)),
+            np.arange(len(feature_cols), dtype=np.float64) * 7.5,
+        ]).astype(np.float32)
+        if not np.allclose(engine.predict(probe), reference.predict(probe), rtol=1e-5, atol=atol):
+            raise ValueError('outputs differ from model.predict')
+        return engine
+    except Exception as e:
+        print(f"Inference backend '{backend}' unavailable ({e}); using sklearn")
+        return reference
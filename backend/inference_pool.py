@@ -0,0 +1,145 @@
+# Optional process-pool inference backend
+# CPU-bound predicts run in dedicated worker processes so Flask request threads
+# (and the GIL) stay free for I/O-bound routes. Each worker loads a model version
+# once and keeps it; callers send encoded float32 matrices. A bounded number of
+# pending submissions protects the pool: when it is full, callers get
+# InferenceQueueFull and the route answers 429; a predict that outlives
+# FORECAST_INFERENCE_POOL_TIMEOUT_SECONDS raises InferenceTimeout (504). Both
+# are InferenceUnavailable, which routes catch to answer with its status_code.
+
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+import numpy as np
+
+INFERENCE_POOL_WORKERS = int(os.getenv('FORECAST_INFERENCE_POOL_WORKERS', '0'))
+INFERENCE_POOL_MAX_PENDING = int(os.getenv('FORECAST_INFERENCE_POOL_MAX_PENDING', str(max(INFERENCE_POOL_WORKERS, 1) * 4)))
+INFERENCE_POOL_TIMEOUT_SECONDS = float(os.getenv('FORECAST_INFERENCE_POOL_TIMEOUT_SECONDS', '30'))
+
+
+class InferenceUnavailable(Exception):
+    """A predict could not be served right now; status_code is the HTTP answer"""
+    status_code = 503
+
+
+class InferenceQueueFull(InferenceUnavailable):
+    """Raised when the inference pool already has max_pending submissions"""
+    status_code = 429
+
+
+class InferenceTimeout(InferenceUnavailable):
+    """Raised when a predict has not completed within INFERENCE_POOL_TIMEOUT_SECONDS"""
+    status_code = 504
+
+
+# Worker-process side: engines keyed by model path, loaded on first use
+_worker_engines = {}
+
+
+def _worker_predict(model_path, feature_cols, backend, X):
+    engine = _worker_engines.get(model_path)
+    if engine is None:
+        from compact_model import load_model_artifact
+        from inference import build_inference_engine
+        # Keep only the newest version resident after a hot swap
+        _worker_engines.clear()
+        engine = build_inference_engine(load_model_artifact(model_path), feature_cols, backend=backend)
+        _worker_engines[model_path] = engine
+    return engine.predict(X)
+
+
+class InferencePool:
+    def __init__(self, workers=None, max_pending=None, timeout=None):
+        self.workers = workers if workers is not None else INFERENCE_POOL_WORKERS
+        self.max_pending = max_pending if max_pending is not None else INFERENCE_POOL_MAX_PENDING
+        self.timeout = timeout if timeout is not None else INFERENCE_POOL_TIMEOUT_SECONDS
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.pending = 0
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn: forking a process that already runs threads is unsafe
+                    ctx = multiprocessing.get_context('spawn')
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+        return self._executor
+
+    def _release(self, _future):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def submit(self, model_path, feature_cols, backend, X):
+        """Queue a predict in the pool and return its Future (raises InferenceQueueFull when saturated)"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise InferenceQueueFull(f'Inference queue is full ({self.max_pending} pending)')
+        with self._lock:
+            self.submitted += 1
+            self.pending += 1
+        try:
+            future = self._get_executor().submit(
+                _worker_predict, model_path, list(feature_cols), backend, np.ascontiguousarray(X, dtype=np.float32)
+            )
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def predict(self, model_path, feature_cols, backend, X):
+        try:
+            return self.submit(model_path, feature_cols, backend, X).result(timeout=self.timeout)
+        except FuturesTimeoutError:
+            raise InferenceTimeout(f'Inference did not complete within {self.timeout:g}s') from None
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+            }
+
+
+class PooledInferenceEngine:
+    """Engine facade that predicts in the process pool with the same backend as local_engine"""
+
+    def __init__(self, pool, local_engine, model_path, feature_cols):
+        self.pool = pool
+        self.local_engine = local_engine
+        self.model_path = os.path.abspath(model_path)
+        self.feature_cols = list(feature_cols)
+        self.name = f'pool:{local_engine.name}'
+
+    def predict(self, X):
+        return self.pool.predict(self.model_path, self.feature_cols, self.local_engine.name, X)
+
+    def submit(self, X):
+        return self.pool.submit(self.model_path, self.feature_cols, self.local_engine.name, X)
+
+
+inference_pool = InferencePool()
+atexit.register(inference_pool.shutdown)
@@ -0,0 +1,343 @@
+# Versioned model registry with atomic hot swap
+#
+# Layout (MODEL_REGISTRY_DIR, default ../models):
+#   models/
+#     CURRENT                      <- text file naming the active version
+#     20251101T120000/
+#       manifest.json              <- version, created_at, file sha256s, metadata
+#       model.joblib
+#       feature_cols.joblib
+#       target_cols.joblib
+#       label_encoders.joblib
+#
+# Requests read `model_registry.active` once and keep that ModelBundle for their
+# whole lifetime, so swapping the reference never disturbs in-flight work.
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from compact_model import CompactMultiOutputModel, load_model_artifact, save_compact_model
+from explain import build_explainer
+from feature_encoding import CATEGORICAL_FEATURES, compile_label_encoders
+from feature_schema import FeatureSchema
+from inference import build_inference_engine
+from inference_pool import PooledInferenceEngine, inference_pool
+
+ARTIFACT_FILES = {
+    'model': 'model.joblib',
+    'feature_cols': 'feature_cols.joblib',
+    'target_cols': 'target_cols.joblib',
+    'label_encoders': 'label_encoders.joblib',
+}
+MANIFEST_FILE = 'manifest.json'
+CURRENT_FILE = 'CURRENT'
+
+# Pre-registry artifacts at the repo root, used when the registry is empty
+LEGACY_FILES = {
+    'model': 'multi_xgb_model.joblib',
+    'feature_cols': 'feature_cols1.joblib',
+    'target_cols': 'target_cols1.joblib',
+    'label_encoders': 'label_encoders.joblib',
+}
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelBundle:
+    """Everything one model version needs to serve forecasts; never mutated after load"""
+
+    def __init__(self, version, model, feature_cols, target_cols, label_encoders,
+                 encoding_tables, inference_engine, manifest=None, source=None, explainer=None):
+        self.version = version
+        self.model = model
+        self.feature_cols = list(feature_cols)
+        self.target_cols = list(target_cols)
+        self.label_encoders = label_encoders
+        self.encoding_tables = encoding_tables
+        self.schema = FeatureSchema(self.feature_cols, encoding_tables)
+        self.inference_engine = inference_engine
+        self.explainer = explainer
+        self.manifest = manifest or {}
+        self.source = source
+        self.loaded_at = datetime.now(timezone.utc)
+
+    def describe(self):
+        return {
+            'version': self.version,
+            'source': self.source,
+            'loaded_at': self.loaded_at.isoformat(),
+            'inference_backend': self.inference_engine.name,
+            'n_features': len(self.feature_cols),
+            'n_targets': len(self.target_cols),
+            'created_at': self.manifest.get('created_at'),
+            'metadata': self.manifest.get('metadata', {}),
+        }
+
+
+class ModelRegistry:
+    def __init__(self, registry_dir=None, legacy_dir='..', reference_csv=None):
+        self.registry_dir = registry_dir or os.getenv('MODEL_REGISTRY_DIR', '../models')
+        self.legacy_dir = legacy_dir
+        self.reference_csv = reference_csv
+        self._active = None
+        self._lock = threading.Lock()
+        self._swap_listeners = []
+        self._watcher = None
+        self._stop = threading.Event()
+        self._rejected_version = None
+        self.last_error = None
+
+    @property
+    def active(self):
+        return self._active
+
+    def on_swap(self, callback):
+        """Register callback(new_bundle, old_bundle), called after every swap"""
+        self._swap_listeners.append(callback)
+
+    # Registry inspection
+    def list_versions(self):
+        if not os.path.isdir(self.registry_dir):
+            return []
+        versions = []
+        for name in sorted(os.listdir(self.registry_dir)):
+            manifest_path = os.path.join(self.registry_dir, name, MANIFEST_FILE)
+            if not name.startswith('.') and os.path.isfile(manifest_path):
+                versions.append(name)
+        return versions
+
+    def current_version(self):
+        """Version named by CURRENT, else the newest version directory"""
+        pointer = os.path.join(self.registry_dir, CURRENT_FILE)
+        if os.path.isfile(pointer):
+            with open(pointer) as f:
+                version = f.read().strip()
+            if version:
+                return version
+        # Versions published with activate=False are only served once activated explicitly
+        for version in reversed(self.list_versions()):
+            try:
+                with open(os.path.join(self.registry_dir, version, MANIFEST_FILE)) as f:
+                    if json.load(f).get('activated_on_publish', True):
+                        return version
+            except (OSError, ValueError):
+                continue
+        return None
+
+    # Loading and validation
+    def _reference_df(self):
+        if not self.reference_csv:
+            return None
+        try:
+            return pd.read_csv(self.reference_csv, usecols=lambda c: c in CATEGORICAL_FEATURES)
+        except Exception as e:
+            print(f"Categorical reference data unavailable: {e}")
+            return None
+
+    def _build_bundle(self, version, paths, manifest, source):
+        model = load_model_artifact(paths['model'])
+        feature_cols = list(joblib.load(paths['feature_cols']))
+        target_cols = list(joblib.load(paths['target_cols']))
+        label_encoders = joblib.load(paths['label_encoders'])
+
+        estimators = getattr(model, 'estimators_', None)
+        if estimators is not None and len(estimators) != len(target_cols):
+            raise ValueError(f'model has {len(estimators)} estimators but {len(target_cols)} target columns')
+
+        encoding_tables = compile_label_encoders(label_encoders, self._reference_df())
+        inference_engine = build_inference_engine(model, feature_cols)
+
+        # Smoke test before the bundle can serve traffic
+        probe = inference_engine.predict(np.zeros((2, len(feature_cols)), dtype=np.float32))
+        if probe.shape != (2, len(target_cols)) or not np.all(np.isfinite(probe)):
+            raise ValueError(f'probe prediction has shape {probe.shape} or non-finite values')
+
+        # With FORECAST_INFERENCE_POOL_WORKERS set, predicts run in worker processes
+        if inference_pool.enabled:
+            inference_engine = PooledInferenceEngine(inference_pool, inference_engine, paths['model'], feature_cols)
+
+        return ModelBundle(version, model, feature_cols, target_cols, label_encoders,
+                           encoding_tables, inference_engine, manifest, source,
+                           explainer=build_explainer(model, feature_cols))
+
+    def load_version(self, version):
+        """Load and validate one registry version (does not activate it)"""
+        version_dir = os.path.join(self.registry_dir, version)
+        with open(os.path.join(version_dir, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        # Compact versions name their index file in the manifest (see compact_model.py)
+        filenames = {**ARTIFACT_FILES, 'model': manifest.get('model_file', ARTIFACT_FILES['model'])}
+        for filename, expected in manifest.get('files', {}).items():
+            if file_sha256(os.path.join(version_dir, filename)) != expected:
+                raise ValueError(f'{filename} does not match its manifest checksum')
+        paths = {key: os.path.join(version_dir, filename) for key, filename in filenames.items()}
+        return self._build_bundle(version, paths, manifest, source=version_dir)
+
+    def load_legacy(self):
+        paths = {key: os.path.join(self.legacy_dir, filename) for key, filename in LEGACY_FILES.items()}
+        version = f"legacy-{file_sha256(paths['model'])[:12]}"
+        return self._build_bundle(version, paths, {}, source=os.path.abspath(self.legacy_dir))
+
+    def swap(self, bundle):
+        """Atomically make bundle the active model"""
+        with self._lock:
+            old = self._active
+            self._active = bundle
+        for callback in self._swap_listeners:
+            try:
+                callback(bundle, old)
+            except Exception as e:
+                print(f"Model swap listener failed: {e}")
+        print(f"Active model version: {bundle.version} ({bundle.inference_engine.name} backend)")
+        return old
+
+    def load_active(self):
+        """Load the current registry version (or the legacy artifacts) and activate it"""
+        version = self.current_version()
+        try:
+            bundle = self.load_version(version) if version else self.load_legacy()
+        except Exception as e:
+            self.last_error = f'{version or "legacy"}: {e}'
+            print(f"Error loading model {version or 'legacy'}: {e}")
+            if version:
+                # A broken registry should not take the service down if legacy files exist
+                bundle = self.load_legacy()
+            else:
+                raise
+        self.swap(bundle)
+        return bundle
+
+    def activate(self, version):
+        """Validate version, swap it in and point CURRENT at it for the other workers"""
+        if version not in self.list_versions():
+            raise ValueError(f'Unknown model version: {version}')
+        bundle = self.load_version(version)
+        write_current_pointer(self.registry_dir, version)
+        self.swap(bundle)
+        return bundle
+
+    def refresh(self):
+        """Pick up a new CURRENT version if there is one; keep serving the old one on failure"""
+        version = self.current_version()
+        active = self._active
+        if not version or version == self._rejected_version or (active is not None and active.version == version):
+            return False
+        try:
+            bundle = self.load_version(version)
+        except Exception as e:
+            # Remember the rejection so the watcher does not retry it every poll
+            self._rejected_version = version
+            self.last_error = f'{version}: {e}'
+            print(f"Rejected model version {version}: {e}")
+            return False
+        # Another thread may have activated it meanwhile
+        if self._active is not None and self._active.version == version:
+            return False
+        self.swap(bundle)
+        self.last_error = None
+        return True
+
+    def start_watcher(self, interval=None):
+        """Poll the registry in a daemon thread and hot-swap new versions"""
+        interval = interval if interval is not None else float(os.getenv('MODEL_REGISTRY_POLL_SECONDS', '30'))
+        if interval <= 0 or (self._watcher is not None and self._watcher.is_alive()):
+            return
+        self._stop.clear()
+
+        def watch():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Model registry watcher error: {e}")
+
+        self._watcher = threading.Thread(target=watch, name='model-registry-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+
+
+def write_current_pointer(registry_dir, version):
+    """Replace CURRENT atomically so readers never see a partial file"""
+    tmp_path = os.path.join(registry_dir, f'.{CURRENT_FILE}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write(version + '\n')
+    os.replace(tmp_path, os.path.join(registry_dir, CURRENT_FILE))
+
+
+def new_version_id():
+    return datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+
+
+def publish_model_version(registry_dir, model, feature_cols, target_cols, label_encoders,
+                          metadata=None, version=None, activate=True):
+    """Write a complete version directory, then (optionally) point CURRENT at it.
+
+    Artifacts are written to a hidden temp directory and renamed into place,
+    so watchers never see a half-written version. A CompactMultiOutputModel is
+    stored as native XGBoost boosters plus an index instead of model.joblib.
+    """
+    os.makedirs(registry_dir, exist_ok=True)
+    if version is None:
+        version = base = new_version_id()
+        suffix = 1
+        while os.path.exists(os.path.join(registry_dir, version)):
+            version = f'{base}-{suffix}'
+            suffix += 1
+    final_dir = os.path.join(registry_dir, version)
+    if os.path.exists(final_dir):
+        raise ValueError(f'Model version already exists: {version}')
+    tmp_dir = os.path.join(registry_dir, f'.{version}.tmp')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    artifacts = {
+        'model': model,
+        'feature_cols': list(feature_cols),
+        'target_cols': list(target_cols),
+        'label_encoders': label_encoders,
+    }
+    files = {}
+    model_file = ARTIFACT_FILES['model']
+    for key, filename in ARTIFACT_FILES.items():
+        if key == 'model' and isinstance(model, CompactMultiOutputModel):
+            written = save_compact_model(model, tmp_dir)
+            model_file = written[-1]
+        else:
+            joblib.dump(artifacts[key], os.path.join(tmp_dir, filename))
+            written = [filename]
+        for name in written:
+            files[name] = file_sha256(os.path.join(tmp_dir, name))
+
+    manifest = {
+        'version': version,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'feature_cols': list(feature_cols),
+        'target_cols': list(target_cols),
+        'model_file': model_file,
+        'files': files,
+        'metadata': metadata or {},
+        'activated_on_publish': bool(activate),
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+    os.rename(tmp_dir, final_dir)
+    if activate:
+        write_current_pointer(registry_dir, version)
+    return version
@@ -0,0 +1,126 @@
+# Background startup with per-component readiness
+# Heavy resources (model, dataset, index builds) load in daemon threads so the
+# worker answers auth/CRUD routes and /api/health immediately. Routes that need
+# a component are wrapped with @requires_ready(...) and return 503 + Retry-After
+# until it is loaded (503 without Retry-After if it failed to load).
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import jsonify
+
+BACKGROUND_STARTUP = os.getenv('BACKGROUND_STARTUP', 'true').lower() == 'true'
+STARTUP_RETRY_AFTER_SECONDS = int(os.getenv('STARTUP_RETRY_AFTER_SECONDS', '5'))
+
+PENDING = 'pending'
+LOADING = 'loading'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class StartupState:
+    def __init__(self):
+        self._components = {}
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def register(self, name):
+        with self._lock:
+            if name not in self._components:
+                self._components[name] = {'status': PENDING, 'started_at': None, 'ready_at': None,
+                                          'load_seconds': None, 'error': None}
+                self._events[name] = threading.Event()
+
+    def _run(self, name, loader):
+        with self._lock:
+            self._components[name].update(status=LOADING, started_at=datetime.now(timezone.utc).isoformat())
+        start = time.perf_counter()
+        try:
+            loader()
+            status, error = READY, None
+        except Exception as e:
+            status, error = FAILED, str(e)
+            print(f"Startup component '{name}' failed: {e}")
+        elapsed = round(time.perf_counter() - start, 3)
+        with self._lock:
+            self._components[name].update(status=status, error=error, load_seconds=elapsed,
+                                          ready_at=datetime.now(timezone.utc).isoformat())
+        self._events[name].set()
+        print(f"Startup component '{name}' {status} in {elapsed}s")
+
+    def start(self, name, loader, background=None):
+        """Run loader for component name, in a daemon thread unless background is False"""
+        self.register(name)
+        background = BACKGROUND_STARTUP if background is None else background
+        if not background:
+            self._run(name, loader)
+            return None
+        thread = threading.Thread(target=self._run, args=(name, loader), name=f'startup-{name}', daemon=True)
+        thread.start()
+        return thread
+
+    def status(self, name):
+        with self._lock:
+            component = self._components.get(name)
+            return component['status'] if component else None
+
+    def is_ready(self, name):
+        return self.status(name) == READY
+
+    def wait(self, name, timeout=None):
+        """Block until component name has finished loading (ready or failed)"""
+        event = self._events.get(name)
+        return event.wait(timeout) if event else True
+
+    def all_ready(self):
+        with self._lock:
+            return all(c['status'] == READY for c in self._components.values())
+
+    def recover(self, name):
+        """Mark a failed component ready once it has been brought up another way"""
+        with self._lock:
+            component = self._components.get(name)
+            if component is None or component['status'] != FAILED:
+                return False
+            component.update(status=READY, error=None, ready_at=datetime.now(timezone.utc).isoformat())
+        print(f"Startup component '{name}' recovered")
+        return True
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(component) for name, component in self._components.items()}
+
+
+startup_state = StartupState()
+
+
+def requires_ready(*components, allow_failed=False):
+    """Return 503 with Retry-After while any of the components is still loading, and 503
+    without it once one has failed (its error is in /api/health) unless allow_failed"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            for name in components:
+                status = startup_state.status(name)
+                if status in (PENDING, LOADING):
+                    response = jsonify({
+                        'error': f'Service is starting: {name} is still loading',
+                        'component': name,
+                        'retry_after': STARTUP_RETRY_AFTER_SECONDS
+                    })
+                    response.status_code = 503
+                    response.headers['Retry-After'] = str(STARTUP_RETRY_AFTER_SECONDS)
+                    return response
+                if status == FAILED and not allow_failed:
+                    response = jsonify({
+                        'error': f'Service unavailable: {name} failed to load',
+                        'component': name
+                    })
+                    response.status_code = 503
+                    return response
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,288 @@
+# Portfolio-wide re-forecast after a model change
+#
+# Every month entry in project_forecasts keeps the raw input row it was
+# predicted from, so a new model version can re-predict the whole portfolio
+# without anyone resubmitting forms. The job streams project documents in
+# project_id order (only month fields, never the whole collection), encodes the
+# stale entries of a chunk through the model's FeatureSchema, predicts them as
+# one matrix and writes them back with one unordered bulk_write per chunk.
+#
+# Progress lives in the reforecast_jobs collection, one document per model
+# version: the last project_id fully written plus counters. A stopped or
+# crashed job resumes after that project; in a multi-worker deployment the
+# document doubles as a lease so only one worker runs a version's job.
+
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument, UpdateOne, errors
+
+from feature_schema import FeatureValidationError
+from forecast_cache import input_fingerprint
+from inference_pool import InferenceQueueFull, InferenceTimeout
+
+FORECAST_REFORECAST_ON_SWAP = os.getenv('FORECAST_REFORECAST_ON_SWAP', 'true').lower() == 'true'
+FORECAST_REFORECAST_CHUNK_ROWS = int(os.getenv('FORECAST_REFORECAST_CHUNK_ROWS', '2000'))
+# A running job whose heartbeat is older than this is taken over (its worker died)
+FORECAST_REFORECAST_STALE_SECONDS = float(os.getenv('FORECAST_REFORECAST_STALE_SECONDS', '300'))
+# Consecutive timed-out chunk predicts retried before the job pauses
+FORECAST_REFORECAST_TIMEOUT_RETRIES = int(os.getenv('FORECAST_REFORECAST_TIMEOUT_RETRIES', '2'))
+
+COUNTERS = ('projects_scanned', 'rows_predicted', 'rows_written', 'rows_conflicted',
+            'rows_invalid', 'chunks', 'predict_seconds', 'write_seconds')
+
+
+class ReforecastSuperseded(Exception):
+    """The active model changed while the job was running"""
+
+
+class PortfolioReforecastJob:
+    def __init__(self, registry, project_forecasts, jobs, chunk_rows=None, on_write=None):
+        self.registry = registry
+        self.project_forecasts = project_forecasts
+        self.jobs = jobs
+        self.chunk_rows = chunk_rows if chunk_rows is not None else FORECAST_REFORECAST_CHUNK_ROWS
+        # on_write([(project_id, forecast_month, features, predictions)]) after each chunk is written
+        self.on_write = on_write
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self._thread = None
+        self._stop = threading.Event()
+        # (bundle, restart, create) to run once the current job exits; guarded by _lock
+        self._pending = None
+        self._lock = threading.Lock()
+        self.version = None
+        self.last_result = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # Lease / progress document
+    def _claim(self, version, create=True, restart=False):
+        """Take the job document for version; returns it, or None if another worker holds it or it is done"""
+        now = datetime.now(timezone.utc)
+        stale = now - timedelta(seconds=FORECAST_REFORECAST_STALE_SECONDS)
+        claimable = [{'state': {'$in': ['paused', 'failed', 'superseded']}},
+                     {'state': 'running', 'heartbeat_at': {'$lt': stale}}]
+        if restart:
+            claimable.append({'state': 'completed'})
+        update = {'$set': {'state': 'running', 'owner': self.owner, 'heartbeat_at': now, 'error': None}}
+        if restart:
+            update['$set'].update({'last_project_id': None, 'started_at': now, 'finished_at': None,
+                                   **{counter: 0 for counter in COUNTERS}})
+        doc = self.jobs.find_one_and_update({'_id': version, '$or': claimable}, update,
+                                            return_document=ReturnDocument.AFTER)
+        if doc is not None or not create:
+            return doc
+        doc = {'_id': version, 'state': 'running', 'owner': self.owner, 'heartbeat_at': now,
+               'started_at': now, 'finished_at': None, 'last_project_id': None, 'error': None,
+               **{counter: 0 for counter in COUNTERS}}
+        try:
+            self.jobs.insert_one(doc)
+        except errors.DuplicateKeyError:
+            return None
+        return doc
+
+    def _checkpoint(self, version, last_project_id, increments):
+        self.jobs.update_one(
+            {'_id': version, 'owner': self.owner},
+            {'$set': {'last_project_id': last_project_id, 'heartbeat_at': datetime.now(timezone.utc)},
+             '$inc': increments}
+        )
+
+    def _finish(self, version, state, error=None):
+        self.jobs.update_one(
+            {'_id': version, 'owner': self.owner},
+            {'$set': {'state': state, 'error': error, 'heartbeat_at': datetime.now(timezone.utc),
+                      'finished_at': datetime.now(timezone.utc) if state == 'completed' else None}}
+        )
+
+    # The scan
+    def _stale_docs(self, version, after):
+        """Project docs with at least one entry predicted by another version, in project_id order"""
+        query = {'forecasts': {'$elemMatch': {'model_version': {'$ne': version}, 'features': {'$exists': True}}}}
+        if after is not None:
+            query['project_id'] = {'$gt': after}
+        projection = {'_id': 0, 'project_id': 1, 'forecasts.forecast_month': 1,
+                      'forecasts.features': 1, 'forecasts.model_version': 1}
+        return self.project_forecasts.find(query, projection).sort('project_id', 1).batch_size(200)
+
+    def _predict(self, bundle, X):
+        timeouts = 0
+        while True:
+            try:
+                return bundle.inference_engine.predict(X)
+            except InferenceQueueFull:
+                # Request traffic has priority over the background job
+                if self._stop.wait(0.5):
+                    raise
+            except InferenceTimeout:
+                # The engine is stuck or overloaded, not just busy: a few slower
+                # retries, then pause at the checkpoint instead of piling on
+                timeouts += 1
+                if timeouts > FORECAST_REFORECAST_TIMEOUT_RETRIES or self._stop.wait(5.0 * timeouts):
+                    raise
+
+    def _flush(self, bundle, chunk, last_project_id, counters):
+        """Predict and write one chunk of stale entries, then checkpoint past its last project"""
+        increments = dict(counters)
+        counters.update({counter: 0 for counter in COUNTERS})
+        if chunk:
+            schema = bundle.schema
+            X = schema.encode([row for _, _, _, row in chunk])
+            start = time.perf_counter()
+            predictions = self._predict(bundle, X)
+            increments['predict_seconds'] += time.perf_counter() - start
+
+            now = datetime.now(timezone.utc)
+            ops, written = [], []
+            for (project_id, month, old_version, row), encoded, values in zip(chunk, X, predictions):
+                results = {col: float(values[j]) for j, col in enumerate(bundle.target_cols)}
+                # Only overwrite the entry we read: a user re-forecast in the meantime wins
+                ops.append(UpdateOne(
+                    {'project_id': project_id,
+                     'forecasts': {'$elemMatch': {'forecast_month': month, 'model_version': old_version}}},
+                    {'$set': {'forecasts.$.predictions': results,
+                              'forecasts.$.model_version': bundle.version,
+                              'forecasts.$.input_fingerprint': input_fingerprint(bundle.version, encoded),
+                              'forecasts.$.updated_at': now,
+                              'forecasts.$.reforecast_at': now}}
+                ))
+                written.append((project_id, month, row, results))
+            start = time.perf_counter()
+            result = self.project_forecasts.bulk_write(ops, ordered=False)
+            increments['write_seconds'] += time.perf_counter() - start
+            increments['rows_predicted'] += len(chunk)
+            increments['rows_written'] += result.modified_count
+            increments['rows_conflicted'] += len(chunk) - result.matched_count
+            if self.on_write:
+                try:
+                    self.on_write(written)
+                except Exception as e:
+                    print(f"Re-forecast write listener failed: {e}")
+        increments['chunks'] += 1
+        self._checkpoint(bundle.version, last_project_id, increments)
+        self.last_result = {'version': bundle.version, 'last_project_id': last_project_id}
+
+    def _run(self, bundle, after):
+        version = bundle.version
+        chunk, counters = [], {counter: 0 for counter in COUNTERS}
+        last_project_id = after
+        for doc in self._stale_docs(version, after):
+            # Chunks end on project boundaries so last_project_id is a clean resume point
+            if len(chunk) >= self.chunk_rows:
+                self._flush(bundle, chunk, last_project_id, counters)
+                chunk = []
+                if self._stop.is_set():
+                    return 'paused'
+                active = self.registry.active
+                if active is None or active.version != version:
+                    raise ReforecastSuperseded(active.version if active else None)
+            counters['projects_scanned'] += 1
+            for entry in doc.get('forecasts', []):
+                old_version = entry.get('model_version')
+                if old_version == version or not isinstance(entry.get('features'), dict):
+                    continue
+                try:
+                    row = bundle.schema.validate(entry['features'])
+                except FeatureValidationError:
+                    # Stored inputs the current schema rejects keep their old prediction
+                    counters['rows_invalid'] += 1
+                    continue
+                chunk.append((doc['project_id'], entry.get('forecast_month'), old_version, row))
+            last_project_id = doc['project_id']
+        self._flush(bundle, chunk, last_project_id, counters)
+        return 'completed'
+
+    def run(self, bundle=None, restart=False, create=True):
+        """Re-forecast every stale entry for bundle (default: the active model); returns the final state"""
+        bundle = bundle or self.registry.active
+        if bundle is None:
+            return 'skipped'
+        doc = self._claim(bundle.version, create=create, restart=restart)
+        if doc is None:
+            return 'skipped'
+        self.version = bundle.version
+        print(f"Re-forecast for model {bundle.version} "
+              f"{'resumed after ' + str(doc['last_project_id']) if doc.get('last_project_id') else 'started'}")
+        try:
+            state = self._run(bundle, doc.get('last_project_id'))
+            error = None
+        except InferenceQueueFull:
+            state, error = 'paused', None
+        except InferenceTimeout as e:
+            state, error = 'paused', str(e)
+            print(f"Re-forecast for model {bundle.version} paused: {e}")
+        except ReforecastSuperseded as e:
+            state, error = 'superseded', f'model {e} became active'
+        except Exception as e:
+            state, error = 'failed', str(e)
+            print(f"Re-forecast for model {bundle.version} failed: {e}")
+        self._finish(bundle.version, state, error)
+        print(f"Re-forecast for model {bundle.version} {state}")
+        return state
+
+    def _drain(self, job):
+        """Thread body: run job, then whatever was queued behind it"""
+        while job is not None:
+            try:
+                self.run(*job)
+            finally:
+                with self._lock:
+                    job, self._pending = self._pending, None
+                    if job is None:
+                        # Cleared under the lock so a concurrent trigger starts a new thread
+                        self._thread = None
+                    else:
+                        self._stop.clear()
+
+    def trigger(self, bundle=None, restart=False, create=True, queue=False):
+        """Run in a background thread; False if this worker is already running one.
+
+        With queue=True a busy worker instead remembers the job and starts it as
+        soon as the running one exits (a superseded run stops at its next chunk).
+        Only the latest queued job is kept.
+        """
+        with self._lock:
+            if self._thread is not None:
+                if not queue:
+                    return False
+                self._pending = (bundle, restart, create)
+                return True
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._drain, args=((bundle, restart, create),),
+                                            name='portfolio-reforecast', daemon=True)
+            self._thread.start()
+        return True
+
+    def resume(self):
+        """Continue an unfinished job for the active version (startup); never starts a new one"""
+        return self.trigger(create=False)
+
+    def stop(self):
+        """Pause after the current chunk; the job can be resumed from its checkpoint"""
+        with self._lock:
+            self._pending = None
+        self._stop.set()
+
+    def status(self, version=None):
+        version = version or self.version or (self.registry.active.version if self.registry.active else None)
+        doc = self.jobs.find_one({'_id': version}) if version else None
+        if doc is None:
+            return {'version': version, 'state': 'not_started', 'running_here': self.running}
+        status = {key: value for key, value in doc.items() if key != '_id'}
+        for key in ('heartbeat_at', 'started_at', 'finished_at'):
+            if isinstance(status.get(key), datetime):
+                status[key] = status[key].isoformat()
+        busy = status.get('predict_seconds', 0) + status.get('write_seconds', 0)
+        status.update({
+            'version': version,
+            'running_here': self.running and self.version == version,
+            'predict_seconds': round(status.get('predict_seconds', 0), 3),
+            'write_seconds': round(status.get('write_seconds', 0), 3),
+            'rows_per_second': round(status.get('rows_predicted', 0) / busy, 1) if busy else None,
+        })
+        return status
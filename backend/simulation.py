@@ -0,0 +1,218 @@
+# Monte Carlo demand and cost simulation around the point forecast
+#
+# Each project's validated input row is replicated once per draw, with
+# lead_time_days and commodity_price_index (or any other numeric feature)
+# replaced by samples from the requested distributions. The whole
+# (projects x draws) scenario matrix goes through the model in one predict, and
+# quantities are priced per draw, so P10/P50/P90 of every target and of the
+# cost come from plain quantile reductions over the draw axis.
+#
+# Tree models are piecewise constant: two values of a feature that fall between
+# the same pair of split thresholds take identical paths through every tree.
+# Draws are therefore bucketed by split interval and only one representative
+# row per (project, interval combination) is predicted; the results are
+# scattered back to every draw. This is exact, and it turns millions of
+# scenarios into a few thousand model rows.
+
+import os
+import threading
+
+import numpy as np
+
+from inference import flatten_booster
+
+FORECAST_SIMULATION_MAX_DRAWS = int(os.getenv('FORECAST_SIMULATION_MAX_DRAWS', '20000'))
+FORECAST_SIMULATION_MAX_SCENARIOS = int(os.getenv('FORECAST_SIMULATION_MAX_SCENARIOS', '2000000'))
+DEFAULT_DRAWS = 5000
+DEFAULT_QUANTILES = (10, 50, 90)
+DISTRIBUTIONS = ('normal', 'lognormal', 'uniform', 'triangular')
+# Used when a request does not describe the uncertainty itself
+DEFAULT_UNCERTAINTY = {
+    'lead_time_days': {'dist': 'normal', 'sd_pct': 20},
+    'commodity_price_index': {'dist': 'normal', 'sd_pct': 10},
+}
+PRICE_INDEX_FEATURE = 'commodity_price_index'
+
+
+class SimulationInputError(ValueError):
+    pass
+
+
+def _number(spec, key, feature, required=False, minimum=None):
+    value = spec.get(key)
+    if value is None:
+        if required:
+            raise SimulationInputError(f'{feature}.{key} is required for dist {spec["dist"]}')
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not np.isfinite(value):
+        raise SimulationInputError(f'{feature}.{key} must be a number')
+    if minimum is not None and value < minimum:
+        raise SimulationInputError(f'{feature}.{key} must be >= {minimum}')
+    return float(value)
+
+
+def parse_uncertainty(uncertainty, schema):
+    """Validate {feature: {'dist', params..., 'shared'}} against the schema's numeric features"""
+    if uncertainty is None:
+        uncertainty = {f: dict(spec) for f, spec in DEFAULT_UNCERTAINTY.items() if f in schema}
+    if not isinstance(uncertainty, dict) or not uncertainty:
+        raise SimulationInputError('uncertainty must be a non-empty object keyed by feature')
+    parsed = {}
+    for feature, spec in uncertainty.items():
+        if feature not in schema or schema.spec(feature).categorical:
+            raise SimulationInputError(f'{feature} is not a numeric model feature')
+        if not isinstance(spec, dict) or spec.get('dist', 'normal') not in DISTRIBUTIONS:
+            raise SimulationInputError(f'{feature}.dist must be one of {list(DISTRIBUTIONS)}')
+        spec = {**spec, 'dist': spec.get('dist', 'normal')}
+        clean = {'dist': spec['dist'], 'shared': bool(spec.get('shared', False))}
+        if spec['dist'] in ('normal', 'lognormal'):
+            clean['sd'] = _number(spec, 'sd', feature, minimum=0)
+            clean['sd_pct'] = _number(spec, 'sd_pct', feature, minimum=0)
+            if clean['sd'] is None and clean['sd_pct'] is None:
+                raise SimulationInputError(f'{feature} needs sd or sd_pct')
+            if spec['dist'] == 'lognormal' and clean['sd_pct'] is None:
+                raise SimulationInputError(f'{feature} lognormal needs sd_pct')
+        else:
+            clean['low'] = _number(spec, 'low', feature, required=True)
+            clean['high'] = _number(spec, 'high', feature, required=True)
+            clean['mode'] = _number(spec, 'mode', feature)
+            if clean['low'] > clean['high'] or (clean['mode'] is not None and not clean['low'] <= clean['mode'] <= clean['high']):
+                raise SimulationInputError(f'{feature} needs low <= mode <= high')
+        parsed[feature] = clean
+    return parsed
+
+
+def draw_feature(rng, spec, base, draws):
+    """(projects, draws) samples around each project's point value `base`"""
+    shape = (1 if spec['shared'] else base.size, draws)
+    if spec['dist'] == 'normal':
+        sd = spec['sd'] if spec['sd'] is not None else np.abs(base) * spec['sd_pct'] / 100.0
+        values = base[:, None] + np.reshape(sd, (-1, 1)) * rng.standard_normal(shape)
+    elif spec['dist'] == 'lognormal':
+        # Multiplicative, mean-preserving noise
+        sigma = spec['sd_pct'] / 100.0
+        values = base[:, None] * np.exp(sigma * rng.standard_normal(shape) - sigma ** 2 / 2)
+    elif spec['dist'] == 'uniform':
+        values = np.broadcast_to(rng.uniform(spec['low'], spec['high'], shape), (base.size, draws))
+    else:
+        # Triangular around the given mode, or each project's own value clipped into [low, high]
+        mode = spec['mode'] if spec['mode'] is not None else np.clip(base, spec['low'], spec['high'])
+        u = rng.random(shape)
+        low, high = spec['low'], spec['high']
+        mode = np.reshape(mode, (-1, 1))
+        split = (mode - low) / (high - low) if high > low else np.zeros_like(mode)
+        values = np.where(u < split,
+                          low + np.sqrt(u * (high - low) * (mode - low)),
+                          high - np.sqrt((1 - u) * (high - low) * (high - mode)))
+    return np.broadcast_to(values, (base.size, draws))
+
+
+_thresholds_cache = {}
+_thresholds_lock = threading.Lock()
+
+
+def split_thresholds(bundle):
+    """{feature column: sorted float32 split thresholds} over every tree of every target, or None"""
+    with _thresholds_lock:
+        if bundle.version in _thresholds_cache:
+            return _thresholds_cache[bundle.version]
+    thresholds = None
+    try:
+        per_feature = {}
+        for est in bundle.model.estimators_:
+            booster = est.get_booster()
+            names = booster.feature_names or bundle.feature_cols
+            column = [bundle.feature_cols.index(name) for name in names]
+            trees, _ = flatten_booster(booster)
+            for tree in trees:
+                internal = tree['left'] != -1
+                for feature, threshold in zip(tree['feature'][internal], tree['threshold'][internal]):
+                    per_feature.setdefault(column[feature], set()).add(threshold)
+        thresholds = {col: np.sort(np.fromiter(values, dtype=np.float32)) for col, values in per_feature.items()}
+    except (AttributeError, ValueError, KeyError) as e:
+        print(f"Split-interval bucketing unavailable for model {bundle.version}: {e}")
+    with _thresholds_lock:
+        _thresholds_cache.clear()
+        _thresholds_cache[bundle.version] = thresholds
+    return thresholds
+
+
+def scenario_rows(X_base, varied, thresholds):
+    """Unique model rows for all scenarios.
+
+    X_base is (projects, features) float32, varied maps a feature column to its
+    (projects, draws) samples. Returns (X_unique, inverse) such that
+    predictions[inverse] reshaped to (projects, draws, targets) covers every scenario.
+    """
+    n_projects = X_base.shape[0]
+    draws = next(iter(varied.values())).shape[1]
+    samples = {col: np.asarray(values, dtype=np.float32) for col, values in varied.items()}
+    key = np.repeat(np.arange(n_projects, dtype=np.int64), draws)
+    if thresholds is not None:
+        for col, values in samples.items():
+            cuts = thresholds.get(col, np.empty(0, dtype=np.float32))
+            # XGBoost goes left when x < threshold: one bucket per [t_i, t_i+1) interval
+            key = key * (cuts.size + 1) + np.searchsorted(cuts, values.ravel(), side='right')
+        _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    else:
+        first = np.arange(key.size)
+        inverse = first
+    X = X_base[first // draws].copy()
+    for col, values in samples.items():
+        X[:, col] = values.ravel()[first]
+    return X, inverse.ravel()
+
+
+def summarize(values, quantiles, axis):
+    """{'p10': ..., 'mean': ...} reductions along the draw axis"""
+    points = np.percentile(values, quantiles, axis=axis)
+    out = {f'p{q:g}': points[i] for i, q in enumerate(quantiles)}
+    out['mean'] = values.mean(axis=axis)
+    return out
+
+
+def simulate(bundle, raw_rows, uncertainty, unit_prices, predict, draws=DEFAULT_DRAWS,
+             quantiles=DEFAULT_QUANTILES, seed=None):
+    """Run the simulation for validated raw rows; returns arrays for the caller to format.
+
+    unit_prices is a (targets,) array. Cost per draw is quantity x unit price,
+    scaled by the drawn commodity_price_index relative to the project's own
+    value when that feature is simulated.
+    """
+    schema = bundle.schema
+    rng = np.random.default_rng(seed)
+    X_base = schema.encode(raw_rows)
+    varied = {}
+    for feature, spec in uncertainty.items():
+        col = schema.spec(feature).index
+        values = draw_feature(rng, spec, X_base[:, col].astype(np.float64), draws)
+        feature_spec = schema.spec(feature)
+        if feature_spec.minimum is not None or feature_spec.maximum is not None:
+            values = np.clip(values, feature_spec.minimum, feature_spec.maximum)
+        varied[col] = values
+
+    thresholds = split_thresholds(bundle)
+    X, inverse = scenario_rows(X_base, varied, thresholds)
+    # Point forecasts ride along in the same predict call
+    predictions = np.asarray(predict(np.vstack([X, X_base])), dtype=np.float64)
+    point = predictions[X.shape[0]:]
+    quantities = predictions[:X.shape[0]][inverse].reshape(X_base.shape[0], draws, -1)
+
+    multiplier = 1.0
+    if PRICE_INDEX_FEATURE in uncertainty:
+        col = schema.spec(PRICE_INDEX_FEATURE).index
+        base = X_base[:, col].astype(np.float64)[:, None]
+        multiplier = np.where(base > 0, varied[col] / np.where(base > 0, base, 1.0), 1.0)
+    costs = (quantities @ unit_prices) * multiplier  # (projects, draws)
+
+    quantiles = list(quantiles)
+    return {
+        'point': point,
+        'point_cost': point @ unit_prices,
+        'quantities': summarize(quantities, quantiles, axis=1),           # each (projects, targets)
+        'cost': summarize(costs, quantiles, axis=1),                      # each (projects,)
+        'portfolio_quantities': summarize(quantities.sum(axis=0), quantiles, axis=0),  # each (targets,)
+        'portfolio_cost': summarize(costs.sum(axis=0), quantiles, axis=0),
+        'scenarios': int(X_base.shape[0] * draws),
+        'model_rows': int(X.shape[0]),
+    }
@@ -0,0 +1,59 @@
+# Shared fixtures. Run from the backend directory:  python -m pytest tests
+
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from feature_schema import FeatureSchema  # noqa: E402
+from inference import SklearnInferenceEngine  # noqa: E402
+
+FEATURE_COLS = ['budget', 'project_size_km', 'lead_time_days', 'commodity_price_index']
+TARGET_COLS = ['steel', 'conductors']
+
+
+@pytest.fixture(scope='session')
+def training_frame():
+    rng = np.random.default_rng(7)
+    X = pd.DataFrame({
+        'budget': rng.uniform(1e7, 6e7, 600),
+        'project_size_km': rng.uniform(10, 300, 600),
+        'lead_time_days': rng.uniform(10, 120, 600),
+        'commodity_price_index': rng.uniform(80, 140, 600),
+    }, columns=FEATURE_COLS).astype(np.float32)
+    # Some missing values so trees learn default directions too
+    X.loc[rng.random(600) < 0.05, 'lead_time_days'] = np.nan
+    Y = pd.DataFrame({
+        'steel': X['budget'] / 1e5 + 3 * X['project_size_km'] + rng.normal(0, 20, 600),
+        'conductors': X['project_size_km'] * X['commodity_price_index'] / 50 + X['lead_time_days'].fillna(60),
+    }, columns=TARGET_COLS)
+    return X, Y
+
+
+@pytest.fixture(scope='session')
+def model(training_frame):
+    """Small MultiOutputRegressor of XGBRegressors, shaped like the served artifact"""
+    xgb = pytest.importorskip('xgboost')
+    from sklearn.multioutput import MultiOutputRegressor
+    X, Y = training_frame
+    model = MultiOutputRegressor(xgb.XGBRegressor(n_estimators=40, max_depth=4, learning_rate=0.2, n_jobs=1))
+    return model.fit(X, Y)
+
+
+@pytest.fixture(scope='session')
+def bundle(model):
+    """The parts of a registry bundle that forecast code reads"""
+    return SimpleNamespace(
+        version='test-model',
+        model=model,
+        feature_cols=list(FEATURE_COLS),
+        target_cols=list(TARGET_COLS),
+        schema=FeatureSchema(FEATURE_COLS),
+        inference_engine=SklearnInferenceEngine(model, FEATURE_COLS),
+    )
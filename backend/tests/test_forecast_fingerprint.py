@@ -0,0 +1,74 @@
+import importlib
+
+import numpy as np
+import pytest
+
+from conftest import BACKEND_DIR
+from forecast_cache import input_fingerprint
+
+mongomock = pytest.importorskip('mongomock')
+
+
+@pytest.fixture(scope='module')
+def api(tmp_path_factory):
+    """app.py loaded synchronously against an in-memory Mongo, with a test user's headers"""
+    client = mongomock.MongoClient()
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(BACKEND_DIR)
+        patch.setenv('MODEL_REGISTRY_DIR', str(tmp_path_factory.mktemp('registry')))
+        patch.setenv('BACKGROUND_STARTUP', 'false')
+        patch.setenv('MODEL_REFRESH_INTERVAL_SECONDS', '0')
+        patch.setenv('MODEL_REGISTRY_POLL_SECONDS', '0')
+        patch.setattr('pymongo.MongoClient', lambda *args, **kwargs: client)
+        # mongomock's bulk builder predates the sort option pymongo passes with UpdateOne
+        add_update = mongomock.collection.BulkOperationBuilder.add_update
+        patch.setattr(mongomock.collection.BulkOperationBuilder, 'add_update',
+                      lambda self, *args, sort=None, **kwargs: add_update(self, *args, **kwargs))
+        app = importlib.import_module('app')
+        if app.model_registry.active is None:
+            pytest.skip('model artifacts are not available')
+        app.users_collection.insert_one({'username': 'tester', 'email': 'tester@example.com', 'role': 'user'})
+        with app.app.app_context():
+            token = app.create_access_token(identity='tester')
+        yield app, app.app.test_client(), {'Authorization': f'Bearer {token}'}
+
+
+def test_fingerprint_covers_inputs_and_model_version():
+    row = np.array([1.0, 2.0, 3.0], dtype=np.float32)
+    assert input_fingerprint('v1', row) == input_fingerprint('v1', row.copy())
+    assert input_fingerprint('v1', row) != input_fingerprint('v2', row)
+    assert input_fingerprint('v1', row) != input_fingerprint('v1', np.array([1.0, 2.0, 3.5], dtype=np.float32))
+
+
+def test_repeat_forecast_skips_unchanged_months(api, monkeypatch):
+    app, client, headers = api
+    payload = {'project_id': 'FP-1', 'forecast_month': '2026-01', 'horizon': 3, 'budget': 40000000}
+    first = client.post('/api/forecast', json=payload, headers=headers)
+    assert first.status_code == 200
+    assert first.get_json()['unchanged_months'] == []
+    stored = app.project_forecasts_collection.find_one({'project_id': 'FP-1'}, {'_id': 0})
+
+    def fail(*args, **kwargs):
+        raise AssertionError('an unchanged month was predicted or written again')
+
+    monkeypatch.setattr(app, 'predict_forecast_rows', fail)
+    monkeypatch.setattr(app.project_forecasts_collection, 'bulk_write', fail)
+    second = client.post('/api/forecast', json=payload, headers=headers)
+    assert second.status_code == 200
+    assert second.get_json()['unchanged_months'] == ['2026-01', '2026-02', '2026-03']
+    assert second.get_json()['forecasts'] == first.get_json()['forecasts']
+    assert app.project_forecasts_collection.find_one({'project_id': 'FP-1'}, {'_id': 0}) == stored
+
+
+def test_changed_month_inputs_are_predicted_again(api):
+    app, client, headers = api
+    payload = {'project_id': 'FP-2', 'forecast_month': '2026-01', 'horizon': 3, 'budget': 40000000}
+    assert client.post('/api/forecast', json=payload, headers=headers).status_code == 200
+
+    payload['monthly_features'] = {'2026-02': {'commodity_price_index': 130}}
+    response = client.post('/api/forecast', json=payload, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['unchanged_months'] == ['2026-01', '2026-03']
+    months = {entry['forecast_month']: entry
+              for entry in app.project_forecasts_collection.find_one({'project_id': 'FP-2'})['forecasts']}
+    assert months['2026-02']['features']['commodity_price_index'] == 130
@@ -0,0 +1,92 @@
+from forecast_rollup import ROLLUP_LEVELS, UNKNOWN_GROUP, ForecastRollup
+
+NORTH = {'project_location': 'North', 'tower_type': 'Lattice', 'substation_type': 'AIS'}
+EAST = {'project_location': 'East', 'tower_type': 'Lattice', 'substation_type': 'GIS'}
+SOUTH = {'project_location': 'South', 'tower_type': 'Monopole', 'substation_type': 'AIS'}
+
+
+class FakeCollection:
+    """Just enough of a pymongo collection for ForecastRollup.rebuild"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, *args, **kwargs):
+        return iter(self.docs)
+
+
+def snapshot(rollup):
+    """Every level as {group label: (forecast, actual, entries)}, independent of axis order"""
+    levels = {}
+    for level in ROLLUP_LEVELS:
+        result = rollup.query(level, months=['2025-01', '2025-02', '2025-03'], targets=['steel', 'conductors'])
+        levels[level] = {str(g['group']): (g['forecast'], g['actual'], g['entries']) for g in result['groups']}
+    return levels
+
+
+def test_incremental_updates_match_rebuild():
+    rollup = ForecastRollup(initial_capacity=(1, 1, 1, 1, 1))
+    rollup.record('p1', '2025-01', NORTH, {'steel': 10, 'conductors': 5}, {})
+    rollup.record('p1', '2025-02', NORTH, {'steel': 12, 'conductors': 6}, {})
+    rollup.record('p2', '2025-01', SOUTH, {'steel': 7, 'conductors': 'n/a'}, {})
+    # Re-forecast with new inputs keeps the recorded actuals and moves the entry to another group
+    rollup.record_actuals('p1', '2025-01', {'steel': 9.5})
+    rollup.record('p1', '2025-01', EAST, {'steel': 11, 'conductors': 4}, keep_actuals=True)
+    rollup.record_actuals('p2', '2025-01', {'steel': 8})
+    # Entry actuals win over material actuals; a month without a forecast is actual-only
+    rollup.record_material_actuals('p1', '2025-01', {'steel': 100, 'conductors': 3})
+    rollup.record_material_actuals('p1', '2025-03', {'steel': 2})
+    rollup.record_material_actuals('p3', '2025-02', {'conductors': 1})
+    # Actuals that arrive before the project's first forecast follow it into its group
+    rollup.record_material_actuals('p4', '2025-01', {'steel': 4})
+    rollup.record('p4', '2025-02', SOUTH, {'steel': 6}, {})
+
+    forecasts = FakeCollection([
+        {'project_id': 'p1', 'forecasts': [
+            {'forecast_month': '2025-01', 'features': EAST, 'predictions': {'steel': 11, 'conductors': 4},
+             'actual_values': {'steel': 9.5}},
+            {'forecast_month': '2025-02', 'features': NORTH, 'predictions': {'steel': 12, 'conductors': 6}},
+        ]},
+        {'project_id': 'p2', 'forecasts': [
+            {'forecast_month': '2025-01', 'features': SOUTH, 'predictions': {'steel': 7, 'conductors': 'n/a'},
+             'actual_values': {'steel': 8}},
+        ]},
+        {'project_id': 'p4', 'forecasts': [
+            {'forecast_month': '2025-02', 'features': SOUTH, 'predictions': {'steel': 6}},
+        ]},
+    ])
+    material_actuals = FakeCollection([
+        {'project_id': 'p1', 'month': '2025-01', 'material_values': {'steel': 100, 'conductors': 3}},
+        {'project_id': 'p1', 'month': '2025-03', 'material_values': {'steel': 2}},
+        {'project_id': 'p3', 'month': '2025-02', 'material_values': {'conductors': 1}},
+        {'project_id': 'p4', 'month': '2025-01', 'material_values': {'steel': 4}},
+    ])
+    rebuilt = ForecastRollup()
+    rebuilt.rebuild(forecasts, material_actuals)
+
+    assert snapshot(rollup) == snapshot(rebuilt)
+    national = snapshot(rebuilt)['national']['national']
+    assert national[0] == [[18.0, 4.0], [18.0, 6.0], [0.0, 0.0]]
+    assert national[1] == [[21.5, 3.0], [0.0, 1.0], [2.0, 0.0]]
+    locations = snapshot(rebuilt)['project_location']
+    assert locations['South'][1] == [[12.0, 0.0], [0.0, 0.0], [0.0, 0.0]]
+    assert locations[UNKNOWN_GROUP][2] == [0, 1, 0]
+
+
+def test_rebuild_keeps_writes_made_while_scanning():
+    rollup = ForecastRollup()
+
+    class ConcurrentWrites(FakeCollection):
+        def find(self, *args, **kwargs):
+            # A request thread records an entry after the scan started
+            rollup.record('p2', '2025-02', SOUTH, {'steel': 3}, {})
+            return super().find(*args, **kwargs)
+
+    rollup.rebuild(ConcurrentWrites([
+        {'project_id': 'p1', 'forecasts': [{'forecast_month': '2025-01', 'features': NORTH,
+                                            'predictions': {'steel': 5}}]},
+    ]))
+    assert snapshot(rollup)['project_location'] == {
+        'North': ([[5.0], [0.0]], [[0.0], [0.0]], [1, 0]),
+        'South': ([[0.0], [3.0]], [[0.0], [0.0]], [0, 1]),
+    }
@@ -0,0 +1,41 @@
+import numpy as np
+
+from inference import SklearnInferenceEngine, TreeArrayInferenceEngine, flatten_booster
+from conftest import FEATURE_COLS
+
+
+def probe_rows(model, training_frame):
+    """Training rows, rows sitting exactly on split thresholds, and missing values"""
+    X = training_frame[0].to_numpy(dtype=np.float32)
+    rows = [X[:200]]
+    for est in model.estimators_:
+        trees, _ = flatten_booster(est.get_booster())
+        for tree in trees[:10]:
+            internal = tree['left'] != -1
+            for feature, threshold in zip(tree['feature'][internal], tree['threshold'][internal]):
+                row = X[0].copy()
+                row[feature] = threshold
+                rows.append(row[None, :])
+    missing = X[:20].copy()
+    missing[::2, 0] = np.nan
+    missing[1::2, 2] = np.nan
+    rows.append(missing)
+    return np.vstack(rows)
+
+
+def test_tree_array_engine_matches_model_predict(model, training_frame):
+    X = probe_rows(model, training_frame)
+    engine = TreeArrayInferenceEngine(model, FEATURE_COLS)
+    reference = SklearnInferenceEngine(model, FEATURE_COLS).predict(X)
+    predictions = engine.predict(X)
+    assert predictions.shape == reference.shape == (len(X), len(model.estimators_))
+    assert np.max(np.abs(predictions - reference)) <= 1e-5 * np.max(np.abs(reference))
+
+
+def test_tree_array_engine_reorders_columns(model, training_frame):
+    # Callers may hold the features in another order than the boosters were trained on
+    order = FEATURE_COLS[::-1]
+    X = probe_rows(model, training_frame)
+    engine = TreeArrayInferenceEngine(model, order)
+    reference = SklearnInferenceEngine(model, FEATURE_COLS).predict(X)
+    np.testing.assert_allclose(engine.predict(X[:, ::-1]), reference, rtol=1e-5)
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import reforecast
+from reforecast import PortfolioReforecastJob
+
+mongomock = pytest.importorskip('mongomock')
+
+
+@pytest.fixture
+def jobs():
+    return mongomock.MongoClient().db.reforecast_jobs
+
+
+def worker(jobs, owner):
+    job = PortfolioReforecastJob(registry=None, project_forecasts=None, jobs=jobs)
+    job.owner = owner
+    return job
+
+
+def test_only_one_worker_holds_a_running_lease(jobs):
+    first, second = worker(jobs, 'host-a:1'), worker(jobs, 'host-b:2')
+    assert first._claim('v2')['owner'] == 'host-a:1'
+    assert second._claim('v2') is None
+    assert jobs.find_one({'_id': 'v2'})['owner'] == 'host-a:1'
+
+
+def test_stale_lease_is_taken_over_and_old_owner_is_fenced(jobs):
+    first, second = worker(jobs, 'host-a:1'), worker(jobs, 'host-b:2')
+    first._claim('v2')
+    stale = datetime.now(timezone.utc) - timedelta(seconds=reforecast.FORECAST_REFORECAST_STALE_SECONDS + 1)
+    jobs.update_one({'_id': 'v2'}, {'$set': {'heartbeat_at': stale}})
+
+    assert second._claim('v2')['owner'] == 'host-b:2'
+    # The worker that lost the lease can no longer move the checkpoint or finish the job
+    first._checkpoint('v2', 'P-900', {'rows_written': 5})
+    first._finish('v2', 'completed')
+    doc = jobs.find_one({'_id': 'v2'})
+    assert (doc['state'], doc['owner'], doc['last_project_id'], doc['rows_written']) == \
+        ('running', 'host-b:2', None, 0)
+
+
+def test_paused_job_resumes_and_completed_job_needs_restart(jobs):
+    job = worker(jobs, 'host-a:1')
+    assert job._claim('v2', create=False) is None
+    assert jobs.count_documents({}) == 0
+
+    job._claim('v2')
+    job._checkpoint('v2', 'P-100', {'rows_written': 40})
+    job._finish('v2', 'paused')
+    resumed = worker(jobs, 'host-b:2')._claim('v2', create=False)
+    assert (resumed['last_project_id'], resumed['rows_written']) == ('P-100', 40)
+
+    job = worker(jobs, 'host-b:2')
+    job._finish('v2', 'completed')
+    assert job._claim('v2') is None
+    restarted = job._claim('v2', restart=True)
+    assert (restarted['state'], restarted['last_project_id'], restarted['rows_written']) == ('running', None, 0)
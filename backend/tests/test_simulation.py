@@ -0,0 +1,37 @@
+import numpy as np
+
+from simulation import parse_uncertainty, scenario_rows, simulate, split_thresholds
+
+
+def draws_around(bundle, rows, draws=2000, seed=3):
+    X_base = bundle.schema.encode(rows)
+    rng = np.random.default_rng(seed)
+    varied = {}
+    for feature, sd in (('lead_time_days', 15.0), ('commodity_price_index', 12.0)):
+        col = bundle.schema.spec(feature).index
+        varied[col] = X_base[:, [col]] + sd * rng.standard_normal((len(rows), draws))
+    return X_base, varied
+
+
+def test_bucketed_scenarios_predict_like_every_draw(bundle):
+    rows = [bundle.schema.validate({'budget': 2e7, 'project_size_km': 80}),
+            bundle.schema.validate({'budget': 5e7, 'project_size_km': 250, 'lead_time_days': 90})]
+    X_base, varied = draws_around(bundle, rows)
+    predict = bundle.inference_engine.predict
+
+    X_bucketed, inverse_bucketed = scenario_rows(X_base, varied, split_thresholds(bundle))
+    X_full, inverse_full = scenario_rows(X_base, varied, None)
+
+    assert len(X_full) == 2 * 2000
+    assert len(X_bucketed) < len(X_full)
+    np.testing.assert_array_equal(predict(X_bucketed)[inverse_bucketed], predict(X_full)[inverse_full])
+
+
+def test_simulate_predicts_one_row_per_bucket(bundle):
+    rows = [bundle.schema.validate({'budget': 3e7})]
+    uncertainty = parse_uncertainty(None, bundle.schema)
+    result = simulate(bundle, rows, uncertainty, np.ones(len(bundle.target_cols)),
+                      bundle.inference_engine.predict, draws=500, seed=1)
+    assert result['scenarios'] == 500
+    assert result['model_rows'] < result['scenarios']
+    np.testing.assert_array_equal(result['point'], bundle.inference_engine.predict(bundle.schema.encode(rows)))
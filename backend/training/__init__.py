@@ -0,0 +1,2 @@
+# Offline training tools for the material demand model
+# Run from the backend directory, e.g. `python -m training.train`.
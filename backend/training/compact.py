@@ -0,0 +1,159 @@
+"""
+Compact a published model version into native XGBoost boosters.
+
+Reads a registry version (or the legacy root artifacts), drops the sklearn
+wrapper state, optionally prunes low-gain trees within an accuracy budget, and
+publishes the result as a new version whose model is model_compact.json plus
+boosters/*.ubj. Resident memory and load time of both artifacts are measured in
+fresh processes and stored in the manifest.
+
+    cd backend && python -m training.compact [--version V] [--prune-tolerance 0.002]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+from compact_model import COMPACT_INDEX_FILE, compact_model, save_compact_model
+from model_registry import ModelRegistry, publish_model_version
+
+
+def rss_bytes():
+    """Current resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is KiB on Linux; only a peak, but the best available fallback
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _probe_load(model_path, feature_cols, repeat):
+    """Runs in a fresh process: load the artifact, build the serving engine, report cost"""
+    import xgboost  # noqa: F401 - library load cost is not part of the artifact's footprint
+    from compact_model import load_model_artifact
+    from inference import build_inference_engine
+
+    before = rss_bytes()
+    start = time.perf_counter()
+    model = load_model_artifact(model_path)
+    engine = build_inference_engine(model, feature_cols)
+    load_seconds = time.perf_counter() - start
+    resident = rss_bytes() - before
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        load_model_artifact(model_path)
+        timings.append(time.perf_counter() - start)
+    return {
+        'rss_bytes': int(resident),
+        'first_load_seconds': round(load_seconds, 4),
+        'load_seconds': round(float(np.median(timings)), 4) if timings else None,
+        'inference_backend': engine.name,
+    }
+
+
+def measure_artifact(model_path, feature_cols, repeat=3):
+    """Resident memory and load time of one model artifact, measured in a spawned process"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+        result = pool.submit(_probe_load, model_path, list(feature_cols), repeat).result()
+    result['file_bytes'] = artifact_bytes(model_path)
+    return result
+
+
+def artifact_bytes(model_path):
+    """On-disk size: the joblib file, or the compact index plus its booster files"""
+    if not model_path.endswith('.json'):
+        return os.path.getsize(model_path)
+    with open(model_path) as f:
+        index = json.load(f)
+    directory = os.path.dirname(model_path)
+    return os.path.getsize(model_path) + sum(
+        os.path.getsize(os.path.join(directory, entry['file'])) for entry in index['boosters']
+    )
+
+
+def reference_matrix(bundle, csv_path, max_rows=2000):
+    """Encoded rows from the training CSV, used as the pruning accuracy reference"""
+    df = pd.read_csv(csv_path, usecols=lambda c: c in bundle.feature_cols)
+    if len(df) > max_rows:
+        df = df.sample(max_rows, random_state=42)
+    return bundle.schema.encode(df.to_dict('records'))
+
+
+def compact_version(registry, version=None, prune_tolerance=0.0, reference_csv=None,
+                    activate=False, measure=True):
+    """Compact `version` (default: the current one, or legacy) and publish it as a new version"""
+    version = version or registry.current_version()
+    bundle = registry.load_version(version) if version else registry.load_legacy()
+    source_path = os.path.join(bundle.source, bundle.manifest.get('model_file', 'model.joblib')) \
+        if version else os.path.join(registry.legacy_dir, 'multi_xgb_model.joblib')
+
+    X_reference = None
+    if prune_tolerance > 0:
+        X_reference = reference_matrix(bundle, reference_csv or registry.reference_csv)
+    start = time.perf_counter()
+    model, report = compact_model(bundle.model, X_reference, prune_tolerance)
+    report['compact_seconds'] = round(time.perf_counter() - start, 3)
+    if X_reference is not None:
+        delta = model.predict(X_reference) - bundle.model.predict(pd.DataFrame(X_reference, columns=bundle.feature_cols))
+        report['max_abs_prediction_shift'] = float(np.abs(delta).max())
+
+    if measure:
+        # Measure the compact artifact from a scratch copy so the manifest is complete on publish
+        with tempfile.TemporaryDirectory() as scratch:
+            save_compact_model(model, scratch)
+            report['before'] = measure_artifact(source_path, bundle.feature_cols)
+            report['after'] = measure_artifact(os.path.join(scratch, COMPACT_INDEX_FILE), bundle.feature_cols)
+
+    metadata = dict(bundle.manifest.get('metadata', {}))
+    metadata.update({'parent_version': bundle.version, 'compaction': report})
+    new_version = publish_model_version(registry.registry_dir, model, bundle.feature_cols, bundle.target_cols,
+                                        bundle.label_encoders, metadata=metadata, activate=activate)
+    return new_version, report
+
+
+def print_report(version, report):
+    print(f"Published compact model version {version}")
+    print(f"Trees: {report['trees_before']} -> {report['trees_after']} "
+          f"(prune tolerance {report['prune_tolerance']})")
+    if 'max_abs_prediction_shift' in report:
+        print(f"Max absolute prediction shift on reference rows: {report['max_abs_prediction_shift']:.6f}")
+    if 'before' in report:
+        print(f"{'':14s} {'file MB':>9s} {'RSS MB':>9s} {'load s':>9s}")
+        for label in ('before', 'after'):
+            m = report[label]
+            print(f"{label:14s} {m['file_bytes'] / 1e6:9.2f} {m['rss_bytes'] / 1e6:9.2f} {m['first_load_seconds']:9.4f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--version', help='Registry version to compact (default: CURRENT, else legacy files)')
+    parser.add_argument('--registry-dir', help='Model registry directory (default: MODEL_REGISTRY_DIR or ../models)')
+    parser.add_argument('--legacy-dir', default='..', help='Directory holding the legacy root artifacts')
+    parser.add_argument('--prune-tolerance', type=float, default=0.0,
+                        help='Allowed RMSE shift per target as a fraction of its prediction std (0 disables pruning)')
+    parser.add_argument('--reference-csv', default='../powergrid_realistic_material_dataset1.csv',
+                        help='Rows used to check the pruning accuracy budget')
+    parser.add_argument('--activate', action='store_true', help='Point CURRENT at the compact version')
+    parser.add_argument('--no-measure', action='store_true', help='Skip the memory / load-time measurement')
+    args = parser.parse_args(argv)
+
+    registry = ModelRegistry(args.registry_dir, legacy_dir=args.legacy_dir, reference_csv=args.reference_csv)
+    version, report = compact_version(registry, args.version, args.prune_tolerance, args.reference_csv,
+                                      activate=args.activate, measure=not args.no_measure)
+    print_report(version, report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+# Training data loading and encoding shared by the training tools
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import LabelEncoder
+
+from feature_encoding import CATEGORICAL_FEATURES
+
+DEFAULT_DATA_FILES = ['../powergrid_realistic_material_dataset1.csv']
+
+# Feature order the API serves (feature_cols1.joblib)
+FEATURE_COLS = [
+    'budget', 'project_location', 'tower_type', 'substation_type', 'tax_rate',
+    'project_size_km', 'project_start_month', 'project_end_month', 'lead_time_days',
+    'commodity_price_index', 'region_risk_flag',
+]
+
+TEST_SIZE = 0.2
+RANDOM_STATE = 42
+
+
+def target_columns(df):
+    return [col for col in df.columns if col.startswith('quantity_')]
+
+
+def file_fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return {'path': os.path.abspath(path), 'sha256': digest.hexdigest(), 'bytes': os.path.getsize(path)}
+
+
+def load_training_frame(paths=None):
+    """Concatenate the powergrid CSVs, keeping only rows with every feature and target"""
+    paths = paths or DEFAULT_DATA_FILES
+    frames = [pd.read_csv(path) for path in paths]
+    df = pd.concat(frames, ignore_index=True)
+    targets = target_columns(df)
+    missing = [col for col in FEATURE_COLS if col not in df.columns]
+    if missing:
+        raise ValueError(f'Training data is missing feature columns: {missing}')
+    if not targets:
+        raise ValueError('No quantity_* target columns found in training data')
+    df = df.dropna(subset=FEATURE_COLS + targets).reset_index(drop=True)
+    return df, targets
+
+
+def fit_label_encoders(df):
+    """LabelEncoders fitted on the raw string categories (what the API receives)"""
+    encoders = {}
+    for col in CATEGORICAL_FEATURES:
+        encoder = LabelEncoder()
+        encoder.fit(df[col].astype(str))
+        encoders[col] = encoder
+    return encoders
+
+
+def encode_features(df, label_encoders):
+    """Float32 feature matrix in FEATURE_COLS order"""
+    X = df[FEATURE_COLS].copy()
+    for col, encoder in label_encoders.items():
+        X[col] = encoder.transform(X[col].astype(str))
+    return X.astype(np.float32)
+
+
+def split_dataset(X, Y, test_size=TEST_SIZE, random_state=RANDOM_STATE):
+    return train_test_split(X, Y, test_size=test_size, random_state=random_state)
@@ -0,0 +1,352 @@
+"""
+Incremental model refresh from recorded actual values.
+
+Forecast month entries keep the raw input row they were predicted from
+(`forecasts.features`); once actuals are recorded against them (via
+/api/projects/<id>/actual-values or /api/material-actuals) each entry becomes
+a labelled training pair. A refresh pulls only the pairs recorded since the
+active version's watermark, continues boosting every target's trees from the
+current model for a few small-step rounds, and publishes the result as a new
+registry version whose manifest carries the advanced watermark.
+
+A few dozen new rows can easily drag a target away from the rest of the data,
+so every updated target is scored before and after on held-out rows: a sample
+of the reference training CSV plus a slice of the new actuals kept out of the
+fit. A target whose error gets worse on either keeps its current estimator.
+Refreshed versions are published without being activated unless asked
+(MODEL_REFRESH_ACTIVATE or POST /api/model/refresh with "activate": true).
+
+Cost therefore scales with the new actuals, not with the full training history.
+"""
+
+import copy
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from backtest import encode_history
+from model_registry import publish_model_version
+
+MODEL_REFRESH_INTERVAL_SECONDS = float(os.getenv('MODEL_REFRESH_INTERVAL_SECONDS', '0'))
+MODEL_REFRESH_MIN_ROWS = int(os.getenv('MODEL_REFRESH_MIN_ROWS', '20'))
+MODEL_REFRESH_ROUNDS = int(os.getenv('MODEL_REFRESH_ROUNDS', '10'))
+MODEL_REFRESH_LEARNING_RATE = float(os.getenv('MODEL_REFRESH_LEARNING_RATE', '0.01'))
+MODEL_REFRESH_ACTIVATE = os.getenv('MODEL_REFRESH_ACTIVATE', 'false').lower() == 'true'
+MODEL_REFRESH_REFERENCE_ROWS = int(os.getenv('MODEL_REFRESH_REFERENCE_ROWS', '2000'))
+# Share of the new actuals kept out of the fit and used only to score it
+MODEL_REFRESH_HOLDOUT_SHARE = 0.25
+
+
+def parse_watermark(value):
+    """Manifest watermark (ISO string, naive UTC) -> datetime, or None"""
+    if not value:
+        return None
+    return datetime.fromisoformat(value)
+
+
+def naive_utc(value):
+    # pymongo hands back naive UTC datetimes; compare everything in that form
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def coerce_actuals(values, target_cols):
+    """Keep the numeric target values of an actuals dict (UI inputs arrive as strings)"""
+    actuals = {}
+    for col in target_cols:
+        try:
+            value = float(values.get(col))
+        except (TypeError, ValueError):
+            continue
+        if np.isfinite(value):
+            actuals[col] = value
+    return actuals
+
+
+def collect_actuals(project_forecasts, material_actuals, target_cols, since=None):
+    """Pull (features, actuals) pairs recorded after `since`.
+
+    Returns (samples, watermark) where samples is a list of
+    {'project_id', 'forecast_month', 'features', 'actuals'} and watermark is the
+    newest actuals timestamp seen (or `since` when nothing is new).
+    """
+    month_match = {'forecasts.features': {'$exists': True}, 'forecasts.actual_values_updated_at': {'$exists': True}}
+    if since is not None:
+        month_match['forecasts.actual_values_updated_at'] = {'$gt': since}
+    pipeline = [
+        {'$match': {'forecasts.features': {'$exists': True}}},
+        {'$unwind': '$forecasts'},
+        {'$match': month_match},
+        {'$project': {
+            '_id': 0,
+            'project_id': 1,
+            'forecast_month': '$forecasts.forecast_month',
+            'features': '$forecasts.features',
+            'actual_values': '$forecasts.actual_values',
+            'updated_at': '$forecasts.actual_values_updated_at',
+        }},
+    ]
+    pairs = {}
+    watermark = since
+    for entry in project_forecasts.aggregate(pipeline):
+        key = (entry['project_id'], entry['forecast_month'])
+        pairs[key] = {'features': entry['features'], 'actuals': entry.get('actual_values') or {}}
+        watermark = max(filter(None, [watermark, naive_utc(entry['updated_at'])]))
+
+    # Actuals saved through /api/material-actuals reference a (project_id, month)
+    # and need the features of the matching forecast entry
+    query = {'updated_at': {'$gt': since}} if since is not None else {}
+    pending = {}
+    for record in material_actuals.find(query, {'_id': 0, 'project_id': 1, 'month': 1, 'material_values': 1, 'updated_at': 1}):
+        if not record.get('project_id') or not record.get('material_values'):
+            continue
+        pending[(record['project_id'], record.get('month'))] = record
+    if pending:
+        project_ids = list({project_id for project_id, _ in pending})
+        cursor = project_forecasts.find({'project_id': {'$in': project_ids}},
+                                        {'_id': 0, 'project_id': 1, 'forecasts.forecast_month': 1, 'forecasts.features': 1})
+        for doc in cursor:
+            for entry in doc.get('forecasts', []):
+                key = (doc['project_id'], entry.get('forecast_month'))
+                record = pending.get(key)
+                if record is None or not entry.get('features'):
+                    continue
+                pair = pairs.setdefault(key, {'features': entry['features'], 'actuals': {}})
+                # Project-level actual values (edited in the UI) win over material actuals
+                pair['actuals'] = {**record['material_values'], **pair['actuals']}
+                if record.get('updated_at'):
+                    watermark = max(filter(None, [watermark, naive_utc(record['updated_at'])]))
+
+    samples = []
+    for (project_id, forecast_month), pair in pairs.items():
+        actuals = coerce_actuals(pair['actuals'], target_cols)
+        if actuals:
+            samples.append({'project_id': project_id, 'forecast_month': forecast_month,
+                            'features': pair['features'], 'actuals': actuals})
+    return samples, watermark
+
+
+def samples_to_frames(bundle, samples):
+    """Encode sample features with the bundle's tables; targets missing from a sample are NaN"""
+    X = pd.DataFrame(bundle.schema.encode([s['features'] for s in samples]), columns=bundle.feature_cols)
+    Y = pd.DataFrame([s['actuals'] for s in samples]).reindex(columns=bundle.target_cols)
+    return X, Y
+
+
+def reference_frames(bundle, csv_path, max_rows=None):
+    """(X, Y) sample of the reference training CSV, encoded with the bundle's tables"""
+    max_rows = max_rows if max_rows is not None else MODEL_REFRESH_REFERENCE_ROWS
+    if not csv_path or max_rows <= 0:
+        return None, None
+    history = pd.read_csv(csv_path)
+    if len(history) > max_rows:
+        history = history.sample(max_rows, random_state=42)
+    X, keep = encode_history(bundle.schema, history)
+    history = history[keep]
+    Y = pd.DataFrame({col: pd.to_numeric(history[col], errors='coerce').to_numpy() if col in history.columns
+                      else np.full(len(history), np.nan) for col in bundle.target_cols})
+    return pd.DataFrame(X, columns=bundle.feature_cols), Y
+
+
+def split_holdout(n_rows, share=MODEL_REFRESH_HOLDOUT_SHARE, seed=42):
+    """Boolean mask of the new rows kept out of the fit (none when there are too few to spare)"""
+    holdout = np.zeros(n_rows, dtype=bool)
+    n_holdout = int(n_rows * share)
+    if n_holdout >= 1 and n_rows - n_holdout >= 1:
+        holdout[np.random.default_rng(seed).choice(n_rows, n_holdout, replace=False)] = True
+    return holdout
+
+
+def _rmse(estimator, X, y):
+    if X is None or not len(y):
+        return None
+    return float(np.sqrt(np.mean((estimator.predict(X) - y) ** 2)))
+
+
+def continue_boosting(bundle, X, Y, rounds=None, learning_rate=None, X_ref=None, Y_ref=None):
+    """New MultiOutputRegressor whose estimators continue from the bundle's boosters.
+
+    Each target is fitted on its new rows outside the holdout, then scored
+    before/after on the holdout rows and on the reference rows (X_ref, Y_ref).
+    Targets without new actuals, or whose error rises on either set, keep their
+    current estimator. Returns (model, per-target report).
+    """
+    rounds = rounds or MODEL_REFRESH_ROUNDS
+    learning_rate = learning_rate or MODEL_REFRESH_LEARNING_RATE
+    holdout = split_holdout(len(X))
+    estimators = []
+    report = {}
+    for j, target in enumerate(bundle.target_cols):
+        current = bundle.model.estimators_[j]
+        mask = Y[target].notna().to_numpy()
+        fit_mask = mask & ~holdout
+        if not fit_mask.any():
+            estimators.append(current)
+            continue
+        X_new, y_new = X[fit_mask], Y[target][fit_mask].to_numpy()
+        params = current.get_params()
+        params.update(n_estimators=rounds, learning_rate=learning_rate)
+        start = time.perf_counter()
+        updated = xgb.XGBRegressor(**params)
+        updated.fit(X_new, y_new, xgb_model=current.get_booster())
+
+        scores = {'rows': int(fit_mask.sum()), 'fit_seconds': round(time.perf_counter() - start, 3)}
+        held_mask = mask & holdout
+        checks = {'holdout': (X[held_mask], Y[target][held_mask].to_numpy())}
+        if X_ref is not None and target in Y_ref:
+            ref_mask = Y_ref[target].notna().to_numpy()
+            checks['reference'] = (X_ref[ref_mask], Y_ref[target][ref_mask].to_numpy())
+        regressed = []
+        for name, (X_check, y_check) in checks.items():
+            before, after = _rmse(current, X_check, y_check), _rmse(updated, X_check, y_check)
+            scores[f'{name}_rows'] = int(len(y_check))
+            scores[f'{name}_rmse_before'], scores[f'{name}_rmse_after'] = before, after
+            if before is not None and after > before:
+                regressed.append(name)
+        scores['accepted'] = not regressed
+        if regressed:
+            scores['rejected_because'] = f"RMSE rose on {' and '.join(regressed)} rows"
+            estimators.append(current)
+        else:
+            scores['total_rounds'] = int(updated.get_booster().num_boosted_rounds())
+            estimators.append(updated)
+        report[target] = scores
+
+    model = copy.copy(bundle.model)
+    model.estimators_ = estimators
+    return model, report
+
+
+class ModelRefreshJob:
+    """Periodically (or on demand) refresh the active model from new actuals"""
+
+    def __init__(self, registry, project_forecasts, material_actuals,
+                 interval=None, min_rows=None, rounds=None, activate=None):
+        self.registry = registry
+        self.project_forecasts = project_forecasts
+        self.material_actuals = material_actuals
+        self.interval = interval if interval is not None else MODEL_REFRESH_INTERVAL_SECONDS
+        self.min_rows = min_rows if min_rows is not None else MODEL_REFRESH_MIN_ROWS
+        self.rounds = rounds if rounds is not None else MODEL_REFRESH_ROUNDS
+        self.activate = activate if activate is not None else MODEL_REFRESH_ACTIVATE
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+        self._stop = threading.Event()
+        self.last_run_at = None
+        self.last_result = None
+        self.last_error = None
+
+    def run_once(self, min_rows=None, activate=None):
+        """Refresh if enough new actuals exist; returns a result dict"""
+        if not self._lock.acquire(blocking=False):
+            return {'status': 'running'}
+        self._running = True
+        try:
+            result = self._refresh(self.min_rows if min_rows is None else min_rows,
+                                   self.activate if activate is None else activate)
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            result = {'status': 'failed', 'error': str(e)}
+            print(f"Model refresh failed: {e}")
+        finally:
+            self._running = False
+            self.last_run_at = datetime.now(timezone.utc)
+            self._lock.release()
+        self.last_result = result
+        return result
+
+    def _refresh(self, min_rows, activate):
+        bundle = self.registry.active
+        if bundle is None or not hasattr(bundle.model, 'estimators_'):
+            return {'status': 'skipped', 'reason': 'No active model'}
+        metadata = bundle.manifest.get('metadata', {})
+        since = parse_watermark(metadata.get('actuals_watermark'))
+
+        samples, watermark = collect_actuals(self.project_forecasts, self.material_actuals, bundle.target_cols, since)
+        if len(samples) < max(1, min_rows):
+            return {'status': 'skipped', 'reason': f'{len(samples)} new actuals (need {min_rows})',
+                    'base_version': bundle.version, 'new_rows': len(samples)}
+
+        start = time.perf_counter()
+        X, Y = samples_to_frames(bundle, samples)
+        try:
+            X_ref, Y_ref = reference_frames(bundle, self.registry.reference_csv)
+        except (OSError, ValueError) as e:
+            # Without reference rows the guard cannot tell a drift from an improvement
+            return {'status': 'skipped', 'reason': f'Reference rows unavailable: {e}', 'base_version': bundle.version}
+        model, report = continue_boosting(bundle, X, Y, self.rounds, X_ref=X_ref, Y_ref=Y_ref)
+        refresh_seconds = round(time.perf_counter() - start, 3)
+        accepted = [target for target, scores in report.items() if scores['accepted']]
+        if not accepted:
+            return {'status': 'rejected', 'reason': 'No target improved without regressing on held-out rows',
+                    'base_version': bundle.version, 'new_rows': len(samples), 'targets': report}
+
+        version = publish_model_version(
+            self.registry.registry_dir, model, bundle.feature_cols, bundle.target_cols, bundle.label_encoders,
+            metadata={
+                'trainer': 'training.refresh',
+                'parent_version': bundle.version,
+                'actuals_since': since.isoformat() if since else None,
+                'actuals_watermark': watermark.isoformat() if watermark else None,
+                'new_rows': len(samples),
+                'rounds': self.rounds,
+                'learning_rate': MODEL_REFRESH_LEARNING_RATE,
+                'refresh_seconds': refresh_seconds,
+                'targets': report,
+                # Carry the original training provenance forward
+                'params': metadata.get('params'),
+                'data': metadata.get('data'),
+            },
+            activate=activate,
+        )
+        print(f"Model refresh: {bundle.version} -> {version} from {len(samples)} new actuals in {refresh_seconds}s "
+              f"({len(accepted)}/{len(report)} targets updated, {'activated' if activate else 'not activated'})")
+        if activate:
+            # Serve it here right away; other workers pick it up through the registry watcher
+            self.registry.refresh()
+        return {'status': 'published', 'version': version, 'base_version': bundle.version, 'activated': activate,
+                'new_rows': len(samples), 'refresh_seconds': refresh_seconds, 'targets': report}
+
+    def trigger(self, min_rows=None, activate=None):
+        """Run a refresh in a background thread; False if one is already running"""
+        if self._running:
+            return False
+        threading.Thread(target=self.run_once, args=(min_rows, activate), name='model-refresh', daemon=True).start()
+        return True
+
+    def start(self):
+        """Refresh every `interval` seconds (MODEL_REFRESH_INTERVAL_SECONDS, 0 disables)"""
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(self.interval):
+                self.run_once()
+
+        self._thread = threading.Thread(target=loop, name='model-refresh-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        return {
+            'running': self._running,
+            'interval_seconds': self.interval,
+            'min_rows': self.min_rows,
+            'rounds': self.rounds,
+            'learning_rate': MODEL_REFRESH_LEARNING_RATE,
+            'activate': self.activate,
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
+            'last_result': self.last_result,
+            'last_error': self.last_error,
+        }
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Hyperparameter search for the multi-target material demand model.
+
+Evaluates candidate XGBoost configurations in parallel worker processes under a
+wall-clock budget. The first candidate is always the hand-picked DEFAULT_PARAMS
+from model.ipynb; the rest are sampled from SEARCH_SPACE. Every fit uses early
+stopping on a validation slice carved out of the training split, so
+n_estimators is only an upper bound, and a deadline callback stops any fit still
+running when the budget runs out.
+
+Each trial records per-target RMSE/MAE/R² on the same held-out split
+training.train reports, fit time, tree count and the serving engine's
+single-row and batch latency, so accuracy can be traded against inference cost
+explicitly (the Pareto front of mean R² vs. single-row latency is marked).
+Latency is measured in the parent process, one trial after another once every
+fit has finished, so it is not skewed by the other workers' fits. A trial whose
+worker raises is recorded as failed.
+
+    cd backend && python -m training.search [--trials 24] [--budget-seconds 600] [--workers N]
+                                            [--max-latency-us 3000] [--publish [--activate]]
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+
+import numpy as np
+import xgboost as xgb
+
+from inference import build_inference_engine
+from training.dataset import (
+    DEFAULT_DATA_FILES, FEATURE_COLS, RANDOM_STATE, encode_features, file_fingerprint,
+    fit_label_encoders, load_training_frame, split_dataset,
+)
+from training.train import DEFAULT_PARAMS, assemble_model, regression_metrics, train
+
+# (kind, low, high); 'log' samples uniformly in log space
+SEARCH_SPACE = {
+    'max_depth': ('int', 3, 10),
+    'learning_rate': ('log', 0.02, 0.3),
+    'subsample': ('float', 0.6, 1.0),
+    'colsample_bytree': ('float', 0.5, 1.0),
+    'min_child_weight': ('log', 1.0, 20.0),
+    'reg_lambda': ('log', 0.1, 10.0),
+}
+DEFAULT_TRIALS = 24
+DEFAULT_BUDGET_SECONDS = 600
+DEFAULT_MAX_ESTIMATORS = 1000
+DEFAULT_EARLY_STOPPING_ROUNDS = 30
+# Share of the training split held back for early stopping
+VALIDATION_SIZE = 0.15
+LATENCY_REPEATS = 200
+
+
+def sample_params(rng, space=SEARCH_SPACE, max_estimators=DEFAULT_MAX_ESTIMATORS):
+    params = {'n_estimators': max_estimators, 'random_state': RANDOM_STATE}
+    for name, (kind, low, high) in space.items():
+        if kind == 'int':
+            params[name] = int(rng.integers(low, high + 1))
+        elif kind == 'log':
+            params[name] = round(float(math.exp(rng.uniform(math.log(low), math.log(high)))), 5)
+        else:
+            params[name] = round(float(rng.uniform(low, high)), 4)
+    return params
+
+
+def candidate_params(n_trials, seed=RANDOM_STATE, max_estimators=DEFAULT_MAX_ESTIMATORS):
+    """The model.ipynb settings first (capped at max_estimators), then n_trials - 1 sampled configurations"""
+    rng = np.random.default_rng(seed)
+    baseline = dict(DEFAULT_PARAMS, n_estimators=min(DEFAULT_PARAMS['n_estimators'], max_estimators))
+    return [baseline] + [sample_params(rng, max_estimators=max_estimators) for _ in range(n_trials - 1)]
+
+
+class DeadlineCallback(xgb.callback.TrainingCallback):
+    """Stops boosting once the search's wall-clock deadline has passed"""
+
+    def __init__(self, deadline):
+        super().__init__()
+        self.deadline = deadline
+        self.fired = False
+
+    def after_iteration(self, model, epoch, evals_log):
+        self.fired = time.time() >= self.deadline
+        return self.fired
+
+
+# Split data, set once per worker process by _init_worker
+_data = {}
+
+
+def _init_worker(data):
+    _data.update(data)
+
+
+def measure_latency(engine, X, repeats=LATENCY_REPEATS):
+    """Median single-row predict time and per-row time of one batch predict, in microseconds"""
+    row = X[:1]
+    engine.predict(row)
+    single = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        engine.predict(row)
+        single.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    engine.predict(X)
+    batch = time.perf_counter() - start
+    return {
+        'single_row_us': round(float(np.median(single)) * 1e6, 1),
+        'batch_row_us': round(batch / len(X) * 1e6, 3),
+        'batch_rows': int(len(X)),
+        'engine': engine.name,
+    }
+
+
+def run_trial(trial_id, params, deadline, early_stopping_rounds):
+    """Fit and score one configuration (runs inside a worker process); returns (record, model)"""
+    record = {'trial': trial_id, 'params': params, 'status': 'ok', 'started_at': datetime.now(timezone.utc).isoformat()}
+    targets = _data['targets']
+    wall_start = time.perf_counter()
+    regressors, fit_seconds, best_iterations = [], {}, {}
+    for j, target in enumerate(targets):
+        deadline_callback = DeadlineCallback(deadline)
+        regressor = xgb.XGBRegressor(**params, n_jobs=_data['threads'], early_stopping_rounds=early_stopping_rounds,
+                                     callbacks=[deadline_callback])
+        start = time.perf_counter()
+        regressor.fit(_data['X_fit'], _data['Y_fit'][:, j], eval_set=[(_data['X_val'], _data['Y_val'][:, j])],
+                      verbose=False)
+        fit_seconds[target] = round(time.perf_counter() - start, 3)
+        if deadline_callback.fired:
+            record.update(status='budget_exceeded', fit_seconds=fit_seconds,
+                          fit_wall_seconds=round(time.perf_counter() - wall_start, 3))
+            return record, None
+        best_iterations[target] = int(regressor.best_iteration) + 1
+        regressors.append(regressor)
+    record['fit_seconds'] = fit_seconds
+    record['fit_wall_seconds'] = round(time.perf_counter() - wall_start, 3)
+    record['best_iterations'] = best_iterations
+    record['trees'] = int(sum(best_iterations.values()))
+
+    model = assemble_model(regressors, params, _data['X_fit_frame'])
+    Y_test = _data['Y_test']
+    Y_pred = model.predict(_data['X_test'])
+    record['metrics'] = {target: regression_metrics(Y_test[:, j], Y_pred[:, j]) for j, target in enumerate(targets)}
+    record['mean_r2'] = round(float(np.mean([m['r2'] for m in record['metrics'].values()])), 6)
+    # What to train with for publishing: the boosting rounds early stopping actually used
+    record['suggested_params'] = {**params, 'n_estimators': max(best_iterations.values())}
+    return record, model
+
+
+def failed_trial(trial_id, params, error):
+    return {'trial': trial_id, 'params': params, 'status': 'failed', 'error': f'{type(error).__name__}: {error}'}
+
+
+def pareto_front(trials):
+    """Trial ids not beaten on both mean R² and single-row latency by another trial"""
+    scored = [t for t in trials if t['status'] == 'ok']
+    front = []
+    for t in scored:
+        dominated = any(
+            o['mean_r2'] >= t['mean_r2'] and o['latency']['single_row_us'] <= t['latency']['single_row_us']
+            and (o['mean_r2'] > t['mean_r2'] or o['latency']['single_row_us'] < t['latency']['single_row_us'])
+            for o in scored
+        )
+        if not dominated:
+            front.append(t['trial'])
+    return sorted(front)
+
+
+def select_best(trials, max_latency_us=None):
+    """Highest mean R², optionally among trials within the single-row latency limit"""
+    eligible = [t for t in trials if t['status'] == 'ok'
+                and (max_latency_us is None or t['latency']['single_row_us'] <= max_latency_us)]
+    return max(eligible, key=lambda t: t['mean_r2'], default=None)
+
+
+def search(data_paths=None, n_trials=DEFAULT_TRIALS, budget_seconds=DEFAULT_BUDGET_SECONDS, workers=None,
+           early_stopping_rounds=DEFAULT_EARLY_STOPPING_ROUNDS, max_estimators=DEFAULT_MAX_ESTIMATORS,
+           seed=RANDOM_STATE, log_path=None, max_latency_us=None):
+    """Run the search; returns the report (every finished trial, best trial, Pareto front)"""
+    wall_start = time.time()
+    deadline = wall_start + budget_seconds
+
+    df, targets = load_training_frame(data_paths)
+    label_encoders = fit_label_encoders(df)
+    X = encode_features(df, label_encoders)
+    Y = df[targets]
+    X_train, X_test, Y_train, Y_test = split_dataset(X, Y)
+    X_fit, X_val, Y_fit, Y_val = split_dataset(X_train, Y_train, test_size=VALIDATION_SIZE)
+
+    candidates = candidate_params(n_trials, seed, max_estimators)
+    workers = workers or min(len(candidates), os.cpu_count() or 1)
+    data = {
+        'targets': targets,
+        'threads': max(1, (os.cpu_count() or 1) // workers),
+        'X_fit': X_fit.to_numpy(), 'Y_fit': Y_fit.to_numpy(dtype=np.float64),
+        'X_val': X_val.to_numpy(), 'Y_val': Y_val.to_numpy(dtype=np.float64),
+        'X_test': X_test.to_numpy(), 'Y_test': Y_test.to_numpy(dtype=np.float64),
+        # Only the column names are needed to assemble the served model
+        'X_fit_frame': X_fit.iloc[:0],
+    }
+    print(f"Searching {len(candidates)} configurations for {len(targets)} targets on {len(X_fit)} rows "
+          f"({len(X_val)} validation, {len(X_test)} test) with {workers} worker(s), budget {budget_seconds}s")
+
+    trials, models = [], {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data,)) as pool:
+        queue = list(enumerate(candidates))
+        running = {}
+        while queue or running:
+            # Keep every worker busy while there is budget left to start another trial
+            while queue and len(running) < workers and time.time() < deadline:
+                trial_id, params = queue.pop(0)
+                running[pool.submit(run_trial, trial_id, params, deadline, early_stopping_rounds)] = (trial_id, params)
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                trial_id, params = running.pop(future)
+                try:
+                    record, model = future.result()
+                except Exception as e:
+                    record, model = failed_trial(trial_id, params, e), None
+                trials.append(record)
+                if model is not None:
+                    models[trial_id] = model
+                summary = f"mean R2 {record['mean_r2']:.4f}" if record['status'] == 'ok' else record['status']
+                fit = f", fit {record['fit_wall_seconds']}s" if 'fit_wall_seconds' in record else ''
+                print(f"  trial {record['trial']:3d}: {summary}{fit}")
+
+    # Timed here, serially and after the pool has shut down, so no trial is measured
+    # while other workers are still fitting
+    trials.sort(key=lambda t: t['trial'])
+    X_test = data['X_test']
+    for record in trials:
+        model = models.pop(record['trial'], None)
+        if model is None:
+            continue
+        try:
+            record['latency'] = measure_latency(build_inference_engine(model, FEATURE_COLS), X_test)
+        except Exception as e:
+            failed = failed_trial(record['trial'], record['params'], e)
+            record.clear()
+            record.update(failed)
+            continue
+        print(f"  trial {record['trial']:3d}: {record['latency']['single_row_us']}us/row")
+    if log_path:
+        with open(log_path, 'a') as log:
+            for record in trials:
+                log.write(json.dumps(record) + '\n')
+
+    best = select_best(trials, max_latency_us)
+    return {
+        'searcher': 'training.search',
+        'data': [file_fingerprint(path) for path in (data_paths or DEFAULT_DATA_FILES)],
+        'settings': {
+            'trials_requested': len(candidates), 'budget_seconds': budget_seconds, 'workers': workers,
+            'early_stopping_rounds': early_stopping_rounds, 'max_estimators': max_estimators, 'seed': seed,
+            'max_latency_us': max_latency_us, 'search_space': SEARCH_SPACE,
+        },
+        'n_fit': int(len(X_fit)), 'n_validation': int(len(X_val)), 'n_test': int(len(X_test)),
+        'wall_seconds': round(time.time() - wall_start, 3),
+        'trials_not_started': len(candidates) - len(trials),
+        'trials': trials,
+        'pareto_front': pareto_front(trials),
+        'best_trial': best['trial'] if best else None,
+        'baseline_trial': 0,
+    }
+
+
+def print_report(report):
+    front = set(report['pareto_front'])
+    print(f"\n{'trial':>5s} {'status':>15s} {'mean R2':>8s} {'trees':>6s} {'fit s':>7s} {'1-row us':>9s} "
+          f"{'batch us/row':>12s}  params")
+    for t in report['trials']:
+        if t['status'] != 'ok':
+            print(f"{t['trial']:5d} {t['status']:>15s}")
+            continue
+        marker = '*' if t['trial'] in front else ' '
+        params = ', '.join(f"{k}={t['params'][k]}" for k in ('max_depth', 'learning_rate', 'subsample', 'colsample_bytree')
+                           if k in t['params'])
+        print(f"{t['trial']:5d}{marker}{'ok':>15s} {t['mean_r2']:8.4f} {t['trees']:6d} {t['fit_wall_seconds']:7.2f} "
+              f"{t['latency']['single_row_us']:9.1f} {t['latency']['batch_row_us']:12.3f}  {params}")
+    print(f"\n* Pareto front (mean R2 vs. single-row latency); {report['trials_not_started']} trial(s) not started "
+          f"within the budget; {report['wall_seconds']}s wall-clock")
+    if report['best_trial'] is not None:
+        print(f"Best trial: {report['best_trial']} (baseline is trial {report['baseline_trial']})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', nargs='+', help='Training CSV file(s) (default: powergrid_realistic_material_dataset1.csv)')
+    parser.add_argument('--trials', type=int, default=DEFAULT_TRIALS, help='Configurations to evaluate, baseline included')
+    parser.add_argument('--budget-seconds', type=float, default=DEFAULT_BUDGET_SECONDS,
+                        help='Wall-clock budget; no trial starts after it and running fits stop at it')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per trial, capped at CPU count)')
+    parser.add_argument('--early-stopping-rounds', type=int, default=DEFAULT_EARLY_STOPPING_ROUNDS)
+    parser.add_argument('--max-estimators', type=int, default=DEFAULT_MAX_ESTIMATORS,
+                        help='Upper bound on boosting rounds for sampled configurations')
+    parser.add_argument('--seed', type=int, default=RANDOM_STATE, help='Seed for sampling configurations')
+    parser.add_argument('--max-latency-us', type=float,
+                        help='Pick the best trial among those predicting one row within this many microseconds')
+    parser.add_argument('--log', help='Append every trial as a JSON line to this file once the search ends')
+    parser.add_argument('--report', help='Write the full search report as JSON to this path')
+    parser.add_argument('--publish', action='store_true',
+                        help="Retrain the best trial's configuration with training.train and publish it")
+    parser.add_argument('--activate', action='store_true', help='With --publish, point CURRENT at the new version')
+    parser.add_argument('--registry-dir', help='Model registry directory (default: MODEL_REGISTRY_DIR or ../models)')
+    args = parser.parse_args(argv)
+    if args.trials < 1:
+        parser.error('--trials must be at least 1')
+
+    report = search(args.data, args.trials, args.budget_seconds, args.workers, args.early_stopping_rounds,
+                    args.max_estimators, args.seed, args.log, args.max_latency_us)
+    print_report(report)
+    if args.publish:
+        best = next((t for t in report['trials'] if t['trial'] == report['best_trial']), None)
+        if best is None:
+            print('No trial finished within the budget (and latency limit); nothing published')
+            return 1
+        version, _ = train(args.data, best['suggested_params'], registry_dir=args.registry_dir,
+                           activate=args.activate)
+        report['published_version'] = version
+        print(f"Published model version {version} from trial {best['trial']}")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
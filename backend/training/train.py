@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Train the multi-target material demand model and publish it to the model registry.
+
+Replaces the hand-run model.ipynb: reads the powergrid CSVs, fits one XGBoost
+regressor per quantity_* target in parallel worker processes, evaluates each on
+a held-out split and writes the artifact set load_models() expects (model,
+feature_cols, target_cols, label_encoders + manifest) as a new registry version.
+
+    cd backend && python -m training.train [--data CSV ...] [--workers N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import xgboost as xgb
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.multioutput import MultiOutputRegressor
+
+from compact_model import compact_model
+from model_registry import LEGACY_FILES, publish_model_version
+from training.dataset import (
+    FEATURE_COLS, RANDOM_STATE, encode_features, file_fingerprint, fit_label_encoders,
+    load_training_frame, split_dataset,
+)
+
+# Settings from model.ipynb
+DEFAULT_PARAMS = {
+    'n_estimators': 400,
+    'learning_rate': 0.08,
+    'max_depth': 7,
+    'subsample': 0.9,
+    'colsample_bytree': 0.8,
+    'random_state': RANDOM_STATE,
+}
+
+
+def fit_target(target, X_train, y_train, params, n_jobs=1):
+    """Fit one target's regressor (runs inside a worker process); an n_jobs in params wins"""
+    start = time.perf_counter()
+    regressor = xgb.XGBRegressor(**{'n_jobs': n_jobs, **params})
+    regressor.fit(X_train, y_train)
+    return target, regressor, time.perf_counter() - start
+
+
+def regression_metrics(y_true, y_pred):
+    return {
+        'rmse': float(np.sqrt(mean_squared_error(y_true, y_pred))),
+        'mae': float(mean_absolute_error(y_true, y_pred)),
+        'r2': float(r2_score(y_true, y_pred)),
+    }
+
+
+def assemble_model(regressors, params, X_train):
+    """Wrap per-target regressors in the MultiOutputRegressor the API loads"""
+    model = MultiOutputRegressor(xgb.XGBRegressor(**params))
+    model.estimators_ = regressors
+    model.n_features_in_ = X_train.shape[1]
+    model.feature_names_in_ = np.asarray(X_train.columns, dtype=object)
+    return model
+
+
+def fit_all_targets(X_train, Y_train, targets, params, workers):
+    """Fit every target across a process pool; returns (regressors, fit_seconds)"""
+    threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+    fitted, fit_seconds = {}, {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(fit_target, target, X_train, Y_train[target].to_numpy(), params, threads_per_worker)
+            for target in targets
+        ]
+        for future in futures:
+            target, regressor, seconds = future.result()
+            fitted[target] = regressor
+            fit_seconds[target] = round(seconds, 3)
+            print(f"  fitted {target} in {seconds:.2f}s")
+    return [fitted[target] for target in targets], fit_seconds
+
+
+def train(data_paths=None, params=None, workers=None, registry_dir=None, activate=True, legacy_dir=None,
+          compact=False, prune_tolerance=0.0):
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    wall_start = time.perf_counter()
+
+    df, targets = load_training_frame(data_paths)
+    label_encoders = fit_label_encoders(df)
+    X = encode_features(df, label_encoders)
+    Y = df[targets]
+    X_train, X_test, Y_train, Y_test = split_dataset(X, Y)
+    load_seconds = time.perf_counter() - wall_start
+
+    workers = workers or min(len(targets), os.cpu_count() or 1)
+    print(f"Training {len(targets)} targets on {len(X_train)} rows with {workers} worker process(es)")
+    fit_start = time.perf_counter()
+    regressors, fit_seconds = fit_all_targets(X_train, Y_train, targets, params, workers)
+    fit_wall = time.perf_counter() - fit_start
+
+    model = assemble_model(regressors, params, X_train)
+    compaction = None
+    if compact:
+        # Publish native boosters; pruning is checked against the held-out rows
+        model, compaction = compact_model(model, X_test.to_numpy(), prune_tolerance)
+    Y_pred = model.predict(X_test)
+    metrics = {target: regression_metrics(Y_test[target], Y_pred[:, i]) for i, target in enumerate(targets)}
+
+    timings = {
+        'load_seconds': round(load_seconds, 3),
+        'fit_wall_seconds': round(fit_wall, 3),
+        'fit_cpu_seconds': round(sum(fit_seconds.values()), 3),
+        'per_target_fit_seconds': fit_seconds,
+        'workers': workers,
+    }
+    metadata = {
+        'trainer': 'training.train',
+        'params': params,
+        'data': [file_fingerprint(path) for path in (data_paths or ['../powergrid_realistic_material_dataset1.csv'])],
+        'n_train': int(len(X_train)),
+        'n_test': int(len(X_test)),
+        'metrics': metrics,
+        'timings': timings,
+    }
+    if compaction:
+        metadata['compaction'] = compaction
+
+    registry_dir = registry_dir or os.getenv('MODEL_REGISTRY_DIR', '../models')
+    version = publish_model_version(registry_dir, model, FEATURE_COLS, targets, label_encoders,
+                                    metadata=metadata, activate=activate)
+    timings['total_wall_seconds'] = round(time.perf_counter() - wall_start, 3)
+
+    if legacy_dir and not compact:
+        # Keep the root-level artifacts in step with the registry for older deployments
+        artifacts = {'model': model, 'feature_cols': FEATURE_COLS, 'target_cols': targets, 'label_encoders': label_encoders}
+        for key, filename in LEGACY_FILES.items():
+            joblib.dump(artifacts[key], os.path.join(legacy_dir, filename))
+
+    return version, metadata
+
+
+def print_report(version, metadata):
+    print(f"\nPublished model version {version}")
+    print(f"{'target':36s} {'RMSE':>10s} {'MAE':>10s} {'R2':>7s} {'fit s':>7s}")
+    fit_seconds = metadata['timings']['per_target_fit_seconds']
+    for target, m in metadata['metrics'].items():
+        print(f"{target:36s} {m['rmse']:10.3f} {m['mae']:10.3f} {m['r2']:7.3f} {fit_seconds[target]:7.2f}")
+    t = metadata['timings']
+    speedup = t['fit_cpu_seconds'] / t['fit_wall_seconds'] if t['fit_wall_seconds'] else 0.0
+    print(f"\nFit wall-clock {t['fit_wall_seconds']}s for {t['fit_cpu_seconds']}s of per-target fitting "
+          f"({speedup:.1f}x with {t['workers']} workers); total {t.get('total_wall_seconds')}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', nargs='+', help='Training CSV file(s) (default: powergrid_realistic_material_dataset1.csv)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per target, capped at CPU count)')
+    parser.add_argument('--registry-dir', help='Model registry directory (default: MODEL_REGISTRY_DIR or ../models)')
+    parser.add_argument('--no-activate', action='store_true', help='Publish without pointing CURRENT at the new version')
+    parser.add_argument('--legacy-dir', help='Also write multi_xgb_model.joblib etc. into this directory')
+    parser.add_argument('--param', action='append', default=[], metavar='KEY=VALUE',
+                        help='Override an XGBoost parameter, e.g. --param n_estimators=200 --param tree_method=hist '
+                             '(values are parsed as JSON, else kept as strings)')
+    parser.add_argument('--compact', action='store_true',
+                        help='Publish native XGBoost boosters (model_compact.json) instead of model.joblib')
+    parser.add_argument('--prune-tolerance', type=float, default=0.0,
+                        help='With --compact, drop low-gain trees within this relative prediction-shift budget')
+    parser.add_argument('--report', help='Write the metrics/timings metadata as JSON to this path')
+    args = parser.parse_args(argv)
+
+    params = {}
+    for item in args.param:
+        key, _, value = item.partition('=')
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            # Bare strings such as tree_method=hist
+            params[key] = value
+
+    version, metadata = train(args.data, params, args.workers, args.registry_dir,
+                              activate=not args.no_activate, legacy_dir=args.legacy_dir,
+                              compact=args.compact, prune_tolerance=args.prune_tolerance)
+    print_report(version, metadata)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'version': version, **metadata}, f, indent=2, default=str)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())